@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the time taken to decode XML-RPC responses with each decoder.
+
+Each response is decoded with ``xmlrpclib`` and with the fast decoder of
+``bzlib.unmarshal``, and the best time of several runs is reported.
+Responses are read from the given files (e.g. recorded with
+``tcpdump`` or a logging proxy; the body only), or else synthesized: a
+``Bug.search`` response and a ``Bug.comments`` response.
+
+Usage: python bench/decode.py [RESPONSE_FILE...]
+"""
+
+import datetime
+import os
+import sys
+import timeit
+import xmlrpclib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bzlib import unmarshal
+
+import memory
+
+
+def synthetic_comments(n):
+    """Return a ``Bug.comments`` result, of n bugs of 20 comments."""
+    time = datetime.datetime(2013, 1, 1)
+    return {'bugs': {
+        str(x): {'comments': [
+            {
+                'id': x * 100 + i,
+                'bug_id': x,
+                'count': i,
+                'creator': 'user{}@example.com'.format(i),
+                'time': time,
+                'creation_time': time,
+                'is_private': False,
+                'attachment_id': None,
+                'text': 'Comment {} on bug {}.\n\n'.format(i, x) * 5,
+            }
+            for i in range(20)
+        ]}
+        for x in range(1, n + 1)
+    }}
+
+
+def responses(paths):
+    if paths:
+        for path in paths:
+            with open(path) as fh:
+                yield os.path.basename(path), fh.read()
+        return
+    dumps = lambda x: xmlrpclib.dumps((x,), methodresponse=True,
+                                      allow_none=True)
+    yield 'Bug.search', dumps({'bugs': memory.synthetic_bugs(10000)})
+    yield 'Bug.comments', dumps(synthetic_comments(1000))
+
+
+def decode(response, decoder):
+    parser, unmarshaller = unmarshal.getparser(decoder, use_datetime=True)
+    parser.feed(response)
+    parser.close()
+    return unmarshaller.close()
+
+
+def main(paths):
+    for name, response in responses(paths):
+        assert decode(response, 'fast') == decode(response, 'xmlrpclib')
+        print '{} ({:.1f} MiB)'.format(name, len(response) / 2.0 ** 20)
+        baseline = None
+        for decoder in 'xmlrpclib', 'fast':
+            seconds = min(timeit.repeat(
+                lambda: decode(response, decoder), number=1, repeat=3))
+            baseline = baseline or seconds
+            print '  {:10} {:6.3f} s  {:4.0%}'.format(
+                decoder + ':', seconds, seconds / baseline)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the memory held by search results in each representation.
+
+Synthetic bug data is encoded as a ``Bug.search`` XML-RPC response and
+decoded, as the search results would be.  The size of the results is
+then measured as bugs without ``__slots__`` or shared strings (as
+before), as ``bzlib.bug.Bug`` objects and as rows.
+
+Usage: python bench/memory.py [NUMBER_OF_BUGS]
+"""
+
+import datetime
+import gc
+import os
+import random
+import sys
+import xmlrpclib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bzlib import bug
+
+FIELDS = [
+    'assigned_to', 'component', 'creation_time', 'creator', 'id',
+    'last_change_time', 'op_sys', 'platform', 'priority', 'product',
+    'resolution', 'severity', 'status', 'summary', 'version',
+]
+
+
+def synthetic_bugs(n):
+    """Return n bugs of random data, like the result of ``Bug.search``."""
+    random.seed(0)
+    choice = lambda *xs: random.choice(xs)
+    time = datetime.datetime(2013, 1, 1)
+    users = ['user{}@example.com'.format(x) for x in range(200)]
+    return [
+        {
+            'assigned_to': random.choice(users),
+            'component': 'component{}'.format(random.randrange(50)),
+            'creation_time': time,
+            'creator': random.choice(users),
+            'id': x,
+            'last_change_time': time,
+            'op_sys': choice('Linux', 'Windows', 'Mac OS'),
+            'platform': choice('All', 'PC', 'Other'),
+            'priority': choice('P1', 'P2', 'P3', 'P4', 'P5'),
+            'product': 'product{}'.format(random.randrange(5)),
+            'resolution': choice('', 'FIXED', 'INVALID', 'WONTFIX'),
+            'severity': choice('normal', 'major', 'minor', 'critical'),
+            'status': choice('NEW', 'ASSIGNED', 'RESOLVED', 'VERIFIED'),
+            'summary': 'bug number {}'.format(x),
+            'version': 'unspecified',
+        }
+        for x in range(1, n + 1)
+    ]
+
+
+def decode(bugs):
+    """Encode and decode bugs as in a ``Bug.search`` response."""
+    response = xmlrpclib.dumps(({'bugs': bugs},), methodresponse=True)
+    return xmlrpclib.loads(response, use_datetime=True)[0][0]['bugs']
+
+
+def size(obj, seen=None):
+    """Return the bytes held by an object and the objects it refers to.
+
+    Objects referred to more than once are counted once.
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        elif hasattr(type(obj), '__slots__'):
+            stack.extend(
+                getattr(obj, x) for x in type(obj).__slots__
+                if hasattr(obj, x)
+            )
+    return total
+
+
+class PlainBug(object):
+    """A bug as represented before ``__slots__`` and shared strings."""
+    def __init__(self, bz, data):
+        self.bz = bz
+        self.bugno = data['id']
+        self._include_fields = None
+        self._exclude_fields = None
+        self._data = data
+        self._comments = None
+        self._history = None
+
+
+def main(n):
+    bugs = synthetic_bugs(n)
+    results = [
+        ('plain', lambda: [PlainBug(None, x) for x in decode(bugs)]),
+        ('Bug', lambda: [bug.Bug(None, x) for x in decode(bugs)]),
+        ('row', lambda: map(
+            lambda x: bug.make_row(bug.row_type(FIELDS), x),
+            decode(bugs)
+        )),
+    ]
+    print '{} bugs'.format(n)
+    baseline = None
+    for name, make in results:
+        gc.collect()
+        nbytes = size(make())
+        baseline = baseline or nbytes
+        print '  {:6} {:8.1f} MiB  {:4.0%}'.format(
+            name + ':', nbytes / 2.0 ** 20, float(nbytes) / baseline)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
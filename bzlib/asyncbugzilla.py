@@ -0,0 +1,124 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Non-blocking use of a Bugzilla server.
+
+The methods of ``AsyncBugzilla`` return at once with a
+``parallel.Future`` of their result, and the RPCs are made by a pool of
+threads, over the connection pool of the transport; many requests may
+be in flight at once.  Requests are built and results parsed by the
+``bugzilla.Bugzilla`` that an ``AsyncBugzilla`` wraps, so results are
+the same as those of the blocking methods.
+"""
+
+from . import bug
+from . import bugzilla
+from . import parallel
+
+
+# maximum number of requests in flight at once
+DEFAULT_ASYNC_JOBS = 8
+
+
+class AsyncBugzilla(object):
+    """A Bugzilla server, whose methods return Futures.
+
+    bz: the ``bugzilla.Bugzilla`` that makes the RPCs
+    jobs: the maximum number of requests in flight at once; by default
+          the ``async_jobs`` config of the Bugzilla
+
+    The transport keeps up to its ``pool_size`` idle connections; set it
+    to ``jobs`` to reuse a connection for every request in flight.
+    """
+
+    __slots__ = ['bz', '_executor']
+
+    @classmethod
+    def from_config(cls, conf, jobs=None, **kwargs):
+        """Instantiate an AsyncBugzilla; see ``Bugzilla.from_config``."""
+        return cls(bugzilla.Bugzilla.from_config(conf, **kwargs), jobs)
+
+    def __init__(self, bz, jobs=None):
+        self.bz = bz
+        if jobs is None:
+            jobs = int(bz.config.get('async_jobs', DEFAULT_ASYNC_JOBS))
+        self._executor = parallel.Executor(jobs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Wait for the requests in flight, then close the connections."""
+        self._executor.shutdown()
+        self.bz.transport.close()
+
+    def _submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def rpc(self, *args, **kwargs):
+        """Do an RPC; return a Future of its result (see ``rpc``)."""
+        return self._submit(self.bz.rpc, *args, **kwargs)
+
+    def bugs(self, bugnos, **kwargs):
+        """Return a Future of a list of Bugs (see ``Bugzilla.bugs``)."""
+        return self._submit(self.bz.bugs, bugnos, **kwargs)
+
+    def comments(self, bugnos, **kwargs):
+        """Return a Future of the comments of bugs."""
+        return self._submit(self.bz.comments, bugnos, **kwargs)
+
+    def history(self, bugnos):
+        """Return a Future of the history of bugs."""
+        return self._submit(self.bz.history, bugnos)
+
+    def update_bugs(self, bugnos, **changes):
+        """Return a Future of the result of ``Bugzilla.update_bugs``."""
+        return self._submit(self.bz.update_bugs, bugnos, **changes)
+
+    def get_products(self, use_cache=True):
+        """Return a Future of the accessible products."""
+        return self._submit(self.bz.get_products, use_cache)
+
+    def get_fields(self, use_cache=True):
+        """Return a Future of information about bug fields."""
+        return self._submit(self.bz.get_fields, use_cache)
+
+    def get_field_index(self, use_cache=True):
+        """Return a Future of a ``metadata.FieldIndex``."""
+        return self._submit(self.bz.get_field_index, use_cache)
+
+    def match_users(self, fragment, use_cache=True):
+        """Return a Future of a list of users matching a string."""
+        return self._submit(self.bz.match_users, fragment, use_cache)
+
+    def match_many_users(self, fragments, use_cache=True):
+        """Return a Future of the users matching each of many strings."""
+        return self._submit(self.bz.match_many_users, fragments, use_cache)
+
+    def search(self, page_size=bugzilla.DEFAULT_SEARCH_PAGE_SIZE, **kwargs):
+        """Generate the bugs matching search criteria.
+
+        Criteria are given as for ``Bug.search``.  Results are retrieved
+        a page at a time by another thread, which requests the next page
+        while the bugs of the current one are consumed.
+        """
+        return parallel.prefetch(
+            bug.Bug.search(self.bz, page_size=page_size, **kwargs),
+            ahead=page_size
+        )
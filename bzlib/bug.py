@@ -15,37 +15,319 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import datetime
 import functools
-import itertools
+
+
+# bug fields that ``Bug.search`` can match
+SEARCH_FIELDS = frozenset([
+    'alias', 'assigned_to', 'component', 'creation_time', 'creator',
+    'id', 'last_change_time', 'op_sys', 'rep_platform', 'priority',
+    'product', 'resolution', 'severity', 'status', 'summary',
+    'target_milestone', 'qa_contact', 'url', 'version', 'whiteboard',
+])
+
+
+# fields with few distinct values, which many bugs share
+INTERNED_FIELDS = frozenset([
+    'assigned_to', 'classification', 'component', 'creator', 'op_sys',
+    'platform', 'priority', 'product', 'qa_contact', 'resolution',
+    'severity', 'status', 'target_milestone', 'version',
+])
+
+# maximum number of unicode strings shared by ``_intern``; byte
+# strings are interned by Python, which frees them once unused
+INTERN_TABLE_SIZE = 10000
+
+_interned = {}
+
+
+def _intern(s):
+    if type(s) is str:
+        return intern(s)
+    shared = _interned.get(s)
+    if shared is None:
+        if len(_interned) >= INTERN_TABLE_SIZE:
+            _interned.clear()  # bound the table; start sharing afresh
+        shared = _interned[s] = s
+    return shared
+
+
+def compact(data):
+    """Return bug data with shared field names and common values.
+
+    Decoding an RPC response creates new strings for the field names of
+    every bug.  The dict returned uses a single string for each field
+    name, and for each value of the ``INTERNED_FIELDS``.  Other values,
+    such as summaries, are left alone, so that they are freed with the
+    bug.
+    """
+    return {
+        _intern(k): _intern(v)
+        if k in INTERNED_FIELDS and isinstance(v, basestring) else v
+        for k, v in data.viewitems()
+    }
+
+
+_row_types = {}
+
+
+def row_type(fields):
+    """Return a tuple type for rows of bug data with the given fields.
+
+    The ``id`` field is always the first field.  The type is a
+    ``collections.namedtuple``; rows hold only the values of the fields,
+    without a dict per bug.
+    """
+    fields = ('id',) + tuple(sorted(set(fields) - set(['id'])))
+    if fields not in _row_types:
+        _row_types[fields] = collections.namedtuple('BugRow', fields)
+    return _row_types[fields]
+
+
+def make_row(cls, data):
+    """Return a row of the given type from bug data.
+
+    Fields missing from the data are None.
+    """
+    return cls._make(data.get(x) for x in cls._fields)
+
+
+def projection(include_fields=None, exclude_fields=None):
+    """Return the ``Bug.get`` or ``Bug.search`` args for a field projection.
+
+    The ``id`` field is always included.
+    """
+    kwargs = {}
+    if include_fields is not None:
+        kwargs['include_fields'] = sorted(set(include_fields) | set(['id']))
+    if exclude_fields is not None:
+        kwargs['exclude_fields'] = sorted(set(exclude_fields) - set(['id']))
+    return kwargs
+
+
+def multi_change(add=None, remove=None, set=None):
+    """Return a ``Bug.update`` change to a multi-valued field.
+
+    ``set`` replaces the values of the field, and takes precedence over
+    ``add`` and ``remove``.  Return None if there is nothing to change.
+    """
+    if set:
+        return {'set': set}
+    change = {}
+    if add:
+        change['add'] = add
+    if remove:
+        change['remove'] = remove
+    return change or None
+
+
+def new_since(comments):
+    """Return the ``Bug.comments`` args to retrieve newer comments.
+
+    The args are empty if there are no comments.  Bugzilla only
+    returns comments strictly newer than ``new_since``, which has a
+    resolution of one second, so the args reach back a second further
+    than the newest comment; see ``Bug.merge_comments``.
+    """
+    times = [x['time'] for x in comments]
+    if not times:
+        return {}
+    return {'new_since': max(times) - datetime.timedelta(seconds=1)}
+
+
+def number_comments(comments):
+    """Return (number, comment) pairs for comments, oldest first.
+
+    Comments are numbered as Bugzilla numbers them (the description is
+    number 0), if the comments say; otherwise by their position.
+    """
+    return [
+        (comment.get('count', n), comment)
+        for n, comment in enumerate(comments)
+    ]
+
+
+def search_args(bz, **kwargs):
+    """Return the ``Bug.search`` RPC args for the given search criteria.
+
+    Criteria, ``include_fields`` and ``exclude_fields`` are given as
+    for ``Bug.search``.  Raise TypeError if a criterion is not valid.
+    """
+    fields = SEARCH_FIELDS | frozenset(['limit', 'offset'])
+    include_fields = kwargs.pop('include_fields', None)
+    exclude_fields = kwargs.pop('exclude_fields', None)
+
+    # search kwargs for "not in" args and converts to an "in",
+    # unless an "in" already exists
+    for _not_in in (k for k in kwargs if k.startswith('not_')):
+        _in = _not_in[4:]
+        if _in not in fields:
+            raise TypeError('Invalid keyword argument: {}.'.format(_in))
+        if _in not in kwargs:
+            # set _in version (_in takes precedence if it's already set)
+            if _in == 'product':
+                all_values = set(x['name'] for x in bz.get_products())
+            else:
+                all_values = bz.get_field_index().value_names(_in)
+            kwargs[_in] = list(all_values - frozenset(kwargs[_not_in]))
+        del kwargs[_not_in]  # delete the _not_in
+
+    unknowns = kwargs.viewkeys() - fields
+    if unknowns:
+        # unknown arguments
+        raise TypeError(
+            'Invalid keyword arguments: {}.'.format(', '.join(unknowns)))
+    kwargs.update(projection(include_fields, exclude_fields))
+    return kwargs
+
+
+def work_times(history):
+    """Return the ``work_time`` changes in a bug history, oldest first.
+
+    Return a list of (when, who, hours) triples.
+    """
+    return [
+        (changeset['when'], changeset['who'], float(change['added']))
+        for changeset in history
+        for change in changeset['changes']
+        if change['field_name'] == 'work_time'
+    ]
+
+
+def search_pages(bz, page_size, **kwargs):
+    """Generate the results of a search a page at a time.
+
+    kwargs: the ``Bug.search`` RPC args (see ``search_args``); ``limit``
+            and ``offset`` are honoured
+
+    Each page is a list of bug data dicts, as returned by the RPC.
+    """
+    offset = kwargs.pop('offset', 0)
+    limit = kwargs.pop('limit', None)
+    while limit is None or limit > 0:
+        n = page_size if limit is None else min(page_size, limit)
+        result = bz.rpc('Bug', 'search', limit=n, offset=offset, **kwargs)
+        yield result['bugs']
+        if len(result['bugs']) < n:
+            return  # last page
+        offset += n
+        if limit is not None:
+            limit -= n
+
+
+# fields whose values change with the values of other fields
+DEPENDENT_FIELDS = {
+    'status': ['is_open'],
+    'dupe_of': ['status', 'resolution', 'is_open'],
+}
+
+# multi-valued fields whose values are bug numbers
+BUG_LIST_FIELDS = frozenset(['blocks', 'depends_on'])
+
+
+def _apply_change(field, value, change):
+    """Return the value of a field after a change from ``Bug.update``.
+
+    ``added`` and ``removed`` are strings; values of multi-valued fields
+    are separated by commas.  Raise TypeError or ValueError if the new
+    value cannot be derived.
+    """
+    if isinstance(value, list):
+        split = lambda x: [y.strip() for y in x.split(',') if y.strip()]
+        convert = int if field in BUG_LIST_FIELDS else unicode
+        removed = set(map(convert, split(change['removed'])))
+        added = map(convert, split(change['added']))
+        return [x for x in value if x not in removed] \
+            + [x for x in added if x not in value]
+    added = change['added']
+    if isinstance(value, bool):
+        return added.lower() in ('1', 'true')
+    if isinstance(value, (int, float)):
+        return type(value)(added) if added else type(value)()
+    if isinstance(value, basestring):
+        return added
+    raise TypeError(field)  # e.g. None or a date; the type is unknown
+
+
+class BugData(dict):
+    """Bug data retrieved with a field projection.
+
+    The first time a field that was not retrieved is looked up with
+    ``[]``, all remaining fields of the bug are retrieved.  Membership
+    tests and ``get()`` only consider the fields already retrieved.
+    """
+
+    __slots__ = ['_fetch']
+
+    def __init__(self, data, fetch):
+        """Create bug data.
+
+        fetch: a function that takes ``exclude_fields`` and returns
+               the remaining bug data.
+        """
+        super(BugData, self).__init__(data)
+        self._fetch = fetch
+
+    def __missing__(self, key):
+        if self._fetch is None:
+            raise KeyError(key)
+        fetch, self._fetch = self._fetch, None
+        self.update(fetch(exclude_fields=sorted(self)))
+        return self[key]
 
 
 class Bug(object):
 
+    __slots__ = [
+        'bz', 'bugno', '_include_fields', '_exclude_fields',
+        '_data', '_comments', '_comments_stale', '_history',
+        '_work_times',
+    ]
+
     @property
     def data(self):
         if self._data is None:
             if not self.bugno:
                 raise Exception("bugno not provided.")
-            self._data = self.rpc('get', ids=[self.bugno])['bugs'][0]
+            self.data = self.rpc(
+                'get',
+                ids=[self.bugno],
+                **projection(self._include_fields, self._exclude_fields)
+            )['bugs'][0]
         return self._data
 
     @data.setter
     def data(self, value):
+        if value is not None:
+            value = compact(value)
+            if self._projected():
+                value = BugData(value, self._fetch_data)
         self._data = value
 
+    def _projected(self):
+        return self._include_fields is not None \
+            or self._exclude_fields is not None
+
+    def _fetch_data(self, exclude_fields):
+        return self.rpc(
+            'get', ids=[self.bugno], exclude_fields=exclude_fields
+        )['bugs'][0]
+
     @property
     def history(self):
         if self._history is None:
             if not self.bugno:
                 raise Exception("bugno not provided.")
-            self._history = \
+            self.history = \
                 self.rpc('history', ids=[self.bugno])['bugs'][0]['history']
         return self._history
 
     @history.setter
     def history(self, value):
         self._history = value
+        self._work_times = None
 
     @property
     def comments(self):
@@ -54,11 +336,44 @@ class Bug(object):
                 raise Exception("bugno not provided.")
             result = self.rpc('comments', ids=[self.bugno])
             self._comments = result['bugs'][str(self.bugno)]['comments']
+        elif self._comments_stale:
+            self.new_comments()
         return self._comments
 
     @comments.setter
     def comments(self, value):
         self._comments = value
+        self._comments_stale = False
+
+    def new_comments(self):
+        """Retrieve the comments made since the comments were retrieved.
+
+        Only comments newer than the newest comment already retrieved
+        are transferred; they are merged into ``comments``.  If no
+        comments have been retrieved, all of them are.
+
+        Return a list of the new comments.
+        """
+        if self._comments is None:
+            return list(self.comments)
+        kwargs = new_since(self._comments)
+        result = self.rpc('comments', ids=[self.bugno], **kwargs)
+        return self.merge_comments(
+            result['bugs'][str(self.bugno)]['comments'])
+
+    def merge_comments(self, comments):
+        """Merge newly retrieved comments into ``comments``.
+
+        Return a list of the comments that were not already known.
+        """
+        if self._comments is None:
+            self.comments = list(comments)
+            return self._comments
+        known = set(x['id'] for x in self._comments)
+        new = [x for x in comments if x['id'] not in known]
+        self._comments.extend(new)
+        self._comments_stale = False
+        return new
 
     @classmethod
     def search(cls, bz, **kwargs):
@@ -69,57 +384,71 @@ class Bug(object):
         negates the criterion.  If both forms are provided ("in" and
         "not in"), the "in" criterion take precedence.
 
+        The ``include_fields`` and ``exclude_fields`` keyword args limit
+        the fields retrieved for each bug; see ``Bug``.
+
+        If the ``page_size`` keyword arg is given, the results are
+        retrieved a page at a time (honouring ``limit`` and ``offset``)
+        and bugs are yielded as each page arrives.
+
+        If the ``rows`` keyword arg is true, rows of the type returned
+        by ``row_type(include_fields)`` are returned instead of bugs.
+        Rows take much less memory than bugs.  ``include_fields`` is
+        required.
+
         Return an Iterable of bugs (caller must not assume that the
         value returned is a Sequence).
         """
-        fields = frozenset([
-            'alias', 'assigned_to', 'component', 'creation_time', 'creator',
-            'id', 'last_change_time', 'op_sys', 'rep_platform', 'priority',
-            'product', 'resolution', 'severity', 'status', 'summary',
-            'target_milestone', 'qa_contact', 'url', 'version', 'whiteboard',
-            'limit', 'offset',
-        ])
-
-        # search kwargs for "not in" args and converts to an "in",
-        # unless an "in" already exists
-        for _not_in in (k for k in kwargs if k.startswith('not_')):
-            _in = _not_in[4:]
-            if _in not in fields:
-                raise TypeError('Invalid keyword argument: {}.'.format(_in))
-            if _in not in kwargs:
-                # set _in version (_in takes precedence if it's already set)
-                if _in == 'product':
-                    all_values = set(x['name'] for x in bz.get_products())
-                else:
-                    all_values = set(
-                        value['name'] for value in
-                        [
-                            field['values'] for field in bz.get_fields()
-                            if field['name'] == _in
-                        ][0]
-                    )
-                kwargs[_in] = list(all_values - frozenset(kwargs[_not_in]))
-            del kwargs[_not_in]  # delete the _not_in
-
-        unknowns = kwargs.viewkeys() - fields
-        if unknowns:
-            # unknown arguments
-            raise TypeError(
-                'Invalid keyword arguments: {}.'.format(', '.join(unknowns)))
-        _cls = functools.partial(cls, bz)  # curry constructor with bz
+        include_fields = kwargs.get('include_fields')
+        exclude_fields = kwargs.get('exclude_fields')
+        page_size = kwargs.pop('page_size', None)
+        rows = kwargs.pop('rows', False)
+        if rows and include_fields is None:
+            raise TypeError('rows requires include_fields.')
+        kwargs = search_args(bz, **kwargs)
+        if rows:
+            _cls = functools.partial(make_row, row_type(include_fields))
+        else:
+            # curry constructor with bz and projection
+            _cls = functools.partial(
+                cls, bz,
+                include_fields=include_fields,
+                exclude_fields=exclude_fields
+            )
+        if page_size:
+            return (
+                _cls(data)
+                for page in search_pages(bz, page_size, **kwargs)
+                for data in page
+            )
         return map(_cls, bz.rpc('Bug', 'search', **kwargs)['bugs'])
 
-    def __init__(self, bz, bugno_or_data=None):
+    def __init__(
+        self,
+        bz,
+        bugno_or_data=None,
+        include_fields=None,
+        exclude_fields=None
+    ):
         """Create a bug object.
 
         bz: a bzlib.Bugzilla object
         bugno_or_data: if an int, refers to bugno, otherwise implies a
                        new bug with the given data, otherwise implies
                        a new bug with no data (yet).
+        include_fields: if given, only these fields are retrieved
+        exclude_fields: if given, these fields are not retrieved
         If data is None (the default) and if bugno is set, the data will be
         retrieved lazily.
+
+        If a field projection is given, the data are a ``BugData`` and
+        the fields left out are retrieved when first looked up.  Data
+        given to the constructor are assumed to have been retrieved
+        with the same projection.
         """
         self.bz = bz
+        self._include_fields = include_fields
+        self._exclude_fields = exclude_fields
 
         self.bugno = None
         self.data = None
@@ -168,7 +497,7 @@ class Bug(object):
 
     def add_comment(self, comment):
         self.rpc('add_comment', id=self.bugno, comment=comment)
-        self.comments = None  # comments are stale
+        self._comments_stale = True  # retrieve new comments on next use
         self.history = None  # history is stale
 
     def is_open(self):
@@ -180,11 +509,7 @@ class Bug(object):
         kwargs = {'dupe_of': bug}
         if comment:
             kwargs['comment'] = {'body': comment}
-        self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
-        if comment:
-            self.comments = None  # comments are stale
+        self._update(**kwargs)
 
     def set_status(self, status, resolution='', comment=None):
         """Set the status of this bug.
@@ -199,11 +524,7 @@ class Bug(object):
             kwargs['resolution'] = resolution
         if comment:
             kwargs['comment'] = {'body': comment}
-        self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
-        if comment:
-            self.comments = None  # comments are stale
+        self._update(**kwargs)
 
     def set_assigned_to(
         self,
@@ -226,18 +547,24 @@ class Bug(object):
         kwargs = {'assigned_to': user}
         if comment:
             kwargs['comment'] = {'body': comment}
+        status = self.status_on_assign()
+        if status:
+            kwargs['status'] = status
+        self._update(**kwargs)
+
+    def status_on_assign(self):
+        """Return the status this bug takes when reassigned, or None.
+
+        See the ``assign_status`` config.
+        """
         if 'assign_status' in self.bz.config:
             try:
                 froms, to = self.bz.config['assign_status'].split()
                 if self.data['status'] in froms.split(','):
-                    kwargs['status'] = to
+                    return to
             except:
                 pass  # ignore errors (incorrect config)
-        self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
-        if comment:
-                self.comments = None  # comments are stale
+        return None
 
     def update(self, **kwargs):
         """Update the bug.
@@ -267,78 +594,110 @@ class Bug(object):
                 date = date.date()  # get date component of a datetime
             kwargs['deadline'] = str(date)  # datetime.date formats in ISO
 
+        return self._update(**kwargs)
+
+    def _update(self, **kwargs):
+        """Do the ``Bug.update`` RPC and apply the changes it reports."""
         result = self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
+        self.apply_update(result['bugs'][0])
         if 'comment' in kwargs:
-            self.comments = None  # comments are stale
+            self._comments_stale = True  # retrieve new comments on next use
         return result
-        # TODO refactor other methods to use this
+
+    def apply_update(self, result):
+        """Apply the changes reported by ``Bug.update`` to this bug.
+
+        result: the entry for this bug in the ``bugs`` list of the
+                ``Bug.update`` result
+
+        Changed fields are patched in the bug data and a history entry
+        for the change is appended to the history, if they have been
+        retrieved.  A field whose new value cannot be derived from the
+        result (or that depends on a changed field, such as ``is_open``)
+        is dropped from the data, and retrieved again on next use.
+        """
+        changes = result.get('changes')
+        if changes is None:
+            # the server did not report the changes
+            self.data = None  # data is stale
+            self.history = None  # history is stale
+            return
+        if self._history is not None and changes:
+            self._history.append({
+                'when': result.get('last_change_time'),
+                'who': self.bz.user,
+                'changes': [
+                    dict(field_name=k, **v)
+                    for k, v in sorted(changes.viewitems())
+                ],
+            })
+            self._work_times = None
+        if self._data is None:
+            return
+        data = self._data
+        stale = []
+        for field, change in changes.viewitems():
+            stale.extend(DEPENDENT_FIELDS.get(field, []))
+            if field not in data:
+                continue
+            try:
+                data[field] = _apply_change(field, data[field], change)
+            except (TypeError, ValueError):
+                stale.append(field)
+        if 'last_change_time' in result and 'last_change_time' in data:
+            data['last_change_time'] = result['last_change_time']
+        stale = [x for x in stale if x in data]
+        if stale:
+            # retrieve stale fields on next use
+            self._data = BugData(
+                (x for x in data.viewitems() if x[0] not in stale),
+                self._fetch_data
+            )
 
     def update_block(self, add=None, remove=None, set=None, comment=None):
         """Update the bugs that this bug blocks.
 
         Accepts arrays of integer bug numbers.
         """
-        blocks = {}
-        if set:
-            blocks['set'] = set
-        else:
-            if add:
-                blocks['add'] = add
-            if remove:
-                blocks['remove'] = remove
+        blocks = multi_change(add, remove, set) or {}
         kwargs = {'blocks': blocks}
         if comment:
             kwargs['comment'] = {'body': comment}
-        self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
-        if comment:
-            self.comments = None  # comments are stale
+        self._update(**kwargs)
 
     def update_depend(self, add=None, remove=None, set=None, comment=None):
         """Update the bugs on which this bug depends.
 
         Accepts arrays of integer bug numbers.
         """
-        depends = {}
-        if set:
-            depends['set'] = set
-        else:
-            if add:
-                depends['add'] = add
-            if remove:
-                depends['remove'] = remove
+        depends = multi_change(add, remove, set) or {}
         kwargs = {'depends_on': depends}
         if comment:
             kwargs['comment'] = {'body': comment}
-        self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
-        if comment:
-            self.comments = None  # comments are stale
+        self._update(**kwargs)
 
     def update_cc(self, add=None, remove=None, comment=None):
         """Update the CC list of the given bugs.
 
         Accepts arrays of valid user names.
         """
-        cc = {}
-        if add:
-            cc['add'] = add
-        if remove:
-            cc['remove'] = remove
+        cc = multi_change(add, remove)
         if not cc:
             return  # nothing to do
         kwargs = {'cc': cc}
         if comment:
             kwargs['comment'] = {'body': comment}
-        self.rpc('update', ids=[self.bugno], **kwargs)
-        self.data = None  # data is stale
-        self.history = None  # history is stale
-        if comment:
-            self.comments = None  # comments are stale
+        self._update(**kwargs)
+
+    def work_times(self):
+        """Return the hours worked on a bug, as (when, who, hours) triples.
+
+        The ``work_time`` changes are picked out of the history once,
+        and kept until the history changes.
+        """
+        if self._work_times is None:
+            self._work_times = work_times(self.history)
+        return self._work_times
 
     def actual_time(self):
         """Calculate the actual hours worked on a bug.
@@ -346,10 +705,4 @@ class Bug(object):
         Hopefully this will one day be available via rpc('get', ...), but
         for the time being, we have to use the history to calculate it.
         """
-        changesets = (changeset['changes'] for changeset in self.history)
-        hours = (
-            float(change['added'])
-            for change in itertools.chain.from_iterable(changesets)
-            if change['field_name'] == 'work_time'
-        )
-        return sum(hours)
+        return sum(x[2] for x in self.work_times())
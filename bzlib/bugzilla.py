@@ -14,11 +14,24 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
+import datetime
+import functools
+import re
+import threading
+import time
 import urlparse
 import xmlrpclib
 
 from . import bug
+from . import cache
+from . import coalesce
 from . import config
+from . import metadata
+from . import protocol
+from . import transport
+from . import unmarshal
+from . import usercache
 
 
 # field type constants
@@ -31,6 +44,46 @@ FIELD_DATETIME = 5
 FIELD_BUG_ID = 6
 FIELD_BUG_URL = 7
 
+# maximum number of bugs requested in a single RPC
+DEFAULT_CHUNK_SIZE = 100
+
+# number of search results retrieved at a time
+DEFAULT_SEARCH_PAGE_SIZE = 500
+
+# seconds before cached server metadata are revalidated
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+
+# periods before the last change of a bug searched for its newest
+# comments, in turn, when only the newest comments are wanted
+COMMENT_WINDOWS = [
+    datetime.timedelta(days=1),
+    datetime.timedelta(days=30),
+    datetime.timedelta(days=365),
+    None,  # all comments
+]
+
+# fault codes of an RPC made with an expired or invalid login token.
+# 32000 is Bugzilla's code of all errors without a code of their own,
+# so the message must also be about the token, e.g. "The cookies or
+# token provide were not valid or have expired."
+TOKEN_FAULTS = frozenset([32000])
+TOKEN_FAULT_MESSAGE = re.compile(
+    r'\btoken\b.*\b(?:not valid|invalid|expired)\b', re.I | re.S)
+
+# fault code of an RPC of a method the server does not have (as
+# defined by the XML-RPC fault code specification); other servers say so
+# only in the message, e.g. "Unknown method: system.multicall"
+METHOD_MISSING_FAULTS = frozenset([-32601])
+METHOD_MISSING_MESSAGE = re.compile(r'\bunknown method\b', re.I)
+
+# methods that change nothing; identical RPCs of these methods made at
+# the same time by several threads share the result of a single RPC
+SINGLE_FLIGHT_METHODS = frozenset([
+    'Bug.comments', 'Bug.fields', 'Bug.get', 'Bug.history', 'Bug.search',
+    'Bugzilla.last_audit_time', 'Bugzilla.version', 'Product.get',
+    'Product.get_accessible_products', 'User.get',
+])
+
 
 class UserError(Exception):
     pass
@@ -40,13 +93,57 @@ class URLError(Exception):
     pass
 
 
+class BatchError(Exception):
+    pass
+
+
+class PendingResult(object):
+    """The result of an RPC queued in a batch.
+
+    The result becomes available when the batch is flushed.
+    """
+
+    __slots__ = ['_done', '_value', '_fault']
+
+    def __init__(self):
+        self._done = False
+        self._value = None
+        self._fault = None
+
+    def set_result(self, value):
+        self._done = True
+        self._value = value
+
+    def set_fault(self, fault):
+        self._done = True
+        self._fault = fault
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        """Return the result of the RPC.
+
+        Raise the ``xmlrpclib.Fault`` if the RPC failed, or BatchError if
+        the batch has not been flushed.
+        """
+        if not self._done:
+            raise BatchError('result not available until batch is flushed')
+        if self._fault is not None:
+            raise self._fault
+        return self._value
+
+
 class Bugzilla(object):
     """A Bugzilla server."""
 
     __slots__ = [
-        '_products', '_fields', '_user_cache',
+        '_products', '_fields', '_field_index', '_user_cache',
         'url', 'user', 'password', 'config',
-        'server',
+        'server', 'transport',
+        '_local', '_lock', '_multicall_supported', '_token',
+        '_single_flight', '_bug_get_batcher',
+        'cache',
     ]
 
     @classmethod
@@ -78,6 +175,8 @@ class Bugzilla(object):
         _server.update(
             {k: kwargs[k] for k in mandatory_kwargs if kwargs[k]}
         )
+        if 'api_key' in _server:
+            mandatory_kwargs = ('url', 'user')  # no password needed
         if mandatory_kwargs - _server.viewkeys():
             missing_args = ', '.join(mandatory_kwargs - _server.viewkeys())
             raise UserWarning("missing args: {}".format(missing_args))
@@ -89,16 +188,57 @@ class Bugzilla(object):
         url      : points to a bugzilla instance (base URL; must end in '/')
         user     : bugzilla username
         password : bugzilla password
+
+        Connections to the server are kept alive and reused.  The
+        ``pool_size`` config gives the maximum number of idle connections
+        to keep, and ``pool_idle_timeout`` the number of seconds after
+        which an idle connection is discarded.  The ``decoder`` config
+        selects the decoder of responses (see ``unmarshal.getparser``).
+        The ``protocol`` config selects the web services used: ``xmlrpc``
+        (the default), ``jsonrpc`` or ``rest`` (see ``bzlib.protocol``).
+        Responses are requested compressed; if the ``encode_threshold``
+        config is set, requests longer than that many bytes are sent
+        compressed too.
+
+        When retrieving many bugs at once, the ``chunk_size`` config
+        gives the maximum number of bugs requested in a single RPC.
+        The ``search_page_size`` config gives the number of search
+        results retrieved at a time.
+
+        Field and product information are cached on disk.  After
+        ``cache_ttl`` seconds cached information is revalidated, and
+        retrieved again only if the server reports changes.
+
+        The first RPC logs in with ``User.login``, and later RPCs send
+        the login token rather than the password.  The token is cached
+        on disk, so that later sessions need not log in again; if the
+        server rejects it, the client logs in again.  If the server
+        does not issue tokens, the password is sent with every RPC.
+        If the ``api_key`` config is set, it is sent with every RPC
+        instead.
+
+        Users matched by name are cached on disk too; the
+        ``user_cache_size`` config gives the maximum number of matches
+        kept, and ``user_cache_ttl`` the number of seconds after which a
+        match expires.
         """
 
         self._products = None
         self._fields = None
-        self._user_cache = {}
+        self._field_index = None
+        self._user_cache = None
+        self._local = threading.local()  # the batches of each thread
+        self._lock = threading.Lock()
+        self._single_flight = coalesce.SingleFlight()
+        self._bug_get_batcher = None
+        self._multicall_supported = True
+        self._token = None  # not logged in; False if no tokens issued
 
         self.url = url
         self.user = user
         self.password = password
         self.config = config
+        self.cache = cache.Cache.for_server(url, user)
 
         parsed_url = urlparse.urlparse(url)
         if not parsed_url.netloc:
@@ -111,43 +251,518 @@ class Bugzilla(object):
             raise URLError(
                 'URL params, queries and fragments not supported.'
             )
-        url = url + 'xmlrpc.cgi' if url[-1] == '/' else url + '/xmlrpc.cgi'
-        # httplib explodes if url is unicode
-        self.server = xmlrpclib.ServerProxy(str(url), use_datetime=True)
+        url = url if url[-1] == '/' else url + '/'
+        transport_cls = transport.SafeTransport \
+            if parsed_url.scheme == 'https' else transport.Transport
+        pool_size = config.get('pool_size', transport.DEFAULT_POOL_SIZE)
+        idle_timeout = \
+            config.get('pool_idle_timeout', transport.DEFAULT_IDLE_TIMEOUT)
+        encode_threshold = config.get('encode_threshold')
+        self.transport = transport_cls(
+            use_datetime=True,
+            pool_size=int(pool_size),
+            idle_timeout=float(idle_timeout),
+            decoder=config.get('decoder', unmarshal.DEFAULT_DECODER),
+            encode_threshold=int(encode_threshold)
+            if encode_threshold is not None else None,
+        )
+        self.server = protocol.server_proxy(
+            config.get('protocol', protocol.DEFAULT_PROTOCOL),
+            url,
+            self.transport
+        )
+        window = float(config.get('bug_get_window', 0))
+        if window > 0:
+            self._bug_get_batcher = coalesce.BugGetBatcher(
+                functools.partial(self._rpc, 'Bug.get'), window)
 
     def rpc(self, *args, **kwargs):
         """Do an RPC on the Bugzilla server.
 
         args: RPC method, in fragments
         kwargs: RPC parameters
+
+        Within a ``batch()``, the RPC is queued and a PendingResult is
+        returned instead of the result.
+
+        If another thread is making an identical RPC of a method in
+        ``SINGLE_FLIGHT_METHODS``, the RPC is not made again; the result
+        of the other is shared.  If the ``bug_get_window`` config is
+        set, ``Bug.get`` RPCs of single bugs made by several threads
+        within that many seconds are merged into one RPC.
+        """
+        method = '.'.join(args)
+        if self._batches:
+            pending = PendingResult()
+            self._batches[-1].append((method, kwargs, pending))
+            return pending
+        if method == 'Bug.get' and self._bug_get_batcher is not None \
+                and self._bug_get_batcher.accepts(kwargs):
+            return self._bug_get_batcher.get(kwargs)
+        return self._rpc(method, kwargs)
+
+    def _rpc(self, method, params):
+        """Do an RPC, or share the result of an identical one in flight."""
+        if method in SINGLE_FLIGHT_METHODS:
+            try:
+                key = coalesce.call_key(method, params)
+            except TypeError:
+                pass  # a param cannot be hashed; make the RPC anyway
+            else:
+                return self._single_flight.do(
+                    key, lambda: self._rpc_now(method, params))
+        return self._rpc_now(method, params)
+
+    def _rpc_now(self, method, params):
+        pending = PendingResult()
+        self._flush([(method, params, pending)])
+        return pending.result()
+
+    def _credentials(self):
+        """Return the authentication params of an RPC.
+
+        Log in first, if need be.
+        """
+        if self.config.get('api_key'):
+            return {'Bugzilla_api_key': self.config['api_key']}
+        if not self.user:
+            return {}
+        if self._token is None:
+            with self._lock:  # other threads wait for the same login
+                if self._token is None:
+                    self._login()
+        if self._token:
+            return {'Bugzilla_token': self._token}
+        return {
+            'Bugzilla_login': self.user,
+            'Bugzilla_password': self.password,
+        }
+
+    def _login(self):
+        """Obtain a login token, from the cache or with ``User.login``."""
+        entry = self.cache.get('token')
+        if entry is not None:
+            self._token = entry['value']
+            return
+        result = self._call(
+            'User.login', {'login': self.user, 'password': self.password})
+        # servers before Bugzilla 4.4.3 do not issue tokens
+        self._token = result.get('token') or False
+        if self._token:
+            try:
+                self.cache.set('token', self._token)
+            except EnvironmentError:
+                pass  # log in again next time
+
+    def _token_fault(self, result):
+        """Return True if a result is a fault due to an invalid token."""
+        return bool(
+            self._token
+            and isinstance(result, xmlrpclib.Fault)
+            and result.faultCode in TOKEN_FAULTS
+            and TOKEN_FAULT_MESSAGE.search(result.faultString or '')
+        )
+
+    def _forget_token(self):
+        """Forget the login token, so that the next RPC logs in again."""
+        self._token = None
+        self.cache.remove('token')
+
+    def _call(self, method, *params):
+        """Call the named XML-RPC method with positional params."""
+        return getattr(self.server, method)(*params)
+
+    @property
+    def _batches(self):
+        """The open batches of the current thread, innermost last."""
+        try:
+            return self._local.batches
+        except AttributeError:
+            self._local.batches = []
+            return self._local.batches
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Queue RPCs and send them together in one request.
+
+        Within the context, ``rpc()`` returns PendingResult objects; the
+        queued calls are sent when the context exits, using
+        ``system.multicall``.  If the server does not support
+        ``system.multicall`` the calls are made one after another.
+
+        Batches may be nested; each batch is flushed when its own
+        context exits.  Batches are per thread: RPCs made by other
+        threads are not queued.  If the context exits with an exception, the
+        queued calls are discarded.
+        """
+        self._batches.append([])
+        try:
+            yield
+        except:
+            self._batches.pop()
+            raise
+        self._flush(self._batches.pop())
+
+    def _flush(self, calls):
+        """Make the queued calls and resolve their PendingResults.
+
+        If the login token has expired, log in and make the calls that
+        were rejected for it again.  Calls that were not rejected are
+        never made again, since they may not be idempotent.
+        """
+        results = self._send(calls)
+        rejected = [i for i, x in enumerate(results) if self._token_fault(x)]
+        if rejected:
+            self._forget_token()
+            retried = self._send([calls[i] for i in rejected])
+            for i, result in zip(rejected, retried):
+                results[i] = result
+        for (_, _, pending), result in zip(calls, results):
+            if isinstance(result, xmlrpclib.Fault):
+                pending.set_fault(result)
+            else:
+                pending.set_result(result)
+
+    def _send(self, calls):
+        """Make calls, in one request if possible.
+
+        Return a list of the results, with an ``xmlrpclib.Fault`` for
+        each failed call.
+        """
+        credentials = self._credentials()
+        if len(calls) > 1 and self._multicall_supported:
+            try:
+                results = self._call('system.multicall', [
+                    {'methodName': method, 'params': [
+                        dict(params, **credentials)]}
+                    for method, params, _ in calls
+                ])
+            except xmlrpclib.Fault as e:
+                # a fault here is about the multicall itself, not the
+                # calls it carries; make them one by one instead, and
+                # stop trying if the server does not support it
+                if e.faultCode in METHOD_MISSING_FAULTS \
+                        or METHOD_MISSING_MESSAGE.search(e.faultString or ''):
+                    self._multicall_supported = False
+            else:
+                return [
+                    xmlrpclib.Fault(x['faultCode'], x['faultString'])
+                    if isinstance(x, dict) else x[0]
+                    for x in results
+                ]
+        results = []
+        for method, params, _ in calls:
+            try:
+                results.append(
+                    self._call(method, dict(params, **credentials)))
+            except xmlrpclib.Fault as e:
+                results.append(e)
+        return results
+
+    def bug(self, bugno, include_fields=None, exclude_fields=None):
+        """Extrude a Bug object.
+
+        The field projection, if given, limits the fields retrieved; see
+        ``bug.Bug``.
+        """
+        return bug.Bug(
+            self, bugno,
+            include_fields=include_fields,
+            exclude_fields=exclude_fields
+        )
+
+    def bugs(
+        self,
+        bugnos,
+        comments=False,
+        history=False,
+        include_fields=None,
+        exclude_fields=None,
+        permissive=False
+    ):
+        """Extrude Bug objects, retrieving their data in bulk.
+
+        The data of all the bugs are retrieved up front in a single
+        batch, with the ``chunk_size`` config limiting the number of
+        bugs per call.  If ``comments`` or ``history`` is true, the
+        comments or history of the bugs are retrieved in the same batch.
+
+        The field projection, if given, limits the fields retrieved; see
+        ``bug.Bug``.
+
+        Return a list of Bugs in the same order as the given bug numbers.
+        If ``permissive`` is true, bugs that do not exist or cannot be
+        accessed are left out, rather than failing the whole request
+        (their comments and history must not be asked for).
+        """
+        bugnos = map(int, bugnos)
+        chunks = self._chunks(bugnos)
+        _projection = bug.projection(include_fields, exclude_fields)
+        if permissive:
+            _projection['permissive'] = True
+        with self.batch():
+            gets = [
+                self.rpc('Bug', 'get', ids=chunk, **_projection)
+                for chunk in chunks
+            ]
+            _comments = [
+                self.rpc('Bug', 'comments', ids=chunk) for chunk in chunks
+            ] if comments else []
+            _history = [
+                self.rpc('Bug', 'history', ids=chunk) for chunk in chunks
+            ] if history else []
+
+        _bug = functools.partial(
+            self.bug,
+            include_fields=include_fields,
+            exclude_fields=exclude_fields
+        )
+        bugs = {}
+        for result in gets:
+            bugs.update(
+                (int(data['id']), _bug(data))
+                for data in result.result()['bugs']
+            )
+        for result in _comments:
+            for bugno, data in result.result()['bugs'].viewitems():
+                bugs[int(bugno)].comments = data['comments']
+        for result in _history:
+            for data in result.result()['bugs']:
+                bugs[int(data['id'])].history = data['history']
+        return [bugs[bugno] for bugno in bugnos if bugno in bugs]
+
+    def comments(self, bugnos, new_since=None, limit=None):
+        """Retrieve the comments of many bugs.
+
+        new_since: if given, only comments newer than this datetime
+        limit: if given, only the newest ``limit`` comments of each bug
+               are wanted
+
+        All the comments are retrieved in a single batch.  With
+        ``limit``, the last change times of the bugs are retrieved
+        first, then the comments made in widening periods before the
+        last change (see ``COMMENT_WINDOWS``), a batch for each period,
+        until each bug has enough comments.  Comments older than those
+        wanted are mostly not transferred.
+
+        Comments are numbered by their ``count``.  Servers before
+        Bugzilla 4.4 send no ``count``, so comments can only be numbered
+        by their position in the full list: for these servers, the full
+        list of each bug is retrieved instead, the ``count`` of each
+        comment is set, and comments older than ``new_since`` are
+        dropped.
+
+        Return a dict mapping bug numbers to lists of comments, oldest
+        first.  With ``limit``, the lists may hold more comments than
+        wanted.
+        """
+        bugnos = sorted(set(map(int, bugnos)))
+        if limit is None:
+            windows, pending = [None], {x: new_since for x in bugnos}
+        else:
+            windows = COMMENT_WINDOWS
+            pending = {
+                x.bugno: x.data['last_change_time']
+                for x in self.bugs(bugnos, include_fields=['last_change_time'])
+            }
+        comments = {}
+        partial = set()  # bugs of which only newer comments were retrieved
+        for window in windows:
+            # group the bugs by the time since which comments are wanted
+            groups = {}
+            for bugno, time in pending.viewitems():
+                since = time - window if window and time else None
+                if new_since and (since is None or since < new_since):
+                    since = new_since
+                groups.setdefault(since, []).append(bugno)
+            with self.batch():
+                calls = [
+                    (since, self.rpc(
+                        'Bug', 'comments',
+                        ids=chunk,
+                        **({'new_since': since} if since else {})
+                    ))
+                    for since, group in groups.viewitems()
+                    for chunk in self._chunks(group)
+                ]
+            for since, result in calls:
+                for bugno, data in result.result()['bugs'].viewitems():
+                    bugno = int(bugno)
+                    comments[bugno] = sorted(
+                        data['comments'], key=lambda x: int(x['id']))
+                    if since is None:
+                        partial.discard(bugno)
+                    else:
+                        partial.add(bugno)
+                    if limit is None or len(comments[bugno]) >= limit \
+                            or since is None or since == new_since:
+                        del pending[bugno]  # done
+            if not pending:
+                break
+        uncounted = sorted(
+            bugno for bugno in partial
+            if any('count' not in x for x in comments[bugno])
+        )
+        if uncounted:
+            for bugno, full in self.comments(uncounted).viewitems():
+                comments[bugno] = [
+                    dict(comment, count=n)
+                    for n, comment in enumerate(full)
+                    if new_since is None
+                    or comment.get('creation_time', comment.get('time'))
+                    > new_since
+                ]
+        return comments
+
+    def history(self, bugnos):
+        """Retrieve the history of many bugs in a single batch.
+
+        Return a dict mapping bug numbers to their history.
         """
-        kwargs['Bugzilla_login'] = self.user
-        kwargs['Bugzilla_password'] = self.password
+        with self.batch():
+            calls = [
+                self.rpc('Bug', 'history', ids=chunk)
+                for chunk in self._chunks(bugnos)
+            ]
+        return {
+            int(data['id']): data['history']
+            for result in calls
+            for data in result.result()['bugs']
+        }
 
-        method = self.server
-        for fragment in args:
-            method = getattr(method, fragment)
-        return method(kwargs)
+    def new_comments(self, bugs):
+        """Retrieve the new comments of many bugs in a single batch.
 
-    def bug(self, bugno):
-        """Extrude a Bug object."""
-        return bug.Bug(self, bugno)
+        Bugs whose comments have been retrieved share a ``Bug.comments``
+        call with the other bugs whose newest comment has the same time;
+        see ``bug.Bug.new_comments``.
+
+        Return a list of lists of the new comments of each bug.
+        """
+        bugs = list(bugs)
+        groups = {}
+        for _bug in bugs:
+            since = bug.new_since(_bug._comments or []).get('new_since')
+            groups.setdefault(since, {}).setdefault(_bug.bugno, []) \
+                .append(_bug)
+        with self.batch():
+            calls = [
+                (
+                    group,
+                    self.rpc(
+                        'Bug', 'comments',
+                        ids=chunk,
+                        **({'new_since': since} if since else {})
+                    ),
+                )
+                for since, group in groups.viewitems()
+                for chunk in self._chunks(group)
+            ]
+        new = {}
+        for group, result in calls:
+            for bugno, data in result.result()['bugs'].viewitems():
+                for _bug in group[int(bugno)]:
+                    new[_bug] = _bug.merge_comments(data['comments'])
+        return [new.get(_bug, []) for _bug in bugs]
+
+    def _chunks(self, bugnos):
+        """Split unique bug numbers into sorted chunks of ``chunk_size``."""
+        unique = sorted(set(bugnos))
+        chunk_size = int(self.config.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        return [
+            unique[i:i + chunk_size]
+            for i in range(0, len(unique), chunk_size)
+        ]
+
+    def update_bugs(self, bugnos, **changes):
+        """Apply the same changes to many bugs at once.
+
+        Changes are given as for the ``Bug.update`` RPC, except that a
+        ``comment`` may be given as a string, and changes that are
+        ``None`` (or an empty comment) are ignored.  All the bugs are
+        updated in a single batch, with the ``chunk_size`` config
+        limiting the number of bugs per call.
+
+        Return the ``bugs`` list of the ``Bug.update`` result(s).
+        """
+        changes = {k: v for k, v in changes.viewitems() if v is not None}
+        if not changes.get('comment', True):
+            del changes['comment']
+        elif isinstance(changes.get('comment'), basestring):
+            changes['comment'] = {'body': changes['comment']}
+        if not changes:
+            return []  # nothing to do
+        with self.batch():
+            results = [
+                self.rpc('Bug', 'update', ids=chunk, **changes)
+                for chunk in self._chunks(map(int, bugnos))
+            ]
+        return [x for result in results for x in result.result()['bugs']]
+
+    def _last_audit_time(self):
+        """Return the time of the last change to server metadata.
+
+        Return None if the server cannot tell (Bugzilla < 4.4).
+        """
+        try:
+            result = self.rpc('Bugzilla', 'last_audit_time')
+        except xmlrpclib.Fault:
+            return None
+        return str(result['last_audit_time'])
+
+    def _cached(self, name, fetch, use_cache=True):
+        """Return a value from the on-disk cache, or fetch and cache it.
+
+        Entries older than the ``cache_ttl`` config are revalidated
+        against the server's last audit time, which changes whenever
+        fields, products and the like are changed.
+        """
+        entry = self.cache.get(name) if use_cache else None
+        if entry is not None:
+            ttl = float(self.config.get('cache_ttl', DEFAULT_CACHE_TTL))
+            if time.time() - entry['time'] < ttl:
+                return entry['value']
+        audit_time = self._last_audit_time()
+        if entry is not None and audit_time is not None \
+                and audit_time == entry.get('audit_time'):
+            value = entry['value']  # still valid
+        else:
+            value = fetch()
+        try:
+            self.cache.set(name, value, audit_time=audit_time)
+        except EnvironmentError:
+            pass  # the cache is only an optimisation
+        return value
 
     def get_products(self, use_cache=True):
         """Get accessible products of this Bugzilla."""
         if use_cache and self._products:
             return self._products
-        ids = self.rpc('Product', 'get_accessible_products')['ids']
-        self._products = self.rpc('Product', 'get', ids=ids)['products']
+
+        def fetch():
+            ids = self.rpc('Product', 'get_accessible_products')['ids']
+            return self.rpc('Product', 'get', ids=ids)['products']
+        self._products = self._cached('products', fetch, use_cache)
         return self._products
 
     def get_fields(self, use_cache=True):
         """Get information about bug fields."""
         if use_cache and self._fields:
             return self._fields
-        self._fields = self.rpc('Bug', 'fields')['fields']
+        self._fields = self._cached(
+            'fields',
+            lambda: self.rpc('Bug', 'fields')['fields'],
+            use_cache
+        )
         return self._fields
 
+    def get_field_index(self, use_cache=True):
+        """Get a ``metadata.FieldIndex`` of information about bug fields."""
+        fields = self.get_fields(use_cache)
+        if self._field_index is None or self._field_index.fields is not fields:
+            self._field_index = metadata.FieldIndex(fields)
+        return self._field_index
+
     def get_field_values(self,
         name,
         sort=True,
@@ -163,36 +778,83 @@ class Bugzilla(object):
             visibility_values.  If the field does not have a value_field, no
             effect.  If not supplied, no effect.
         """
-        field = filter(lambda x: x['name'] == name, self.get_fields())[0]
-        values = field['values']
-        if omit_empty:
-            values = filter(lambda x: 'name' in x, values)
-        value_field = field.get('value_field')
-        if visible_for and value_field and value_field in visible_for:
-            visibility_value = visible_for[value_field]
-            values = filter(
-                lambda x: visibility_value in x['visibility_values'],
-                values
-            )
-        if sort:
-            values = sorted(values, key=lambda x: int(x['sortkey']))
-        return values
+        return list(self.get_field_index().values(
+            name,
+            sort=sort,
+            omit_empty=omit_empty,
+            visible_for=visible_for
+        ))
+
+    def _users(self):
+        """Return the cache of user matches, loading it from disk."""
+        with self._lock:
+            if self._user_cache is None:
+                entry = self.cache.get('users')
+                self._user_cache = usercache.UserCache(
+                    int(self.config.get(
+                        'user_cache_size',
+                        usercache.DEFAULT_USER_CACHE_SIZE)),
+                    float(self.config.get(
+                        'user_cache_ttl', usercache.DEFAULT_USER_CACHE_TTL)),
+                    entry['value'] if entry is not None else ()
+                )
+            return self._user_cache
 
     def match_users(self, fragment, use_cache=True):
         """Return a list of users matching the given string."""
-        if use_cache and fragment in self._user_cache:
-            return self._user_cache[fragment]
-        users = self.rpc('User', 'get', match=[fragment])['users']
+        return self.match_many_users([fragment], use_cache)[fragment]
+
+    def match_many_users(self, fragments, use_cache=True):
+        """Match many strings to users.
+
+        Strings whose matches are not cached are matched in a single
+        batch, and the matches cached.
+
+        Return a dict mapping each string to a list of matching users.
+        """
+        users = self._users()
+        matches = {}
         if use_cache:
-            self._user_cache[fragment] = users
-        return users
+            for fragment in fragments:
+                cached = users.get(fragment)
+                if cached is not None:
+                    matches[fragment] = cached
+        missing = sorted(set(fragments) - matches.viewkeys())
+        if not missing:
+            return matches
+        with self.batch():
+            calls = [
+                (fragment, self.rpc('User', 'get', match=[fragment]))
+                for fragment in missing
+            ]
+        for fragment, result in calls:
+            matches[fragment] = result.result()['users']
+            users.put(fragment, matches[fragment])
+        try:
+            self.cache.set('users', users.entries())
+        except EnvironmentError:
+            pass  # the cache is only an optimisation
+        return matches
 
     def match_one_user(self, fragment, use_cache=True):
         """Return the user matching the given string.
 
+        A string not matched before is first looked up among the users
+        already seen, as the prefix of a user name, email address or
+        real name; if it is the prefix of exactly one such user, that
+        user is returned without an RPC.
+
         Raise UserError if the result does not contain exactly one user.
         """
-        users = self.match_users(fragment)
+        users = None
+        if use_cache:
+            users = self._users().get(fragment)
+            if users is None:
+                users = self._users().match_prefix(fragment)
+                if len(users) != 1:
+                    users = None  # ask the server
+        if users is None:
+            users = self.match_users(fragment, use_cache)
         if not users:
             raise UserError("No users matching '{}'".format(fragment))
         if len(users) > 1:
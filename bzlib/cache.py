@@ -0,0 +1,122 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""On-disk cache of server metadata.
+
+Each server (and user, since what a user may see differs) gets its own
+cache directory, holding one JSON file per cached item.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+def cache_home():
+    """Return the directory under which bugzillatools caches data."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'bugzillatools')
+
+
+class Cache(object):
+    """A directory of cached items.
+
+    An entry is a dict with the keys:
+
+    value
+      The cached value.
+    time
+      The time (seconds since epoch) the value was last validated.
+    url, user
+      The server and user the cache belongs to.
+
+    Entries may carry additional keys given to ``set()``.
+    """
+
+    __slots__ = ['path', 'url', 'user']
+
+    @classmethod
+    def for_server(cls, url, user):
+        """Return the Cache for the given server and user."""
+        key = hashlib.sha1('{}\0{}'.format(url, user or '')).hexdigest()
+        return cls(os.path.join(cache_home(), key), url, user)
+
+    def __init__(self, path, url=None, user=None):
+        self.path = path
+        self.url = url
+        self.user = user
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.json')
+
+    def get(self, name):
+        """Return the entry for the named item, or None."""
+        try:
+            with open(self._file(name)) as fh:
+                return json.load(fh)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            pass  # corrupt entry; treat as missing
+        return None
+
+    def set(self, name, value, **kwargs):
+        """Store a value for the named item; return the new entry."""
+        entry = dict(kwargs, value=value, time=time.time())
+        entry.update(url=self.url, user=self.user)
+        try:
+            os.makedirs(self.path, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # write to a temporary file then rename, so that readers never
+        # see a partially written entry
+        fd, path = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(entry, fh)
+        os.rename(path, self._file(name))
+        return entry
+
+    def names(self):
+        """Return the names of the cached items."""
+        try:
+            files = os.listdir(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return []
+        return sorted(f[:-5] for f in files if f.endswith('.json'))
+
+    def size(self, name):
+        """Return the size of the named entry, in bytes."""
+        return os.path.getsize(self._file(name))
+
+    def remove(self, name):
+        """Remove the named item, if cached."""
+        try:
+            os.remove(self._file(name))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def clear(self):
+        """Remove all cached items."""
+        for name in self.names():
+            self.remove(name)
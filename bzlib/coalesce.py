@@ -0,0 +1,166 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Coalescing of RPCs made at the same time by several threads.
+
+``SingleFlight`` makes one call for identical calls in flight at once,
+and shares its result.  ``BugGetBatcher`` merges ``Bug.get`` RPCs of
+single bugs, made within a short window of each other, into one RPC of
+all the bugs.
+"""
+
+import copy
+import threading
+import time
+import xmlrpclib
+
+from . import parallel
+
+
+def call_key(method, params):
+    """Return a hashable key of an RPC; identical RPCs have equal keys.
+
+    Raise TypeError if a param value cannot be hashed.
+    """
+    def freeze(value):
+        if isinstance(value, dict):
+            return frozenset((k, freeze(v)) for k, v in value.viewitems())
+        if isinstance(value, (list, tuple)):
+            return tuple(map(freeze, value))
+        hash(value)
+        return value
+    return method, freeze(params)
+
+
+class SingleFlight(object):
+    """Calls of which only one of a key is made at a time."""
+
+    __slots__ = ['_lock', '_calls']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future of the call in flight
+
+    def do(self, key, fn):
+        """Call a function and return its value.
+
+        If a call of the same key is already in flight, wait for it
+        instead, and return a copy of its value (or raise its
+        exception).  Waiting calls copy a snapshot of the value taken
+        before it is returned, which the caller may then change.
+        """
+        future = parallel.Future()
+        with self._lock:
+            leader = self._calls.setdefault(key, future)
+        if leader is not future:
+            return copy.deepcopy(leader.result())
+        try:
+            value = fn()
+        except BaseException as e:
+            # even KeyboardInterrupt, which would leave waiters waiting
+            self._land(key)
+            future.set_exception(e)
+            raise
+        self._land(key)
+        future.set_result(copy.deepcopy(value))
+        return value
+
+    def _land(self, key):
+        # calls made from now on are made anew
+        with self._lock:
+            del self._calls[key]
+
+
+class BugGetBatcher(object):
+    """Merges ``Bug.get`` RPCs of single bugs into RPCs of many bugs.
+
+    call: a function that makes a ``Bug.get`` RPC, given its params
+    window: the seconds that the first RPC waits for others to join it
+
+    RPCs join the first if they have the same params, but for ``ids``.
+    If the merged RPC fails (e.g. one of the bugs does not exist), the
+    bugs are retrieved one by one instead, so that each RPC has its own
+    result or fault.
+    """
+
+    __slots__ = ['call', 'window', '_lock', '_groups']
+
+    def __init__(self, call, window):
+        self.call = call
+        self.window = window
+        self._lock = threading.Lock()
+        self._groups = {}  # key of params -> [(bugno, Future)]
+
+    @staticmethod
+    def accepts(params):
+        """Return True if the params of a ``Bug.get`` RPC can be merged."""
+        ids = params.get('ids')
+        return isinstance(ids, list) and len(ids) == 1 \
+            and isinstance(ids[0], (int, long))
+
+    def get(self, params):
+        """Make a ``Bug.get`` RPC of a single bug; return its result."""
+        bugno = params['ids'][0]
+        params = {k: v for k, v in params.viewitems() if k != 'ids'}
+        key = call_key('Bug.get', params)
+        future = parallel.Future()
+        with self._lock:
+            group = self._groups.get(key)
+            leader = group is None
+            if leader:
+                group = self._groups[key] = []
+            group.append((bugno, future))
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                del self._groups[key]
+            self._send(params, group)
+        return future.result()
+
+    def _send(self, params, group):
+        futures = {}
+        for bugno, future in group:
+            futures.setdefault(bugno, []).append(future)
+        result, bugs = None, {}
+        try:
+            if len(futures) > 1:
+                try:
+                    result = self.call(dict(params, ids=sorted(futures)))
+                    bugs = {x['id']: x for x in result['bugs']}
+                except xmlrpclib.Fault:
+                    pass  # retrieve the bugs one by one
+            for bugno, waiting in sorted(futures.viewitems()):
+                if bugno in bugs:
+                    value = dict(result, bugs=[bugs[bugno]])
+                else:
+                    try:
+                        value = self.call(dict(params, ids=[bugno]))
+                    except xmlrpclib.Fault as e:
+                        for future in waiting:
+                            future.set_exception(e)
+                        continue
+                # copy before any caller has the value to change
+                values = [value] + [
+                    copy.deepcopy(value) for _ in waiting[1:]]
+                for future, value in zip(waiting, values):
+                    future.set_result(value)
+        except BaseException as e:
+            # e.g. a network error; it fails the RPCs not yet answered
+            for future in sum(futures.viewvalues(), []):
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise  # e.g. KeyboardInterrupt
@@ -18,21 +18,31 @@
 from __future__ import unicode_literals
 
 import argparse
+import atexit
 import datetime
 import functools
 import itertools
 import re
 import textwrap
+import time
 
 from . import bug
 from . import bugzilla
 from . import config
 from . import editor
+from . import graph
+from . import mirror
+from . import parallel
+from . import table
+from . import textindex
 
 curry = functools.partial
 
 conf = config.Config.get_config('~/.bugzillarc')
 
+# maximum number of bugs updated concurrently (see ``--jobs``)
+DEFAULT_MAX_JOBS = 8
+
 
 class _ReadFileAction(argparse.Action):
     def __call__(self, parser, namespace, values, option_string):
@@ -121,6 +131,23 @@ def with_limit(things='items', default=None):
     return decorator
 
 
+def with_offline(cls):
+    cls.args = cls.args + [
+        lambda x: x.add_argument('--offline', action='store_true',
+            help='Use the local mirror (see the sync command).'),
+    ]
+    return cls
+
+
+def with_jobs(cls):
+    cls.args = cls.args + [
+        lambda x: x.add_argument('--jobs', '-j', type=int, default=1,
+            metavar='N',
+            help='Update up to N bugs concurrently.'),
+    ]
+    return cls
+
+
 def with_server(cls):
     def add_server_args(parser):
         group = parser.add_argument_group('server arguments')
@@ -128,6 +155,8 @@ def with_server(cls):
         group.add_argument('--url', help='base URL of Bugzilla server')
         group.add_argument('--user', help='Bugzilla username')
         group.add_argument('--password', help='Bugzilla password')
+        group.add_argument('--stats', action='store_true',
+            help='show the number of bytes sent and received')
     cls.args = cls.args + [add_server_args]
     return cls
 
@@ -239,15 +268,72 @@ class Help(Command):
 
 @with_server
 class BugzillaCommand(Command):
+    """
+    The bug fields that the command reads, or None if it reads them all.
+    Other fields are not retrieved from the server (see ``bzlib.bug.Bug``).
+    """
+    include_fields = None
+
     def __init__(self, *args, **kwargs):
         super(BugzillaCommand, self).__init__(*args, **kwargs)
         self.bz = bugzilla.Bugzilla.from_config(conf, **self._args.__dict__)
+        if getattr(self._args, 'stats', False):
+            atexit.register(self.show_stats)
+
+    def show_stats(self):
+        """Show the requests made and the bytes sent and received."""
+        t = self.bz.transport
+        self._ui.show(
+            '=> {} requests, {} connections; {} bytes sent ({} uncompressed),'
+            ' {} bytes received ({} uncompressed)'.format(
+                t.connections_opened + t.connections_reused,
+                t.connections_opened,
+                t.bytes_sent, t.content_sent,
+                t.bytes_received, t.content_received,
+            )
+        )
+
+    def bugs(self, bugnos, **kwargs):
+        """Return Bugs, from the local mirror if ``--offline`` was given."""
+        if not getattr(self._args, 'offline', False):
+            return self.bz.bugs(bugnos, **kwargs)
+        try:
+            return mirror.Mirror.for_bugzilla(self.bz).bugs(self.bz, bugnos)
+        except KeyError as e:
+            raise UserWarning(
+                'Bug {} is not in the local mirror.'.format(e.args[0]))
+
+    def map_bugs(self, fn, bugnos):
+        """Apply a function to each bug number, concurrently if requested.
+
+        Up to ``--jobs`` bugs are processed at once, capped by the
+        ``max_jobs`` server config.  A failure does not stop the
+        remaining bugs from being processed; once all are done, failures
+        are reported in the order of the bug numbers and the command
+        bails out.  Otherwise, return the list of results.
+        """
+        jobs = min(
+            getattr(self._args, 'jobs', 1),
+            int(self.bz.config.get('max_jobs', DEFAULT_MAX_JOBS))
+        )
+        results = parallel.pmap(fn, bugnos, jobs=jobs)
+        failures = [
+            (bugno, e) for bugno, (_, e) in zip(bugnos, results)
+            if e is not None
+        ]
+        for bugno, e in failures:
+            self._ui.show('Bug {}: {}'.format(bugno, e))
+        if failures:
+            self._ui.bail('{} of {} bugs failed'.format(
+                len(failures), len(bugnos)))
+        return [value for value, _ in results]
 
 
 @with_bugs
 @with_optional_message
 class Assign(BugzillaCommand):
     """Assign bugs to the given user."""
+    include_fields = ['status']  # see ``assign_status`` config
     args = BugzillaCommand.args + [
         lambda x: x.add_argument('--to', metavar='ASSIGNEE', required=True,
             help='New assignee'),
@@ -257,10 +343,17 @@ class Assign(BugzillaCommand):
         args = self._args
         message = editor.input('Enter your comment.') if args.message is True \
             else args.message
-        return map(
-            lambda x: self.bz.bug(x).set_assigned_to(args.to, comment=message),
-            args.bugs
-        )
+        user = self.bz.match_one_user(args.to)['name']
+        # bugs may take different statuses (see ``assign_status`` config)
+        statuses = {None: args.bugs}
+        if 'assign_status' in self.bz.config:
+            statuses = {}
+            bugs = self.bz.bugs(args.bugs, include_fields=self.include_fields)
+            for b in bugs:
+                statuses.setdefault(b.status_on_assign(), []).append(b.bugno)
+        for status, bugnos in statuses.viewitems():
+            self.bz.update_bugs(
+                bugnos, assigned_to=user, status=status, comment=message)
 
 
 @with_set('given bugs', 'blocked bugs', metavar='BUG', type=int)
@@ -269,43 +362,68 @@ class Assign(BugzillaCommand):
 @with_optional_message
 class Block(BugzillaCommand):
     """Show or update block list of given bugs."""
+    include_fields = ['blocks']
+
     def __call__(self):
         args = self._args
-        bugs = map(self.bz.bug, args.bugs)
         if args.add or args.remove or args.set:
             message = editor.input('Enter your comment.') \
                 if args.message is True else args.message
             # update blocked bugs
-            map(
-                lambda x: self.bz.bug(x).update_block(
-                    add=args.add,
-                    remove=args.remove,
-                    set=args.set,
-                    comment=message
-                ),
-                args.bugs
+            self.bz.update_bugs(
+                args.bugs,
+                blocks=bug.multi_change(args.add, args.remove, args.set),
+                comment=message
             )
         else:
             # show blocked bugs
-            for bug in bugs:
-                print 'Bug {}:'.format(bug.bugno)
-                if bug.data['blocks']:
+            bugs = self.bz.bugs(args.bugs, include_fields=self.include_fields)
+            for b in bugs:
+                print 'Bug {}:'.format(b.bugno)
+                if b.data['blocks']:
                     print '  Blocked bugs: {}'.format(
-                        ', '.join(map(str, bug.data['blocks'])))
+                        ', '.join(map(str, b.data['blocks'])))
                 else:
                     print '  No blocked bugs'
 
 
+class Cache(BugzillaCommand):
+    """Show or clear cached server information."""
+    args = BugzillaCommand.args + [
+        lambda x: x.add_argument('--clear', action='store_true',
+            help='remove all cached information'),
+    ]
+
+    def __call__(self):
+        cache = self.bz.cache
+        if self._args.clear:
+            cache.clear()
+            return
+        print 'Cache directory: {}'.format(cache.path)
+        names = cache.names()
+        if not names:
+            print '  Nothing cached.'
+        for name in names:
+            entry = cache.get(name)
+            if entry is None:
+                continue  # removed or corrupt
+            age = datetime.timedelta(seconds=int(time.time() - entry['time']))
+            print '  {}: {} bytes, validated {} ago'.format(
+                name, cache.size(name), age)
+
+
 @with_add_remove('given users', 'CC List', metavar='USER')
 @with_bugs
 @with_optional_message
 class CC(BugzillaCommand):
     """Show or update CC List."""
+    include_fields = ['cc']
+
     def __call__(self):
         args = self._args
-        bugs = map(self.bz.bug, args.bugs)
         if args.add or args.remove:
-            # get actual users
+            # get actual users, matching them in a single batch
+            self.bz.match_many_users((args.add or []) + (args.remove or []))
             getuser = lambda x: self.bz.match_one_user(x)['name']
             add = map(getuser, args.add) if args.add else None
             remove = map(getuser, args.remove) if args.remove else None
@@ -315,21 +433,19 @@ class CC(BugzillaCommand):
                 if args.message is True else args.message
 
             # update CC list
-            map(
-                lambda x: self.bz.bug(x).update_cc(
-                    add=add,
-                    remove=remove,
-                    comment=message
-                ),
-                args.bugs
+            self.bz.update_bugs(
+                args.bugs,
+                cc=bug.multi_change(add, remove),
+                comment=message
             )
         else:
             # show CC List
-            for bug in bugs:
-                print 'Bug {}:'.format(bug.bugno)
-                if bug.data['cc']:
+            bugs = self.bz.bugs(args.bugs, include_fields=self.include_fields)
+            for b in bugs:
+                print 'Bug {}:'.format(b.bugno)
+                if b.data['cc']:
                     print '  CC List: {}'.format(
-                        ', '.join(map(str, bug.data['cc'])))
+                        ', '.join(map(str, b.data['cc'])))
                 else:
                     print '  0 users'
 
@@ -337,6 +453,7 @@ class CC(BugzillaCommand):
 @with_bugs
 @with_optional_message
 @with_limit(things='comments')
+@with_jobs
 class Comment(BugzillaCommand):
     """List comments or file a comment on the given bugs."""
     args = BugzillaCommand.args + [
@@ -354,6 +471,9 @@ class Comment(BugzillaCommand):
             help='Include empty comments.'),
         lambda x: x.add_argument('--which', type=int, nargs='+', metavar='N',
             help='show only the given comment numbers'),
+        lambda x: x.add_argument('--since', type=date,
+            help='show only comments made after the given date, '
+                 'in format YYYY-MM-DD'),
     ]
 
     formatstring = '{}\nauthor: {creator}\ntime: {time}\n\n{text}\n\n'
@@ -363,29 +483,36 @@ class Comment(BugzillaCommand):
         message = editor.input('Enter your comment.') \
             if args.message is True else args.message
         if message:
-            map(lambda x: self.bz.bug(x).add_comment(message), args.bugs)
+            self.map_bugs(
+                lambda x: self.bz.bug(x).add_comment(message), args.bugs)
         else:
-            def cmtfmt(bug):
-                comments = sorted(
-                    self.bz.bug(bug).comments,
-                    key=lambda x: int(x['id']),
-                    reverse=True  # initially reverse to apply limit
-                )
+            # only retrieve the comments that will be shown
+            since = datetime.datetime.combine(args.since, datetime.time()) \
+                if args.since else None
+            limit = abs(args.limit) if args.limit and not args.which \
+                else None
+            comments = self.bz.comments(
+                args.bugs, new_since=since, limit=limit)
+
+            def cmtfmt(bugno):
+                numbered = bug.number_comments(comments[bugno])
+                numbered.reverse()  # initially reverse to apply limit
 
                 # apply limit, if one given
-                comments = comments[:abs(args.limit)] \
-                    if args.limit else comments
+                numbered = numbered[:abs(args.limit)] \
+                    if args.limit else numbered
 
                 # re-reverse if reversed comments were /not/ wanted
-                comments = reversed(comments) if not args.reverse else comments
+                numbered = reversed(numbered) if not args.reverse \
+                    else numbered
 
                 return '=====\nBUG {}\n\n-----\n{}'.format(
-                    bug,
+                    bugno,
                     '-----\n'.join(
                         self.formatstring.format(
                             'comment: {}'.format(n) if n else 'description',
                             **comment)
-                        for n, comment in enumerate(comments)
+                        for n, comment in numbered
                         if not (args.omit_empty and not comment['text']) \
                             and not (args.which and n not in args.which)
                     )
@@ -399,29 +526,27 @@ class Comment(BugzillaCommand):
 @with_optional_message
 class Depend(BugzillaCommand):
     """Show or update dependencies of given bugs."""
+    include_fields = ['depends_on']
+
     def __call__(self):
         args = self._args
-        bugs = map(self.bz.bug, args.bugs)
         if args.add or args.remove or args.set:
             message = editor.input('Enter your comment.') \
                 if args.message is True else args.message
             # update dependencies
-            map(
-                lambda x: x.update_depend(
-                    add=args.add,
-                    remove=args.remove,
-                    set=args.set,
-                    comment=message
-                ),
-                bugs
+            self.bz.update_bugs(
+                args.bugs,
+                depends_on=bug.multi_change(args.add, args.remove, args.set),
+                comment=message
             )
         else:
             # show dependencies
-            for bug in bugs:
-                print 'Bug {}:'.format(bug.bugno)
-                if bug.data['depends_on']:
+            bugs = self.bz.bugs(args.bugs, include_fields=self.include_fields)
+            for b in bugs:
+                print 'Bug {}:'.format(b.bugno)
+                if b.data['depends_on']:
                     print '  Dependencies: {}'.format(
-                        ', '.join(map(str, bug.data['depends_on'])))
+                        ', '.join(map(str, b.data['depends_on'])))
                 else:
                     print '  No dependencies'
 
@@ -429,23 +554,29 @@ class Depend(BugzillaCommand):
 @with_bugs
 class Desc(BugzillaCommand):
     """Show the description of the given bug(s)."""
+    include_fields = []
     formatstring = 'author: {creator}\ntime: {time}\n\n{text}\n'
 
     def __call__(self):
         def _descfmt(bug):
-            desc = self.bz.bug(bug).comments[0]
+            desc = bug.comments[0]
             return '=====\nBUG {}\n{}'.format(
-                bug,
+                bug.bugno,
                 self.formatstring.format(**desc)
             )
-        print '\n'.join(_descfmt(bug) for bug in self._args.bugs)
+        bugs = self.bz.bugs(
+            self._args.bugs,
+            comments=True,
+            include_fields=self.include_fields
+        )
+        print '\n'.join(_descfmt(bug) for bug in bugs)
 
 
 @with_bugs
 class Dump(BugzillaCommand):
     """Print internal representation of bug data."""
     def __call__(self):
-        bugs = (self.bz.bug(x) for x in self._args.bugs)
+        bugs = self.bz.bugs(self._args.bugs, comments=True)
         print '\n'.join(str((x.data, x.comments)) for x in bugs)
 
 
@@ -461,12 +592,11 @@ class Edit(BugzillaCommand):
     _fields = frozenset(['priority', 'version'])
 
     def __call__(self):
-        for bug in (self.bz.bug(x) for x in self._args.bugs):
-            kwargs = {
-                k: getattr(self._args, k)
-                for k in self._fields & self._args.__dict__.viewkeys()
-            }
-            bug.update(**kwargs)
+        kwargs = {
+            k: getattr(self._args, k)
+            for k in self._fields & self._args.__dict__.viewkeys()
+        }
+        self.bz.update_bugs(self._args.bugs, **kwargs)
 
 
 class Fields(BugzillaCommand):
@@ -503,12 +633,57 @@ def _format_history(history):
     ) for h in history)
 
 
+@with_limit(things='matches', default=20)
+class Grep(BugzillaCommand):
+    """Search the text of mirrored bugs.
+
+    Summaries and comments in the local mirror are searched (see the
+    sync command; comments are only mirrored by ``sync --comments``).
+    Matches contain all the given words, in any order; words in double
+    quotes must appear together as a phrase.  The best matches, those
+    with the most occurrences of the rarest words, are shown first.
+    """
+    args = BugzillaCommand.args + [
+        lambda x: x.add_argument('words', nargs='+', metavar='WORD',
+            help='words to search for'),
+    ]
+
+    def __call__(self):
+        args = self._args
+        query = ' '.join(args.words)
+        terms = set(textindex.words(query))
+        matches = mirror.Mirror.for_bugzilla(self.bz).grep(
+            query, limit=args.limit)
+        for bugno, n, text in matches:
+            # show the first line with a query word
+            lines = text.splitlines() or ['']
+            line = next(
+                (x for x in lines if terms & set(textindex.words(x))),
+                lines[0]
+            ).strip()
+            print 'Bug {} ({}): {}'.format(
+                bugno,
+                'summary' if n == textindex.SUMMARY
+                else 'comment: {}'.format(n) if n else 'description',
+                line if len(line) <= 60 else line[:57] + '...'
+            )
+        print '=> {} match{}'.format(
+            len(matches), 'es' if len(matches) != 1 else '')
+
+
 @with_bugs
 class History(BugzillaCommand):
     """Show the history of the given bugs."""
+    include_fields = []
+
     def __call__(self):
         fields = ('WHO', 'WHEN', 'WHAT', 'REMOVED', 'ADDED')
-        for bug in map(self.bz.bug, self._args.bugs):
+        bugs = self.bz.bugs(
+            self._args.bugs,
+            history=True,
+            include_fields=self.include_fields
+        )
+        for bug in bugs:
             history = []
             for h in bug.history:
                 _history = [
@@ -525,12 +700,15 @@ class History(BugzillaCommand):
 
 
 @with_bugs
+@with_offline
 class Info(BugzillaCommand):
     """Show detailed information about the given bugs."""
+    include_fields = config.show_fields
+
     def __call__(self):
         args = self._args
         fields = config.show_fields
-        for bug in map(self.bz.bug, args.bugs):
+        for bug in self.bugs(args.bugs, include_fields=self.include_fields):
             print 'Bug {}:'.format(bug.bugno)
             fields = config.show_fields & bug.data.viewkeys()
             width = max(map(len, fields)) - min(map(len, fields)) + 2
@@ -540,13 +718,16 @@ class Info(BugzillaCommand):
 
 
 @with_bugs
+@with_offline
 class List(BugzillaCommand):
     """Show a one-line summary of the given bugs."""
+    include_fields = ['summary']
+
     def __call__(self):
         args = self._args
         lens = [len(str(x)) for x in args.bugs]
         width = max(lens) - min(lens) + 2
-        for bug in map(self.bz.bug, args.bugs):
+        for bug in self.bugs(args.bugs, include_fields=self.include_fields):
             print 'Bug {:{}} {}'.format(
                 str(bug.bugno) + ':', width, bug.data['summary']
             )
@@ -662,8 +843,7 @@ class Priority(BugzillaCommand):
     ]
 
     def __call__(self):
-        for bug in (self.bz.bug(x) for x in self._args.bugs):
-            bug.update(priority=self._args.priority)
+        self.bz.update_bugs(self._args.bugs, priority=self._args.priority)
 
 
 class Products(BugzillaCommand):
@@ -711,6 +891,7 @@ class Status(BugzillaCommand):
         lambda x: x.add_argument('--dupe-of', type=int, metavar='BUG',
             help='The bug of which the given bugs are duplicates.'),
     ]
+    include_fields = ['is_open']
 
     def __call__(self):
         args = self._args
@@ -719,13 +900,11 @@ class Status(BugzillaCommand):
 
         if args.dupe_of:
             # This is all we need; --status and --resolution are ignored
-            return map(
-                lambda x: self.bz.bug(x).set_dupe_of(args.dupe_of, message),
-                args.bugs
-            )
+            return self.bz.update_bugs(
+                args.bugs, dupe_of=args.dupe_of, comment=message)
 
         # get the values of the 'bug_status' field
-        values = self.bz.get_field_values('bug_status')
+        index = self.bz.get_field_index()
 
         if args.status:
             status = args.status.upper()
@@ -733,42 +912,38 @@ class Status(BugzillaCommand):
             # choose status
             status = self._ui.choose(
                 'Choose a status',
-                map(lambda x: x['name'], values)
+                map(lambda x: x['name'], index.values('bug_status'))
             )
 
         # check if the new status is "open"
         try:
-            value = filter(lambda x: x['name'] == status, values)[0]
-            is_open = value['is_open']
-        except IndexError:
+            is_open = index.value('bug_status', status)['is_open']
+        except KeyError:
             # no value matching the chosen status
             raise UserWarning("Invalid status:", status)
 
-        # instantiate bugs
-        bugs = map(self.bz.bug, args.bugs)
-
         resolution = None
         if not is_open:
             # The new status accepts a resolution.
             if args.resolution:
                 # A resolution was supplied.
                 resolution = args.resolution.upper()
-            elif any(map(lambda x: x.is_open(), bugs)):
+            elif any(
+                x.is_open() for x in
+                self.bz.bugs(args.bugs, include_fields=self.include_fields)
+            ):
                 # A resolution was not supplied, but one is required since
                 # at least one of the bugs is currently open.  Choose one.
-                values = self.bz.get_field_values('resolution')
                 resolution = self._ui.choose(
                     'Choose a resolution',
-                    map(lambda x: x['name'], values)
+                    map(lambda x: x['name'], index.values('resolution'))
                 )
 
-        return map(
-            lambda x: self.bz.bug(x).set_status(
-                status=status,
-                resolution=resolution,
-                comment=message
-            ),
-            args.bugs
+        return self.bz.update_bugs(
+            args.bugs,
+            status=status,
+            resolution=resolution or None,
+            comment=message
         )
 
 
@@ -785,6 +960,7 @@ def _make_set_argument(arg):
     ]
 
 
+@with_offline
 class Search(BugzillaCommand):
     """Search for bugs matching given criteria.
 
@@ -795,6 +971,7 @@ class Search(BugzillaCommand):
         lambda x: x.add_argument('--summary', nargs='+',
             help='Match summary against any of the given substrings.'),
     ]
+    include_fields = ['summary']
     simple_arguments = ['summary']
     set_arguments = 'product', 'component', 'status', 'resolution', 'version'
     for x in set_arguments:
@@ -811,26 +988,175 @@ class Search(BugzillaCommand):
             if getattr(self._args, arg)
         }
 
-        bugs = list(bug.Bug.search(self.bz, **kwargs))
-        lens = [len(str(b.bugno)) for b in bugs]
+        kwargs['include_fields'] = self.include_fields
+        kwargs['page_size'] = int(self.bz.config.get(
+            'search_page_size', bugzilla.DEFAULT_SEARCH_PAGE_SIZE))
+
+        if self._args.offline:
+            bugs = mirror.Mirror.for_bugzilla(self.bz).search(
+                self.bz, **kwargs)
+        else:
+            bugs = bug.Bug.search(self.bz, **kwargs)
 
-        for _bug in bugs:
+        # print bugs as they arrive; bug numbers are padded to the
+        # widest seen so far
+        n = width = 0
+        for n, _bug in enumerate(bugs, 1):
+            width = max(width, len(str(_bug.bugno)) + 1)
             print 'Bug {:{}} {}'.format(
-                str(_bug.bugno) + ':', max(lens) - min(lens) + 2,
+                str(_bug.bugno) + ':', width,
                 _bug.data['summary']
             )
-        n = len(bugs)
         print '=> {} bug{} matched criteria'.format(n, 's' if n else '')
 
 
+class Sync(BugzillaCommand):
+    """Update the local mirror of bugs.
+
+    Bugs of the given products (or of the products listed in the
+    ``mirror_products`` server config) that changed since the previous
+    sync are retrieved and stored in a local database.  Bugs that left
+    the products are removed, once every ``mirror_reconcile_interval``
+    seconds (default: one day).  The ``info``, ``list`` and ``search``
+    commands use the mirror when given ``--offline``.
+    """
+    args = BugzillaCommand.args + [
+        lambda x: x.add_argument('--product', nargs='+', metavar='PRODUCT',
+            help='Mirror bugs of the given products.'),
+        lambda x: x.add_argument('--comments', action='store_true',
+            help='Mirror the comments of changed bugs.'),
+        lambda x: x.add_argument('--history', action='store_true',
+            help='Mirror the history of changed bugs.'),
+        lambda x: x.add_argument('--full', action='store_true',
+            help='Retrieve all bugs, not only those changed.'),
+    ]
+
+    def __call__(self):
+        args = self._args
+        products = args.product \
+            or self.bz.config.get('mirror_products', '').split()
+        if not products:
+            raise UserWarning('No products given.')
+        n = mirror.Mirror.for_bugzilla(self.bz).sync(
+            self.bz,
+            products,
+            comments=args.comments,
+            history=args.history,
+            full=args.full,
+            page_size=int(self.bz.config.get(
+                'search_page_size', bugzilla.DEFAULT_SEARCH_PAGE_SIZE)),
+            reconcile_interval=float(self.bz.config.get(
+                'mirror_reconcile_interval',
+                mirror.DEFAULT_RECONCILE_INTERVAL))
+        )
+        print '=> {} bug{} updated'.format(n, 's' if n != 1 else '')
+
+
 @with_bugs
+class Tree(BugzillaCommand):
+    """Show the dependency tree of the given bugs.
+
+    The dependencies of the given bugs are crawled a level at a time,
+    retrieving each level in a single request.  Bugs already shown are
+    not expanded again.  Crawled bugs are cached for the number of
+    seconds given by the ``graph_ttl`` config (default: one hour).
+    """
+    args = BugzillaCommand.args + [
+        lambda x: x.add_argument('--up', action='store_const',
+            dest='direction', const='blocks', default='depends_on',
+            help='show the bugs blocked by the given bugs'),
+        lambda x: x.add_argument('--depth', type=int, metavar='N',
+            help='only crawl N levels'),
+        lambda x: x.add_argument('--open-leaves', action='store_true',
+            help='only list the open bugs that depend on no open bug'),
+        lambda x: x.add_argument('--cycles', action='store_true',
+            help='only list dependency cycles'),
+        lambda x: x.add_argument('--refresh', action='store_true',
+            help='ignore cached bugs'),
+    ]
+
+    def __call__(self):
+        args = self._args
+        _graph = graph.DependencyGraph(self.bz, use_cache=not args.refresh)
+        reached = _graph.crawl(args.bugs, args.direction, args.depth)
+        _graph.save()
+        if args.open_leaves:
+            leaves = set()
+            for bugno in args.bugs:
+                leaves |= _graph.open_leaves(bugno)
+            for bugno in sorted(leaves):
+                print '{} {}'.format(bugno, _graph.nodes[bugno].status)
+        elif args.cycles:
+            for cycle in _graph.cycles():
+                print ' '.join(map(str, cycle))
+        else:
+            shown = set()
+            for bugno in args.bugs:
+                self._show(_graph, bugno, reached, shown)
+            print '=> {} bugs, {} open'.format(
+                len(reached),
+                sum(1 for x in reached
+                    if x in _graph.nodes and _graph.is_open(x))
+            )
+
+    def _show(self, _graph, root, reached, shown):
+        stack = [(root, 0)]
+        while stack:
+            bugno, level = stack.pop()
+            node = _graph.nodes.get(bugno)
+            line = '{}{} {}'.format(
+                '  ' * level, bugno, node.status if node else '?')
+            if bugno in shown:
+                print line + ' (see above)'
+                continue
+            print line
+            shown.add(bugno)
+            if node:
+                stack.extend(
+                    (x, level + 1)
+                    for x in sorted(getattr(node, self._args.direction),
+                        reverse=True)
+                    if x in reached
+                )
+
+
 @with_optional_message
 @with_time
 class Time(BugzillaCommand):
-    """Show or adjust times and estimates for the given bugs."""
+    """Show or adjust times and estimates for the given bugs.
+
+    With ``--summary``, show the total times of the given bugs, or of
+    the bugs matching the given criteria.
+    """
+    args = BugzillaCommand.args + [
+        lambda x: x.add_argument('bugs', metavar='BUG', type=int, nargs='*',
+            help='Bug number'),
+        lambda x: x.add_argument('--summary', action='store_true',
+            help='Show the total times of the bugs.'),
+    ]
+    include_fields = ['deadline', 'estimated_time', 'remaining_time']
+    set_arguments = 'product', 'component', 'status'
+    for x in set_arguments:
+        args.extend(_make_set_argument(x))
+
     def __call__(self):
         args = self._args
 
+        criteria = {
+            arg: getattr(args, arg)
+            for arg in itertools.chain(
+                self.set_arguments,
+                ('not_' + x for x in self.set_arguments)
+            )
+            if getattr(args, arg)
+        }
+        if args.summary:
+            return self.summary(criteria)
+        if criteria:
+            raise UserWarning('Search criteria require --summary.')
+        if not args.bugs:
+            raise UserWarning('No bugs given.')
+
         message = editor.input('Enter your comment.') if args.message is True \
             else args.message
 
@@ -853,8 +1179,9 @@ class Time(BugzillaCommand):
             #
             # As of Bugzilla 4.0.1, "actual_time" (total hours worked) is
             # not returned in bug.get.  It can, however, be calculated from
-            # the bug history.
-            bugs = (self.bz.bug(bug) for bug in args.bugs)
+            # the bug history, which is retrieved in the same batch.
+            bugs = self.bz.bugs(
+                args.bugs, history=True, include_fields=self.include_fields)
             for bug in bugs:
                 # if user is not in the "time-tracking" group, the fields will
                 # be absent from bug data.  first check that they're there.
@@ -868,6 +1195,27 @@ class Time(BugzillaCommand):
                 print '  Deadline:       {}'.format(bug.data['deadline'])
                 print '  Time worked:    {}'.format(bug.actual_time())
 
+    def summary(self, criteria):
+        if self._args.bugs:
+            criteria['id'] = self._args.bugs
+        if not criteria:
+            raise UserWarning('No bugs or criteria given.')
+        bugs = table.BugTable.search(
+            self.bz, ['estimated_time', 'remaining_time'], **criteria)
+        if len(bugs) and not bugs.count(estimated_time=table.is_present):
+            # time fields are absent if the user is not in the
+            # "time-tracking" group
+            print 'User is not in the time-tracking group.'
+            return
+        history = self.bz.history(bugs.column('id'))
+        print 'Bugs:           {}'.format(len(bugs))
+        print 'Estimated time: {}'.format(bugs.sum('estimated_time'))
+        print 'Remaining time: {}'.format(bugs.sum('remaining_time'))
+        print 'Time worked:    {}'.format(sum(
+            x[2] for changes in history.viewvalues()
+            for x in bug.work_times(changes)
+        ))
+
 
 # the list got too long; metaprogram it ^_^
 commands = filter(
@@ -0,0 +1,213 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The graph of dependencies between bugs.
+
+The graph is crawled breadth-first from given bugs, retrieving each
+level in a single batch and only the fields needed.  Crawled bugs are
+cached on disk, so that repeated queries over the same tree do not
+retrieve it again.
+"""
+
+import collections
+import time
+
+
+# fields retrieved for each bug
+FIELDS = ['blocks', 'depends_on', 'status']
+
+# directions in which the graph can be crawled
+DIRECTIONS = frozenset(['blocks', 'depends_on'])
+
+# seconds before cached bugs are retrieved again
+DEFAULT_GRAPH_TTL = 60 * 60
+
+Node = collections.namedtuple('Node', ['status', 'blocks', 'depends_on'])
+
+
+class DependencyGraph(object):
+    """Dependencies between bugs, crawled from a Bugzilla."""
+
+    __slots__ = ['bz', 'nodes', 'missing', '_times', '_is_open']
+
+    def __init__(self, bz, use_cache=True):
+        """Create a graph, with the bugs cached for the Bugzilla.
+
+        Cached bugs older than the ``graph_ttl`` config are ignored.
+        """
+        self.bz = bz
+        self.nodes = {}  # bug number -> Node
+        self.missing = set()  # bugs that do not exist or are private
+        self._times = {}  # bug number -> time retrieved
+        self._is_open = None
+        entry = bz.cache.get('graph') if use_cache else None
+        if entry is not None:
+            ttl = float(bz.config.get('graph_ttl', DEFAULT_GRAPH_TTL))
+            now = time.time()
+            for bugno, (when, status, blocks, depends_on) \
+                    in entry['value'].viewitems():
+                if now - when < ttl:
+                    self.nodes[int(bugno)] = \
+                        Node(status, tuple(blocks), tuple(depends_on))
+                    self._times[int(bugno)] = when
+
+    def save(self):
+        """Write the crawled bugs to the cache."""
+        value = {
+            bugno: [self._times[bugno]] + list(node)
+            for bugno, node in self.nodes.viewitems()
+        }
+        try:
+            self.bz.cache.set('graph', value)
+        except EnvironmentError:
+            pass  # the cache is only an optimisation
+
+    def crawl(self, bugnos, direction='depends_on', depth=None):
+        """Crawl the graph from the given bugs.
+
+        direction: ``depends_on`` to crawl down to dependencies,
+                   ``blocks`` to crawl up to blocked bugs
+        depth: if given, the number of levels to crawl
+
+        Each level of bugs not yet known is retrieved in a single batch.
+        Bugs that do not exist or cannot be accessed are added to
+        ``missing`` instead of ``nodes``, and not crawled further.
+        Return the set of bugs reached, including the given bugs.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError('Invalid direction: {}.'.format(direction))
+        reached = set(bugnos)
+        frontier = sorted(reached)
+        level = 0
+        while frontier:
+            self._retrieve([
+                x for x in frontier
+                if x not in self.nodes and x not in self.missing
+            ])
+            frontier = sorted(
+                set(
+                    x for bugno in frontier if bugno in self.nodes
+                    for x in getattr(self.nodes[bugno], direction)
+                ) - reached
+            )
+            if depth is not None and level == depth:
+                break
+            reached.update(frontier)
+            level += 1
+        return reached
+
+    def _retrieve(self, bugnos):
+        if not bugnos:
+            return
+        now = time.time()
+        bugs = self.bz.bugs(bugnos, include_fields=FIELDS, permissive=True)
+        self.missing.update(set(bugnos) - set(x.bugno for x in bugs))
+        for _bug in bugs:
+            self.nodes[_bug.bugno] = Node(
+                _bug.data['status'],
+                tuple(_bug.data['blocks']),
+                tuple(_bug.data['depends_on']),
+            )
+            self._times[_bug.bugno] = now
+
+    def is_open(self, bugno):
+        """Return True if the bug has an open status."""
+        if self._is_open is None:
+            index = self.bz.get_field_index()
+            self._is_open = {
+                x['name']: x['is_open'] for x in index.values('bug_status')
+            }
+        return self._is_open.get(self.nodes[bugno].status, True)
+
+    def closure(self, bugno, direction='depends_on'):
+        """Return the set of bugs reachable from a bug, excluding itself.
+
+        Only crawled bugs are considered.
+        """
+        reached = set()
+        stack = [bugno]
+        while stack:
+            node = self.nodes.get(stack.pop())
+            if node is None:
+                continue  # not crawled
+            for x in getattr(node, direction):
+                if x not in reached:
+                    reached.add(x)
+                    stack.append(x)
+        reached.discard(bugno)
+        return reached
+
+    def open_leaves(self, bugno):
+        """Return the open bugs under a bug that depend on no open bug.
+
+        These are the bugs that can be worked on now.  Only crawled bugs
+        are considered.
+        """
+        return set(
+            x for x in self.closure(bugno) | set([bugno])
+            if x in self.nodes and self.is_open(x) and not any(
+                y in self.nodes and self.is_open(y)
+                for y in self.nodes[x].depends_on
+            )
+        )
+
+    def cycles(self):
+        """Return the dependency cycles among the crawled bugs.
+
+        Each cycle is a sorted list of the bugs that depend on each
+        other, directly or indirectly.
+        """
+        # Tarjan's strongly connected components, without recursion
+        index, lowlink, on_stack = {}, {}, set()
+        stack, components = [], []
+        for root in sorted(self.nodes):
+            if root in index:
+                continue
+            work = [(root, iter(self._successors(root)))]
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                bugno, successors = work[-1]
+                for x in successors:
+                    if x not in index:
+                        index[x] = lowlink[x] = len(index)
+                        stack.append(x)
+                        on_stack.add(x)
+                        work.append((x, iter(self._successors(x))))
+                        break
+                    elif x in on_stack:
+                        lowlink[bugno] = min(lowlink[bugno], index[x])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[bugno])
+                    if lowlink[bugno] == index[bugno]:
+                        component = []
+                        while True:
+                            x = stack.pop()
+                            on_stack.discard(x)
+                            component.append(x)
+                            if x == bugno:
+                                break
+                        if len(component) > 1 \
+                                or bugno in self.nodes[bugno].depends_on:
+                            components.append(sorted(component))
+        return sorted(components)
+
+    def _successors(self, bugno):
+        return [x for x in self.nodes[bugno].depends_on if x in self.nodes]
@@ -0,0 +1,104 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Indexes over server metadata."""
+
+import collections
+
+
+def _sortkey(value):
+    return int(value.get('sortkey', -1))
+
+
+class FieldIndex(object):
+    """Index of bug field information, as returned by ``Bug.fields``.
+
+    The index is built once; lookups of fields, of field values by
+    name, and of (sorted, filtered) value lists do not scan the
+    field information.
+    """
+
+    __slots__ = ['fields', '_fields', '_values', '_lists', '_dependents']
+
+    def __init__(self, fields):
+        """Build the index from a list of field dicts."""
+        self.fields = fields
+        self._fields = {}
+        self._values = {}
+        self._lists = {}
+        self._dependents = collections.defaultdict(list)
+        for field in fields:
+            names = set([field['name'], field.get('api_name', field['name'])])
+            for name in names:
+                self._fields[name] = field
+            if 'values' in field:
+                values = field['values']
+                named = [x for x in values if 'name' in x]
+                by_name = {x['name']: x for x in named}
+                for name in names:
+                    self._values[name] = by_name
+                    self._lists[name, False, False] = values
+                    self._lists[name, True, False] = named
+                    self._lists[name, False, True] = \
+                        sorted(values, key=_sortkey)
+                    self._lists[name, True, True] = sorted(named, key=_sortkey)
+            for controller in set(filter(None, [
+                field.get('visibility_field'),
+                field.get('value_field'),
+            ])):
+                self._dependents[controller].append(field)
+
+    def field(self, name):
+        """Return the named field.  Raise KeyError if there is none."""
+        return self._fields[name]
+
+    def value(self, name, value_name):
+        """Return the named value of the named field.
+
+        Raise KeyError if there is no such field or value.
+        """
+        return self._values[name][value_name]
+
+    def value_names(self, name):
+        """Return the names of the legal values of the named field."""
+        return self._values[name].viewkeys()
+
+    def values(self, name, sort=True, omit_empty=True, visible_for=None):
+        """Return the legal values for a field; a list of dicts.
+
+        See ``bzlib.bugzilla.Bugzilla.get_field_values``.  The lists
+        returned are shared; callers must not modify them.
+        """
+        values = self._lists[name, bool(omit_empty), bool(sort)]
+        value_field = self._fields[name].get('value_field')
+        if visible_for and value_field and value_field in visible_for:
+            # the controlling values, hashable; a multi-select field
+            # makes visible the values of any of its values
+            controlling = visible_for[value_field]
+            if not isinstance(controlling, (list, tuple, set, frozenset)):
+                controlling = [controlling]
+            key = name, bool(omit_empty), bool(sort), frozenset(controlling)
+            if key not in self._lists:
+                self._lists[key] = [
+                    x for x in values
+                    if not key[3].isdisjoint(x.get('visibility_values', []))
+                ]
+            values = self._lists[key]
+        return values
+
+    def dependents(self, name):
+        """Return the fields whose visibility or values depend on a field."""
+        return self._dependents.get(name, [])
@@ -0,0 +1,358 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Local SQLite mirror of bugs.
+
+The mirror holds the data (and optionally the comments and history) of
+the bugs of selected products.  Each sync only retrieves the bugs whose
+``last_change_time`` has advanced since the previous sync of the
+product; bugs that left a product (e.g. moved to a product that is
+not mirrored) are found by a periodic reconciliation of the bug numbers
+of the product.  Searches use the ``Bug.search`` vocabulary.  The text of
+summaries and comments is indexed for full-text search (see
+``bzlib.textindex``).
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+from . import bug
+from . import protocol
+from . import textindex
+
+
+# columns of the bug table, other than id and data
+COLUMNS = sorted(bug.SEARCH_FIELDS - frozenset(['id']))
+
+# search fields matched as "at this time or later"
+TIME_FIELDS = frozenset(['creation_time', 'last_change_time'])
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# seconds between reconciliations of the bugs of a product
+DEFAULT_RECONCILE_INTERVAL = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bug (
+    id INTEGER PRIMARY KEY,
+    {},
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS comments (
+    bug_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    bug_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync (
+    product TEXT PRIMARY KEY,
+    last_change_time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reconcile (
+    product TEXT PRIMARY KEY,
+    time REAL NOT NULL
+);
+""".format(',\n    '.join(x + ' TEXT' for x in COLUMNS))
+
+
+def _encode(value):
+    return json.dumps(value, default=str)
+
+
+def _decode_datetimes(obj):
+    for key in protocol.DATETIME_FIELDS.intersection(obj):
+        if isinstance(obj[key], basestring):
+            try:
+                obj[key] = datetime.datetime.strptime(obj[key], TIME_FORMAT)
+            except ValueError:
+                pass  # not a date after all
+    return obj
+
+
+def _decode(data):
+    """Decode stored data; dates become ``datetime`` objects again."""
+    return json.loads(data, object_hook=_decode_datetimes)
+
+
+def _column(value):
+    """Return the value of a bug field as stored in a column."""
+    if isinstance(value, list):
+        return ','.join(map(unicode, value))
+    if value is None or isinstance(value, basestring):
+        return value
+    return unicode(value)
+
+
+class Mirror(object):
+    """A local SQLite replica of bugs."""
+
+    __slots__ = ['path', 'text', '_db']
+
+    @classmethod
+    def for_bugzilla(cls, bz):
+        """Return the Mirror for the given Bugzilla."""
+        return cls(os.path.join(bz.cache.path, 'mirror.sqlite'))
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:' and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), 0700)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        self.text = textindex.TextIndex(self._db)
+
+    def close(self):
+        self._db.close()
+
+    def last_sync(self, product):
+        """Return the newest change time mirrored for the product, or None."""
+        row = self._db.execute(
+            'SELECT last_change_time FROM sync WHERE product = ?',
+            (product,)
+        ).fetchone()
+        return datetime.datetime.strptime(row[0], TIME_FORMAT) if row else None
+
+    def sync(
+        self,
+        bz,
+        products,
+        comments=False,
+        history=False,
+        full=False,
+        page_size=None,
+        reconcile_interval=DEFAULT_RECONCILE_INTERVAL
+    ):
+        """Bring the mirror of the given products up to date.
+
+        Only bugs changed since the previous sync of each product are
+        retrieved, unless ``full`` is true.  Bugs no longer in a product
+        are removed; unless all bugs were retrieved, they are looked for
+        only once every ``reconcile_interval`` seconds, by retrieving the
+        bug numbers of the product.  Return the number of bugs updated.
+        """
+        n = 0
+        for product in products:
+            kwargs = {'product': [product], 'page_size': page_size}
+            since = None if full else self.last_sync(product)
+            if since is not None:
+                # Bugzilla matches "at this time or later"
+                kwargs['last_change_time'] = since
+            newest = since
+            bugnos = []
+            with self._db:
+                for _bug in bug.Bug.search(bz, **kwargs):
+                    self._store(_bug.data)
+                    bugnos.append(_bug.bugno)
+                    changed = _bug.data['last_change_time']
+                    if newest is None or changed > newest:
+                        newest = changed
+                if newest is not None:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO sync VALUES (?, ?)',
+                        (product, newest.strftime(TIME_FORMAT))
+                    )
+            if since is None:
+                self._reconcile(product, bugnos)  # all bugs retrieved
+            elif self._reconcile_due(product, reconcile_interval):
+                self._reconcile(product, [
+                    x.bugno for x in bug.Bug.search(
+                        bz,
+                        product=[product],
+                        include_fields=['id'],
+                        page_size=page_size
+                    )
+                ])
+            if bugnos and (comments or history):
+                self._sync_details(bz, bugnos, comments, history)
+            n += len(bugnos)
+        return n
+
+    def _reconcile_due(self, product, interval):
+        row = self._db.execute(
+            'SELECT time FROM reconcile WHERE product = ?', (product,)
+        ).fetchone()
+        return row is None or time.time() - row[0] >= interval
+
+    def _reconcile(self, product, bugnos):
+        """Remove the mirrored bugs of a product that are not given."""
+        bugnos = set(bugnos)
+        with self._db:
+            for (bugno,) in self._db.execute(
+                    'SELECT id FROM bug WHERE product = ?', (product,)
+            ).fetchall():
+                if bugno not in bugnos:
+                    self.remove(bugno)
+            self._db.execute(
+                'INSERT OR REPLACE INTO reconcile VALUES (?, ?)',
+                (product, time.time())
+            )
+
+    def remove(self, bugno):
+        """Remove a bug, and its comments and history, from the mirror."""
+        for table, column in \
+                ('bug', 'id'), ('comments', 'bug_id'), ('history', 'bug_id'):
+            self._db.execute(
+                'DELETE FROM {} WHERE {} = ?'.format(table, column), (bugno,))
+        self.text.remove(bugno)
+
+    def _sync_details(self, bz, bugnos, comments, history):
+        bugs = bz.bugs(
+            bugnos, comments=comments, history=history, include_fields=[])
+        with self._db:
+            for _bug in bugs:
+                if comments:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO comments VALUES (?, ?)',
+                        (_bug.bugno, _encode(_bug.comments))
+                    )
+                    self.text.index_comments(_bug.bugno, _bug.comments)
+                if history:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO history VALUES (?, ?)',
+                        (_bug.bugno, _encode(_bug.history))
+                    )
+
+    def _store(self, data):
+        self._db.execute(
+            'INSERT OR REPLACE INTO bug (id, {}, data) VALUES (?, {}, ?)'
+            .format(', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+            [int(data['id'])]
+            + [_column(data.get(x)) for x in COLUMNS]
+            + [_encode(data)]
+        )
+        self.text.index_summary(int(data['id']), data.get('summary'))
+
+    def reindex(self):
+        """Rebuild the text index from the mirrored bugs."""
+        with self._db:
+            for bugno, summary in \
+                    self._db.execute('SELECT id, summary FROM bug').fetchall():
+                self.text.index_summary(bugno, summary)
+            for bugno, data in self._db.execute(
+                    'SELECT bug_id, data FROM comments').fetchall():
+                self.text.index_comments(bugno, _decode(data))
+
+    def grep(self, query, limit=None):
+        """Return the mirrored summaries and comments matching a query.
+
+        See ``textindex.TextIndex.search`` for queries and ranking.  The
+        text index is built first if the mirror predates it.
+
+        Return a list of (bug number, comment number, text) triples,
+        best match first.  The comment number of a summary is
+        ``textindex.SUMMARY``.
+        """
+        if not len(self.text) \
+                and self._db.execute('SELECT 1 FROM bug').fetchone():
+            self.reindex()
+        results = self.text.search(query)[:limit]
+        comments = {}
+        for _, bugno, n in results:
+            if n != textindex.SUMMARY and bugno not in comments:
+                row = self._db.execute(
+                    'SELECT data FROM comments WHERE bug_id = ?', (bugno,)
+                ).fetchone()
+                comments[bugno] = dict(bug.number_comments(_decode(row[0])))
+        return [
+            (
+                bugno, n,
+                comments[bugno][n]['text'] if n != textindex.SUMMARY
+                else self._db.execute(
+                    'SELECT summary FROM bug WHERE id = ?', (bugno,)
+                ).fetchone()[0]
+            )
+            for _, bugno, n in results
+        ]
+
+    def _bug(self, bz, bugno, data):
+        """Construct a Bug from mirrored data, comments and history."""
+        _bug = bug.Bug(bz, _decode(data))
+        for table in 'comments', 'history':
+            row = self._db.execute(
+                'SELECT data FROM {} WHERE bug_id = ?'.format(table),
+                (bugno,)
+            ).fetchone()
+            if row:
+                setattr(_bug, table, _decode(row[0]))
+        return _bug
+
+    def bugs(self, bz, bugnos):
+        """Return mirrored Bugs in the order of the given bug numbers.
+
+        Raise KeyError if a bug is not mirrored.
+        """
+        bugs = []
+        for bugno in bugnos:
+            row = self._db.execute(
+                'SELECT data FROM bug WHERE id = ?', (bugno,)).fetchone()
+            if row is None:
+                raise KeyError(bugno)
+            bugs.append(self._bug(bz, bugno, row[0]))
+        return bugs
+
+    def search(self, bz, **kwargs):
+        """Return mirrored bugs matching the search criteria.
+
+        Criteria are given as for ``bug.Bug.search``; projection and
+        paging arguments are accepted and ignored.
+        """
+        for arg in 'include_fields', 'exclude_fields', 'page_size':
+            kwargs.pop(arg, None)
+        limit = kwargs.pop('limit', None)
+        offset = kwargs.pop('offset', None)
+        where, params = [], []
+        for key, value in kwargs.viewitems():
+            negate = key.startswith('not_')
+            field = key[4:] if negate else key
+            if field not in bug.SEARCH_FIELDS:
+                raise TypeError('Invalid keyword argument: {}.'.format(key))
+            if negate and field in kwargs:
+                continue  # "in" criterion takes precedence
+            values = value if isinstance(value, (list, tuple)) else [value]
+            if field in TIME_FIELDS:
+                where.append('{} >= ?'.format(field))
+                params.append(_column(min(values)))
+            elif field == 'summary':
+                where.append('({})'.format(' OR '.join(
+                    "summary LIKE ? ESCAPE '\\'" for x in values)))
+                params.extend(
+                    '%{}%'.format(
+                        x.replace('\\', '\\\\')
+                        .replace('%', '\\%').replace('_', '\\_'))
+                    for x in values
+                )
+            else:
+                where.append('{} {}IN ({})'.format(
+                    field,
+                    'NOT ' if negate else '',
+                    ', '.join('?' * len(values))
+                ))
+                params.extend(
+                    int(x) if field == 'id' else _column(x) for x in values)
+        query = 'SELECT id, data FROM bug'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY id'
+        if limit or offset:
+            query += ' LIMIT ? OFFSET ?'
+            params.extend([limit or -1, offset or 0])
+        rows = self._db.execute(query, params).fetchall()
+        return [self._bug(bz, bugno, data) for bugno, data in rows]
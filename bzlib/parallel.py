@@ -0,0 +1,255 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Concurrent application of functions, in threads."""
+
+import Queue
+import threading
+import time
+
+# time.strptime imports this module on first use, which is not thread
+# safe; import it up front for threads that parse dates
+import _strptime
+
+
+def pmap(fn, items, jobs=1):
+    """Apply a function to each item, using up to ``jobs`` threads.
+
+    Exceptions raised by the function are collected rather than
+    propagated.  Return a list of ``(value, exception)`` pairs in the
+    order of the items; ``exception`` is None if the function returned
+    normally, and ``value`` is None if it did not.
+    """
+    items = list(items)
+    results = [None] * len(items)
+
+    def run(i):
+        try:
+            results[i] = fn(items[i]), None
+        except Exception as e:
+            results[i] = None, e
+
+    if jobs <= 1 or len(items) <= 1:
+        map(run, range(len(items)))
+        return results
+
+    queue = Queue.Queue()
+    map(queue.put, range(len(items)))
+
+    def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except Queue.Empty:
+                return
+            run(i)
+
+    threads = [
+        threading.Thread(target=worker)
+        for _ in range(min(jobs, len(items)))
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        # join with a timeout so that KeyboardInterrupt is delivered
+        while thread.is_alive():
+            thread.join(0.1)
+    return results
+
+
+class TimeoutError(Exception):
+    pass
+
+
+class Future(object):
+    """The result of a function called in another thread.
+
+    The result becomes available when the call returns.
+    """
+
+    __slots__ = ['_done', '_value', '_exception', '_callbacks', '_lock']
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _set(self, value, exception):
+        with self._lock:
+            self._value = value
+            self._exception = exception
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def set_result(self, value):
+        self._set(value, None)
+
+    def set_exception(self, exception):
+        self._set(None, exception)
+
+    def done(self):
+        return self._done.is_set()
+
+    def add_done_callback(self, fn):
+        """Call a function with the future once it is done.
+
+        If the future is already done, the function is called at once.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def exception(self, timeout=None):
+        """Wait for the call; return the exception it raised, or None.
+
+        Raise TimeoutError if the call is not done within ``timeout``
+        seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        # wait with a timeout so that KeyboardInterrupt is delivered
+        while not self._done.wait(0.1):
+            if deadline is not None and time.time() >= deadline:
+                raise TimeoutError('call not done in {}s'.format(timeout))
+        return self._exception
+
+    def result(self, timeout=None):
+        """Wait for the call; return its value, or raise its exception.
+
+        Raise TimeoutError if the call is not done within ``timeout``
+        seconds.
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._value
+
+
+class Executor(object):
+    """Call functions in a pool of up to ``jobs`` threads.
+
+    Threads are started as functions are submitted, and exit once
+    ``shutdown()`` is called.
+    """
+
+    __slots__ = ['jobs', '_queue', '_threads', '_lock']
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn, *args, **kwargs):
+        """Call a function in the pool; return a Future of its result."""
+        future = Future()
+        with self._lock:
+            if self._threads is None:
+                raise RuntimeError('cannot submit after shutdown')
+            self._queue.put((future, fn, args, kwargs))
+            if len(self._threads) < self.jobs:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def _worker(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            future, fn, args, kwargs = work
+            try:
+                value = fn(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(value)
+
+    def shutdown(self, wait=True):
+        """Stop the threads once the functions submitted are done."""
+        with self._lock:
+            threads, self._threads = self._threads or [], None
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads if wait else []:
+            while thread.is_alive():
+                thread.join(0.1)
+
+
+_DONE = object()  # the end of the items of ``prefetch``
+
+
+def prefetch(iterable, ahead=1):
+    """Generate the items of an iterable, produced ahead in a thread.
+
+    Up to ``ahead`` items are produced before they are consumed, so
+    that producing items (e.g. retrieving pages of search results)
+    overlaps with consuming them.  An exception raised by the iterable
+    is raised when the items before it have been consumed.
+    """
+    queue = Queue.Queue(maxsize=ahead)
+    stopped = threading.Event()
+
+    def put(entry):
+        # give up once the consumer is gone
+        while not stopped.is_set():
+            try:
+                queue.put(entry, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((_DONE, e))
+        else:
+            put((_DONE, None))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            try:
+                item, exception = queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            if item is _DONE:
+                if exception is not None:
+                    raise exception
+                return
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,262 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Protocols of the Bugzilla web services.
+
+Bugzilla offers its web services over XML-RPC, JSON-RPC and (since
+5.0) REST; JSON payloads are much smaller than XML-RPC.  The proxy for
+each protocol has the interface of ``xmlrpclib.ServerProxy``: an RPC
+is made by calling the method of that name, e.g.
+``getattr(proxy, 'Bug.get')(params)``, and a failed RPC raises an
+``xmlrpclib.Fault``.  Results are the same whatever the protocol.
+
+The JSON protocols have no ``system.multicall``; their proxies make
+the calls of a multicall one after another.
+"""
+
+import datetime
+import functools
+import itertools
+import json
+import re
+import urllib
+import urlparse
+import xmlrpclib
+
+
+DEFAULT_PROTOCOL = 'xmlrpc'
+
+# fields holding dates, which JSON represents as strings
+DATETIME_FIELDS = frozenset([
+    'creation_time', 'last_audit_time', 'last_change_time', 'time', 'when',
+])
+
+_DATETIME = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z?$')
+
+# REST resources of RPC methods: HTTP method and path.  Paths with an
+# ``{id}`` refer to a single bug; other bugs are requested separately,
+# unless the method is in ``REST_COMBINED``.
+REST_ROUTES = {
+    'Bug.add_comment': ('POST', 'bug/{id}/comment'),
+    'Bug.comments': ('GET', 'bug/{id}/comment'),
+    'Bug.create': ('POST', 'bug'),
+    'Bug.fields': ('GET', 'field/bug'),
+    'Bug.get': ('GET', 'bug'),
+    'Bug.history': ('GET', 'bug/{id}/history'),
+    'Bug.search': ('GET', 'bug'),
+    'Bug.update': ('PUT', 'bug/{id}'),
+    'Bugzilla.last_audit_time': ('GET', 'last_audit_time'),
+    'Bugzilla.version': ('GET', 'version'),
+    'Product.get': ('GET', 'product'),
+    'Product.get_accessible_products': ('GET', 'product_accessible'),
+    'User.get': ('GET', 'user'),
+    'User.login': ('GET', 'login'),
+    'User.logout': ('GET', 'logout'),
+}
+
+# methods whose path bug and ``ids`` param are combined by the server
+REST_COMBINED = frozenset(['Bug.update'])
+
+
+class _Encoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.strftime('%Y-%m-%dT%H:%M:%SZ')
+        if isinstance(o, xmlrpclib.Binary):
+            return o.data.encode('base64')
+        return json.JSONEncoder.default(self, o)
+
+
+def _decode_datetimes(obj):
+    for key in DATETIME_FIELDS.intersection(obj):
+        match = isinstance(obj[key], basestring) and _DATETIME.match(obj[key])
+        if match:
+            obj[key] = datetime.datetime(*map(int, match.groups()))
+    return obj
+
+
+def dumps(value):
+    """Encode a value as JSON; dates become strings."""
+    return _Encoder().encode(value)
+
+
+def loads(data):
+    """Decode JSON; the values of ``DATETIME_FIELDS`` become dates."""
+    return json.loads(data, object_hook=_decode_datetimes)
+
+
+def _query_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _query(params):
+    """Encode params as an URL query; lists become repeated params."""
+    return urllib.urlencode([
+        (k, _query_value(x))
+        for k, v in sorted(params.viewitems())
+        for x in (v if isinstance(v, (list, tuple)) else [v])
+    ])
+
+
+def _merge(results):
+    """Merge the results of a method called separately for several bugs."""
+    merged = results[0]
+    for result in results[1:]:
+        for k, v in result.viewitems():
+            if isinstance(v, list):
+                merged.setdefault(k, []).extend(v)
+            elif isinstance(v, dict):
+                merged.setdefault(k, {}).update(v)
+    return merged
+
+
+class _JSONProxy(object):
+    """Base of the proxies for the JSON protocols.
+
+    Subclasses make an RPC with ``_call(method, params=None)``.
+    """
+
+    __slots__ = ['_host', '_path', '_transport']
+
+    def __init__(self, url, transport):
+        parsed = urlparse.urlparse(url)
+        self._host = parsed.netloc
+        self._path = parsed.path
+        self._transport = transport
+
+    def __getattr__(self, method):
+        if method == 'system.multicall':
+            return self._multicall
+        return functools.partial(self._call, method)
+
+    def _multicall(self, calls):
+        results = []
+        for call in calls:
+            try:
+                results.append(
+                    [self._call(call['methodName'], *call['params'])])
+            except xmlrpclib.Fault as e:
+                results.append(
+                    {'faultCode': e.faultCode, 'faultString': e.faultString})
+        return results
+
+    def _request(self, method, path, body=None):
+        """Make an HTTP request; return the decoded JSON response."""
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        status, reason, data = self._transport.http_request(
+            self._host, method, self._path + path, body, headers)
+        try:
+            response = loads(data)
+        except ValueError:
+            response = None
+        if not isinstance(response, dict):
+            raise xmlrpclib.ProtocolError(
+                self._host + self._path + path, status, reason, {})
+        error = response.get('error')
+        if error:
+            if error is True:
+                error = response  # REST errors are in the response
+            raise xmlrpclib.Fault(error.get('code'), error.get('message'))
+        return response
+
+
+class JSONRPCProxy(_JSONProxy):
+    """Proxy for the JSON-RPC web services (``jsonrpc.cgi``).
+
+    Each request has an id, which the response must carry.
+    """
+
+    __slots__ = ['_ids']
+
+    def __init__(self, url, transport):
+        super(JSONRPCProxy, self).__init__(url, transport)
+        self._ids = itertools.count(1)
+
+    def _call(self, method, params=None):
+        request_id = next(self._ids)
+        response = self._request('POST', 'jsonrpc.cgi', dumps({
+            'version': '1.1',
+            'method': method,
+            'params': [params or {}],
+            'id': request_id,
+        }))
+        if response.get('id') != request_id:
+            raise xmlrpclib.ResponseError(
+                'response id {!r} does not match request id {}'.format(
+                    response.get('id'), request_id))
+        return response['result']
+
+
+class RESTProxy(_JSONProxy):
+    """Proxy for the REST web services (``rest.cgi``)."""
+
+    __slots__ = []
+
+    def _call(self, method, params=None):
+        try:
+            http_method, path = REST_ROUTES[method]
+        except KeyError:
+            raise xmlrpclib.Fault(
+                -32601, 'Method not available over REST: {}'.format(method))
+        params = dict(params or {})
+        if method == 'Bug.get':
+            params['id'] = params.pop('ids')  # a search by bug number
+        if '{id}' not in path:
+            return self._send(http_method, path, params)
+        ids = params.pop('ids', None) or [params.pop('id')]
+        if method in REST_COMBINED:
+            params['ids'] = ids
+            ids = ids[:1]
+        return _merge([
+            self._send(http_method, path.format(id=x), params) for x in ids])
+
+    def _send(self, http_method, path, params):
+        if http_method == 'GET':
+            return self._request('GET', 'rest.cgi/{}?{}'.format(
+                path, _query(params)))
+        return self._request(
+            http_method, 'rest.cgi/' + path, dumps(params))
+
+
+PROTOCOLS = {
+    'jsonrpc': JSONRPCProxy,
+    'rest': RESTProxy,
+    'xmlrpc': lambda url, transport: xmlrpclib.ServerProxy(
+        url + 'xmlrpc.cgi', transport=transport, use_datetime=True),
+}
+
+
+def server_proxy(protocol, url, transport):
+    """Return the proxy for the web services of a Bugzilla.
+
+    protocol: a key of ``PROTOCOLS``
+    url: the base URL of the Bugzilla, ending in '/'
+    transport: a ``bzlib.transport.Transport``
+    """
+    try:
+        cls = PROTOCOLS[protocol]
+    except KeyError:
+        raise ValueError('Unknown protocol: {}.'.format(protocol))
+    # httplib explodes if url is unicode
+    return cls(str(url), transport)
@@ -0,0 +1,279 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Column-wise storage of bug data for bulk analysis.
+
+A ``BugTable`` holds the values of each field in a column rather than a
+dict per bug.  Numeric fields are stored in arrays and fields with few
+distinct values are dictionary-encoded: each distinct value is stored
+once and the column holds an integer code per bug.  Filtering and
+grouping on an encoded column compare codes, and only evaluate criteria
+once per distinct value.
+"""
+
+import array
+import collections
+import math
+
+from . import bug
+from . import bugzilla
+
+
+# numeric fields, and the array type codes of their columns
+ARRAY_FIELDS = {
+    'id': 'l',
+    'estimated_time': 'd',
+    'remaining_time': 'd',
+    'actual_time': 'd',
+    'percentage_complete': 'd',
+}
+
+# dictionary-encoded fields
+ENCODED_FIELDS = bug.INTERNED_FIELDS
+
+
+def is_present(value):
+    """Return False if a value is missing (None, or NaN in a column).
+
+    A criterion of ``filter`` and ``count``, e.g.
+    ``count(estimated_time=is_present)``.
+    """
+    return value is not None \
+        and not (isinstance(value, float) and math.isnan(value))
+
+
+class _ArrayColumn(object):
+    """A column of numbers.  Missing floats are NaN; missing ints, 0."""
+
+    __slots__ = ['values']
+
+    def __init__(self, typecode, values=()):
+        self.values = array.array(typecode, values)
+
+    def append(self, value):
+        if value is None:
+            value = float('nan') if self.values.typecode == 'd' else 0
+        self.values.append(value)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def take(self, indices):
+        values = self.values
+        return _ArrayColumn(values.typecode, (values[i] for i in indices))
+
+    def select(self, test):
+        return [i for i, x in enumerate(self.values) if test(x)]
+
+    def encoded(self):
+        return self.values, None
+
+
+class _EncodedColumn(object):
+    """A dictionary-encoded column."""
+
+    __slots__ = ['values', 'codes', '_index']
+
+    def __init__(self, values=None, index=None, codes=()):
+        self.values = values if values is not None else []  # by code
+        self._index = index if index is not None else {}  # value -> code
+        self.codes = array.array('i', codes)
+
+    def append(self, value):
+        if isinstance(value, list):
+            value = tuple(value)  # lists are not hashable
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def take(self, indices):
+        # the dictionary is shared; it only grows
+        codes = self.codes
+        return _EncodedColumn(
+            self.values, self._index, (codes[i] for i in indices))
+
+    def select(self, test):
+        # evaluate the test once per distinct value
+        matches = [test(x) for x in self.values]
+        return [i for i, code in enumerate(self.codes) if matches[code]]
+
+    def encoded(self):
+        return self.codes, self.values
+
+
+class _ListColumn(object):
+    """A column of arbitrary values."""
+
+    __slots__ = ['values']
+
+    def __init__(self, values=()):
+        self.values = list(values)
+
+    def append(self, value):
+        self.values.append(value)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def take(self, indices):
+        values = self.values
+        return _ListColumn(values[i] for i in indices)
+
+    def select(self, test):
+        return [i for i, x in enumerate(self.values) if test(x)]
+
+    def encoded(self):
+        return self.values, None
+
+
+def _column(field):
+    if field in ARRAY_FIELDS:
+        return _ArrayColumn(ARRAY_FIELDS[field])
+    if field in ENCODED_FIELDS:
+        return _EncodedColumn()
+    return _ListColumn()
+
+
+def _test(criterion):
+    """Return a function that tests a value against a criterion.
+
+    A criterion is a function, a collection of values or a value.
+    """
+    if callable(criterion):
+        return criterion
+    if isinstance(criterion, (list, tuple, set, frozenset)):
+        values = frozenset(criterion)
+        return lambda x: x in values
+    return lambda x: x == criterion
+
+
+class BugTable(object):
+    """Bug data stored column-wise.
+
+    Each bug is a row; ``id`` is always a column.  Rows are returned as
+    tuples of the type given by ``bug.row_type(fields)``.
+    """
+
+    __slots__ = ['fields', '_columns', '_len']
+
+    @classmethod
+    def search(cls, bz, fields, page_size=None, **kwargs):
+        """Build a table from the results of a search.
+
+        fields: the fields of the table; only these are retrieved
+        page_size: the number of results retrieved at a time; default
+                   is the ``search_page_size`` config
+
+        Search criteria are given as for ``bug.Bug.search``.  Results
+        are added to the table a page at a time, without creating
+        ``Bug`` objects.
+        """
+        table = cls(fields)
+        page_size = page_size or int(bz.config.get(
+            'search_page_size', bugzilla.DEFAULT_SEARCH_PAGE_SIZE))
+        kwargs = bug.search_args(bz, include_fields=table.fields, **kwargs)
+        for page in bug.search_pages(bz, page_size, **kwargs):
+            table.extend(page)
+        return table
+
+    def __init__(self, fields, bugs=()):
+        """Create a table with the given fields, from bug data dicts."""
+        self.fields = bug.row_type(fields)._fields
+        self._columns = {x: _column(x) for x in self.fields}
+        self._len = 0
+        self.extend(bugs)
+
+    def _subset(self, indices):
+        """Return a table of the rows at the given indices."""
+        table = BugTable.__new__(BugTable)
+        table.fields = self.fields
+        table._columns = {
+            k: v.take(indices) for k, v in self._columns.viewitems()}
+        table._len = len(indices)
+        return table
+
+    def append(self, data):
+        """Add a bug, given as a data dict."""
+        for field, column in self._columns.viewitems():
+            column.append(data.get(field))
+        self._len += 1
+
+    def extend(self, bugs):
+        """Add bugs, given as data dicts."""
+        for data in bugs:
+            self.append(data)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        row = bug.row_type(self.fields)
+        columns = [self._columns[x] for x in self.fields]
+        for i in xrange(self._len):
+            yield row._make(column[i] for column in columns)
+
+    def column(self, field):
+        """Return the values of a field, as a list."""
+        column = self._columns[field]
+        return [column[i] for i in xrange(self._len)]
+
+    def filter(self, **criteria):
+        """Return a table of the rows matching all the given criteria.
+
+        Criteria are given as keyword args, each field a function, a
+        collection of values or a value.
+        """
+        indices = None
+        for field, criterion in criteria.viewitems():
+            selected = self._columns[field].select(_test(criterion))
+            indices = selected if indices is None \
+                else sorted(set(indices).intersection(selected))
+        if indices is None:
+            return self
+        return self._subset(indices)
+
+    def count(self, **criteria):
+        """Return the number of rows matching all the given criteria."""
+        return len(self.filter(**criteria)) if criteria else self._len
+
+    def count_by(self, field):
+        """Return a dict mapping the values of a field to row counts."""
+        codes, values = self._columns[field].encoded()
+        counts = collections.Counter(codes)
+        if values is None:
+            return dict(counts)
+        return {values[code]: n for code, n in counts.viewitems()}
+
+    def group_by(self, field):
+        """Return a dict mapping the values of a field to tables."""
+        codes, values = self._columns[field].encoded()
+        groups = collections.defaultdict(list)
+        for i, code in enumerate(codes):
+            groups[code].append(i)
+        return {
+            values[code] if values is not None else code:
+                self._subset(indices)
+            for code, indices in groups.viewitems()
+        }
+
+    def sum(self, field):
+        """Return the sum of a numeric field, ignoring missing values."""
+        return sum(filter(is_present, self._columns[field].values))
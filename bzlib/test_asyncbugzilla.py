@@ -0,0 +1,77 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import unittest
+import xmlrpclib
+
+from . import asyncbugzilla
+from . import test_bugzilla
+
+
+class AsyncBugzillaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+        self.release = threading.Event()
+        self.bz = test_bugzilla._FakeBugzilla(self.respond)
+        self.abz = asyncbugzilla.AsyncBugzilla(self.bz, jobs=3)
+
+    def tearDown(self):
+        self.release.set()
+        self.abz.close()
+
+    def respond(self, method, **params):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        self.release.wait(5)
+        with self.lock:
+            self.active -= 1
+        if method == 'Bug.search':
+            ids = range(1, 11)[params['offset']:][:params['limit']]
+            return {'bugs': [{'id': x} for x in ids]}
+        return test_bugzilla._respond_bugs(method, params.get('ids'))
+
+    def test_in_flight(self):
+        futures = [self.abz.bugs([x]) for x in range(1, 6)]
+        self.assertFalse(any(x.done() for x in futures))
+        self.release.set()
+        self.assertEqual(
+            [b.bugno for x in futures for b in x.result()], range(1, 6))
+        self.assertEqual(self.peak, 3)
+
+    def test_batches_per_thread(self):
+        # a batch open in this thread must not capture the RPCs of others
+        self.release.set()
+        with self.bz.batch():
+            result = self.abz.rpc('Bug', 'get', ids=[1]).result()
+            pending = self.bz.rpc('Bug', 'get', ids=[2])
+        self.assertEqual(result['bugs'][0]['id'], 1)
+        self.assertEqual(pending.result()['bugs'][0]['id'], 2)
+
+    def test_fault(self):
+        self.release.set()
+        future = self.abz.rpc('Bug', 'fields')
+        with self.assertRaises(xmlrpclib.Fault):
+            future.result()
+
+    def test_search(self):
+        self.release.set()
+        bugs = self.abz.search(page_size=4)
+        self.assertEqual([b.bugno for b in bugs], range(1, 11))
+        self.assertEqual(
+            [c['offset'] for m, c in self.bz.calls], [0, 4, 8])
@@ -15,11 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
 import socket
 import unittest
 
 from . import bugzilla
 from . import bug
+from . import test_bugzilla
 
 
 class BugTestCase(unittest.TestCase):
@@ -45,3 +47,254 @@ class BugTestCase(unittest.TestCase):
                 self.bz,
                 **{field: 'not_' + 'foo' for field in fields}
             )
+
+
+class ProjectionTestCase(unittest.TestCase):
+    def setUp(self):
+        def respond(method, ids, include_fields=None, exclude_fields=None):
+            data = {'id': ids[0], 'summary': 'foo', 'cc': ['bar']}
+            if include_fields is not None:
+                data = {k: data[k] for k in include_fields}
+            if exclude_fields is not None:
+                data = {k: data[k] for k in data if k not in exclude_fields}
+            return {'bugs': [data]}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+
+    def test_projection(self):
+        self.assertEqual(
+            bug.projection(include_fields=['summary']),
+            {'include_fields': ['id', 'summary']}
+        )
+        self.assertEqual(
+            bug.projection(exclude_fields=['id', 'cc']),
+            {'exclude_fields': ['cc']}
+        )
+        self.assertEqual(bug.projection(), {})
+
+    def test_missing_fields(self):
+        b = self.bz.bug(1, include_fields=['summary'])
+        self.assertEqual(b.data['summary'], 'foo')
+        self.assertNotIn('cc', b.data)
+        self.assertEqual(len(self.bz.calls), 1)
+        self.assertEqual(b.data['cc'], ['bar'])
+        self.assertEqual(self.bz.calls[1], (
+            'Bug.get', {'ids': [1], 'exclude_fields': ['id', 'summary']}))
+        with self.assertRaises(KeyError):
+            b.data['bogus']
+        self.assertEqual(len(self.bz.calls), 2)
+
+
+class SearchPagesTestCase(unittest.TestCase):
+    def setUp(self):
+        def respond(method, limit, offset, **kwargs):
+            ids = range(1, 11)[offset:offset + limit]
+            return {'bugs': [{'id': x} for x in ids]}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+
+    def _pages(self):
+        return [(c['offset'], c['limit']) for _, c in self.bz.calls]
+
+    def test_pages(self):
+        bugs = bug.Bug.search(self.bz, product='foo', page_size=4)
+        self.assertEqual(self.bz.calls, [])  # nothing until iterated
+        self.assertEqual([b.bugno for b in bugs], range(1, 11))
+        self.assertEqual(self._pages(), [(0, 4), (4, 4), (8, 4)])
+
+    def test_pages_limit_offset(self):
+        bugs = bug.Bug.search(self.bz, page_size=4, limit=5, offset=2)
+        self.assertEqual([b.bugno for b in bugs], range(3, 8))
+        self.assertEqual(self._pages(), [(2, 4), (6, 1)])
+
+
+class ApplyUpdateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'id': 1, 'status': 'NEW', 'is_open': True, 'cc': ['a', 'b'],
+            'blocks': [2], 'estimated_time': 1.5, 'deadline': None,
+        }
+
+        def respond(method, ids, **kwargs):
+            if method == 'Bug.get':
+                data = {
+                    k: v for k, v in self.data.viewitems()
+                    if k not in kwargs.get('exclude_fields', [])
+                }
+                return {'bugs': [data]}
+            elif method == 'Bug.history':
+                return {'bugs': [{'id': 1, 'history': []}]}
+            return {'bugs': [{'id': 1, 'last_change_time': 't', 'changes': {
+                'status': {'removed': 'NEW', 'added': 'RESOLVED'},
+                'cc': {'removed': 'a', 'added': 'c, d'},
+                'blocks': {'removed': '', 'added': '3'},
+                'estimated_time': {'removed': '1.5', 'added': '2.00'},
+                'deadline': {'removed': '', 'added': '2013-12-01'},
+            }}]}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+
+    def test_apply_update(self):
+        b = self.bz.bug(1)
+        b.data, b.history
+        b.update(cc={'add': ['c', 'd'], 'remove': ['a']})
+        self.assertEqual(
+            [method for method, _ in self.bz.calls],
+            ['Bug.get', 'Bug.history', 'Bug.update']
+        )
+        self.assertEqual(b.data['status'], 'RESOLVED')
+        self.assertEqual(b.data['cc'], ['b', 'c', 'd'])
+        self.assertEqual(b.data['blocks'], [2, 3])
+        self.assertEqual(b.data['estimated_time'], 2.0)
+        self.assertEqual(len(b.history), 1)
+        self.assertEqual(b.history[0]['when'], 't')
+        self.assertEqual(len(b.history[0]['changes']), 5)
+        self.assertEqual(len(self.bz.calls), 3)
+
+        # is_open and deadline are retrieved again
+        self.data.update(is_open=False, deadline='2013-12-01')
+        self.assertFalse(b.is_open())
+        self.assertEqual(b.data['deadline'], '2013-12-01')
+        self.assertEqual(self.bz.calls[3][0], 'Bug.get')
+        self.assertEqual(
+            sorted(self.bz.calls[3][1]['exclude_fields']),
+            ['blocks', 'cc', 'estimated_time', 'id', 'status']
+        )
+        self.assertEqual(len(self.bz.calls), 4)
+
+    def test_apply_update_unreported(self):
+        b = self.bz.bug(1)
+        b.data, b.history
+        b.apply_update({'id': 1})
+        self.assertIsNone(b._data)
+        self.assertIsNone(b._history)
+
+
+class WorkTimesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.history = [
+            {'when': 1, 'who': 'a', 'changes': [
+                {'field_name': 'work_time', 'removed': '', 'added': '1.5'},
+                {'field_name': 'status', 'removed': 'NEW', 'added': 'FIXED'},
+            ]},
+            {'when': 2, 'who': 'b', 'changes': [
+                {'field_name': 'work_time', 'removed': '', 'added': '2.00'},
+            ]},
+        ]
+
+        def respond(method, ids, **kwargs):
+            if method == 'Bug.history':
+                return {'bugs': [{'id': 1, 'history': self.history}]}
+            return {'bugs': [{'id': 1, 'changes': {
+                'work_time': {'removed': '', 'added': '0.5'},
+            }}]}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+
+    def test_work_times(self):
+        self.assertEqual(
+            bug.work_times(self.history), [(1, 'a', 1.5), (2, 'b', 2.0)])
+
+    def test_actual_time(self):
+        b = self.bz.bug(1)
+        self.assertEqual(b.actual_time(), 3.5)
+        self.assertEqual(b.actual_time(), 3.5)
+        self.assertEqual(len(self.bz.calls), 1)
+        b.update(work_time=0.5)
+        self.assertEqual(b.actual_time(), 4.0)
+        b.history = []
+        self.assertEqual(b.actual_time(), 0)
+
+
+class NewCommentsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.comments = {1: [], 2: []}
+
+        def respond(method, ids=None, new_since=None, **kwargs):
+            if method == 'Bug.add_comment':
+                return self._add(kwargs['id'], kwargs['comment'], 1)
+            return {'bugs': {str(x): {'comments': [
+                c for c in self.comments[x]
+                if new_since is None or c['time'] > new_since
+            ]} for x in ids}}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+
+    def _add(self, bugno, text, second=0):
+        id = len(self.comments[1]) + len(self.comments[2]) + 1
+        self.comments[bugno].append({
+            'id': id, 'text': text,
+            'time': datetime.datetime(2013, 1, 1, 0, 0, second),
+        })
+        return {'id': id}
+
+    def test_new_comments(self):
+        self._add(1, 'a')
+        b = self.bz.bug(1)
+        self.assertEqual([x['text'] for x in b.comments], ['a'])
+        self._add(1, 'b')  # same second as 'a'
+        self._add(1, 'c', 1)
+        self.assertEqual([x['text'] for x in b.new_comments()], ['b', 'c'])
+        self.assertEqual(
+            self.bz.calls[-1][1]['new_since'],
+            datetime.datetime(2012, 12, 31, 23, 59, 59)
+        )
+        b.add_comment('d')  # same second as 'c'
+        self.assertEqual(
+            [x['text'] for x in b.comments], ['a', 'b', 'c', 'd'])
+        self.assertEqual(
+            self.bz.calls[-1][1]['new_since'],
+            datetime.datetime(2013, 1, 1, 0, 0, 0)
+        )
+
+    def test_new_comments_batched(self):
+        self._add(1, 'a')
+        self._add(2, 'b')
+        bugs = [self.bz.bug(1), self.bz.bug(2), self.bz.bug(2)]
+        bugs[0].comments
+        self._add(1, 'c')
+        new = self.bz.new_comments(bugs)
+        self.assertEqual(
+            [[x['text'] for x in comments] for comments in new],
+            [['c'], ['b'], ['b']]
+        )
+        self.assertEqual(self.bz.calls[-1], ('system.multicall', 2))
+
+
+class CompactTestCase(unittest.TestCase):
+    def setUp(self):
+        def respond(method, **kwargs):
+            # build new strings for each bug, as decoding does
+            return {'bugs': [
+                {'id': x, ''.join(['sta', 'tus']): ''.join(['NE', 'W'])}
+                for x in (1, 2)
+            ]}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+
+    def test_slots(self):
+        b = self.bz.bug(1)
+        self.assertFalse(hasattr(b, '__dict__'))
+
+    def test_compact(self):
+        a, b = bug.Bug.search(self.bz)
+        [(key_a, status_a)] = \
+            [(k, v) for k, v in a.data.viewitems() if k == 'status']
+        [(key_b, status_b)] = \
+            [(k, v) for k, v in b.data.viewitems() if k == 'status']
+        self.assertIs(key_a, key_b)
+        self.assertIs(status_a, status_b)
+
+    def test_compact_bounded(self):
+        bug.compact({'summary': u'a summary seen once'})
+        self.assertNotIn(u'a summary seen once', bug._interned)
+        for i in range(bug.INTERN_TABLE_SIZE + 1):
+            bug.compact({'status': unicode(i)})
+        self.assertLessEqual(len(bug._interned), bug.INTERN_TABLE_SIZE)
+
+    def test_rows(self):
+        with self.assertRaises(TypeError):
+            bug.Bug.search(self.bz, rows=True)
+        rows = bug.Bug.search(
+            self.bz, rows=True, include_fields=['status', 'summary'])
+        self.assertEqual(rows, [(1, 'NEW', None), (2, 'NEW', None)])
+        self.assertEqual(rows[0].status, 'NEW')
+        self.assertIs(type(rows[0]), bug.row_type(['summary', 'status']))
+        self.assertEqual(
+            self.bz.calls[-1][1]['include_fields'],
+            ['id', 'status', 'summary']
+        )
@@ -14,12 +14,17 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
 import itertools
 import os
+import shutil
 import tempfile
 import unittest
+import xmlrpclib
 
+from . import bug
 from . import bugzilla
+from . import cache
 from . import config
 
 
@@ -145,3 +150,377 @@ class FromConfigTestCase(unittest.TestCase):
         kwargs = {k: None for k in mandatory_args}
         bz = bugzilla.Bugzilla.from_config(self._conf, **kwargs)
         self.assertEqual(bz.url, 'http://bugzilla.example.com/')
+
+
+class _FakeBugzilla(bugzilla.Bugzilla):
+    """A Bugzilla that records RPCs and answers them with ``respond``.
+
+    ``respond`` is called with the method name and the RPC parameters
+    (less credentials).  ``system.multicall`` is handled by the fake
+    itself, unless ``multicall`` is false (or a Fault to raise).  The
+    fake does not issue login tokens, unless ``_token`` is reset to
+    None.
+    """
+    __slots__ = ['calls', 'respond', 'multicall']
+
+    def __init__(self, respond, multicall=True, **config):
+        super(_FakeBugzilla, self).__init__(
+            'http://bugzilla.example.com/', 'u', 'p', **config)
+        self.calls = []
+        self.respond = respond
+        self.multicall = multicall
+        self._token = False
+
+    def _call(self, method, *params):
+        if method == 'system.multicall':
+            self.calls.append((method, len(params[0])))
+            if isinstance(self.multicall, xmlrpclib.Fault):
+                raise self.multicall
+            if not self.multicall:
+                raise xmlrpclib.Fault(-32601, 'no such method')
+            results = []
+            for call in params[0]:
+                try:
+                    results.append(
+                        [self._respond(call['methodName'], call['params'][0])])
+                except xmlrpclib.Fault as e:
+                    results.append({
+                        'faultCode': e.faultCode,
+                        'faultString': e.faultString,
+                    })
+            return results
+        params = dict(params[0])
+        self.calls.append((method, self._strip(params)))
+        return self._respond(method, params)
+
+    def _strip(self, params):
+        return {k: v for k, v in params.viewitems() if k[:9] != 'Bugzilla_'}
+
+    def _respond(self, method, params):
+        return self.respond(method, **self._strip(params))
+
+
+def _respond_bugs(method, ids):
+    if method == 'Bug.get':
+        return {'bugs': [{'id': x, 'summary': str(x)} for x in ids]}
+    elif method == 'Bug.comments':
+        return {'bugs': {str(x): {'comments': [{'text': x}]} for x in ids}}
+    elif method == 'Bug.history':
+        return {'bugs': [{'id': x, 'history': []} for x in ids]}
+    elif method == 'Bug.update':
+        return {'bugs': [{'id': x, 'changes': {}} for x in ids]}
+    raise xmlrpclib.Fault(-32601, 'no such method')
+
+
+class BugsTestCase(unittest.TestCase):
+    def test_bugs(self):
+        bz = _FakeBugzilla(_respond_bugs, multicall=False, chunk_size='2')
+        bugs = bz.bugs([5, 3, 1, 3, 4])
+        self.assertEqual(bz.calls, [
+            ('system.multicall', 2),
+            ('Bug.get', {'ids': [1, 3]}),
+            ('Bug.get', {'ids': [4, 5]}),
+        ])
+        self.assertEqual([b.bugno for b in bugs], [5, 3, 1, 3, 4])
+        self.assertEqual([b.data['summary'] for b in bugs], list('53134'))
+
+    def test_bugs_batched(self):
+        bz = _FakeBugzilla(_respond_bugs, chunk_size='2')
+        bugs = bz.bugs([5, 3, 1], comments=True, history=True)
+        self.assertEqual(bz.calls, [('system.multicall', 6)])
+        self.assertEqual([b.comments[0]['text'] for b in bugs], [5, 3, 1])
+        self.assertEqual([b.history for b in bugs], [[], [], []])
+
+
+class UpdateBugsTestCase(unittest.TestCase):
+    def test_update_bugs(self):
+        bz = _FakeBugzilla(
+            lambda method, ids, **changes: _respond_bugs(method, ids),
+            multicall=False,
+            chunk_size='2'
+        )
+        result = bz.update_bugs(
+            [3, 1, 2, 1], status='RESOLVED', resolution=None, comment='x')
+        changes = {'status': 'RESOLVED', 'comment': {'body': 'x'}}
+        self.assertEqual(bz.calls, [
+            ('system.multicall', 2),
+            ('Bug.update', dict(ids=[1, 2], **changes)),
+            ('Bug.update', dict(ids=[3], **changes)),
+        ])
+        self.assertEqual([x['id'] for x in result], [1, 2, 3])
+
+    def test_update_bugs_nothing(self):
+        bz = _FakeBugzilla(_respond_bugs)
+        self.assertEqual(bz.update_bugs([1, 2], status=None, comment=''), [])
+        self.assertEqual(bz.calls, [])
+
+
+class CommentsTestCase(unittest.TestCase):
+    def setUp(self):
+        day = lambda n: datetime.datetime(2013, 1, 1) \
+            + datetime.timedelta(days=n)
+        # bug 1 is commented daily; bug 2 was last commented long ago
+        self.comments = {
+            1: [{'id': n, 'time': day(n), 'count': n} for n in range(100)],
+            2: [
+                {'id': 1000 + n, 'time': day(n), 'count': n}
+                for n in range(3)
+            ],
+        }
+        self.counted = True  # False: as servers before Bugzilla 4.4
+        self.last_change_time = {1: day(99), 2: day(300)}
+
+        def respond(method, ids, new_since=None, include_fields=None):
+            if method == 'Bug.get':
+                return {'bugs': [
+                    {'id': x, 'last_change_time': self.last_change_time[x]}
+                    for x in ids
+                ]}
+            return {'bugs': {str(x): {'comments': [
+                c if self.counted
+                else {k: v for k, v in c.viewitems() if k != 'count'}
+                for c in reversed(self.comments[x])
+                if new_since is None or c['time'] > new_since
+            ]} for x in ids}}
+        self.bz = _FakeBugzilla(respond)
+
+    def _ids(self, comments):
+        return {k: [x['id'] for x in v] for k, v in comments.viewitems()}
+
+    def test_comments(self):
+        comments = self.bz.comments([2, 1, 2])
+        self.assertEqual(self.bz.calls, [('Bug.comments', {'ids': [1, 2]})])
+        self.assertEqual(self._ids(comments), {
+            1: range(100),
+            2: range(1000, 1003),
+        })
+
+    def test_comments_limit(self):
+        comments = self.bz.comments([1, 2], limit=3)
+        self.assertEqual(
+            [method for method, _ in self.bz.calls],
+            ['Bug.get', 'system.multicall', 'system.multicall', 'Bug.comments']
+        )
+        ids = self._ids(comments)
+        self.assertEqual(ids[1][-3:], [97, 98, 99])
+        self.assertLess(len(ids[1]), 100)
+        self.assertEqual(ids[2], range(1000, 1003))
+
+    def test_comments_new_since(self):
+        since = datetime.datetime(2013, 1, 2)
+        comments = self.bz.comments([1, 2], new_since=since, limit=3)
+        ids = self._ids(comments)
+        self.assertEqual(ids[1][-3:], [97, 98, 99])
+        self.assertEqual(ids[2], [1002])
+        # bug 2 is not retrieved again after reaching new_since
+        self.assertEqual(self.bz.calls[-1], ('Bug.comments', {
+            'ids': [2], 'new_since': since}))
+
+    def test_comments_uncounted(self):
+        # comments without count are only numbered right in the full list
+        self.counted = False
+        since = datetime.datetime(2013, 1, 2)
+        comments = self.bz.comments([1, 2], new_since=since, limit=3)
+        self.assertEqual(self.bz.calls[-1], ('Bug.comments', {
+            'ids': [1, 2]}))
+        self.assertEqual(
+            [(n, c['id']) for n, c in bug.number_comments(comments[1])][-2:],
+            [(98, 98), (99, 99)]
+        )
+        self.assertEqual(
+            [(n, c['id']) for n, c in bug.number_comments(comments[2])],
+            [(2, 1002)]
+        )
+
+
+class HistoryTestCase(unittest.TestCase):
+    def test_history(self):
+        bz = _FakeBugzilla(_respond_bugs, chunk_size='2')
+        self.assertEqual(bz.history([3, 1, 2]), {1: [], 2: [], 3: []})
+        self.assertEqual(bz.calls, [('system.multicall', 2)])
+
+
+TOKEN_FAULT = (
+    'The cookies or token provide were not valid or have expired. You '
+    'may login again to get new cookies or a new token.'
+)
+
+
+class _TokenBugzilla(_FakeBugzilla):
+    """A fake that issues login tokens and rejects expired ones."""
+    __slots__ = ['credentials', 'tokens', 'expired', 'issue']
+
+    def __init__(self, *args, **kwargs):
+        super(_TokenBugzilla, self).__init__(*args, **kwargs)
+        self._token = None
+        self.credentials = []
+        self.tokens = 0
+        self.expired = set()
+        self.issue = True
+
+    def _respond(self, method, params):
+        self.credentials.append(
+            {k: v for k, v in params.viewitems() if k[:9] == 'Bugzilla_'})
+        if method == 'User.login':
+            if not self.issue:
+                return {'id': 1}  # as before Bugzilla 4.4.3
+            self.tokens += 1
+            return {'id': 1, 'token': 'token{}'.format(self.tokens)}
+        if params.get('Bugzilla_token') in self.expired:
+            raise xmlrpclib.Fault(32000, TOKEN_FAULT)
+        return super(_TokenBugzilla, self)._respond(method, params)
+
+
+class LoginTestCase(unittest.TestCase):
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self.bz = self._bugzilla()
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+    def _bugzilla(self, **config):
+        bz = _TokenBugzilla(_respond_bugs, **config)
+        bz.cache = cache.Cache(self._path)
+        return bz
+
+    def test_token(self):
+        self.bz.rpc('Bug', 'get', ids=[1])
+        self.bz.rpc('Bug', 'get', ids=[2])
+        self.assertEqual(
+            [method for method, _ in self.bz.calls],
+            ['User.login', 'Bug.get', 'Bug.get']
+        )
+        self.assertEqual(self.bz.calls[0][1], {'login': 'u', 'password': 'p'})
+        self.assertEqual(
+            self.bz.credentials[1:], [{'Bugzilla_token': 'token1'}] * 2)
+
+        # the token is reused by the next session
+        bz = self._bugzilla()
+        bz.bugs([1, 2], comments=True)
+        self.assertEqual(bz.calls, [('system.multicall', 2)])
+        self.assertEqual(bz.credentials, [{'Bugzilla_token': 'token1'}] * 2)
+
+    def test_token_expired(self):
+        self.bz.rpc('Bug', 'get', ids=[1])
+        self.bz.expired.add('token1')
+        self.bz.rpc('Bug', 'get', ids=[1])
+        self.bz.expired.add('token2')
+        with self.bz.batch():
+            result = self.bz.rpc('Bug', 'get', ids=[1])
+            self.bz.rpc('Bug', 'comments', ids=[1])
+        self.assertEqual(result.result()['bugs'][0]['id'], 1)
+        self.assertEqual([method for method, _ in self.bz.calls], [
+            'User.login', 'Bug.get',
+            'Bug.get', 'User.login', 'Bug.get',
+            'system.multicall', 'User.login', 'system.multicall',
+        ])
+        self.assertEqual(self.bz.cache.get('token')['value'], 'token3')
+
+    def test_token_expired_mixed(self):
+        # only the call rejected for its token is made again
+        updates, rejected = [], []
+
+        def respond(method, ids, **params):
+            if ids == [2] and not rejected:
+                rejected.append(2)
+                raise xmlrpclib.Fault(32000, TOKEN_FAULT)
+            updates.append(ids[0])
+            return _respond_bugs(method, ids)
+        bz = _TokenBugzilla(respond, chunk_size='1')
+        bz.cache = cache.Cache(self._path)
+        result = bz.update_bugs([1, 2, 3], comment='hello')
+        self.assertEqual([x['id'] for x in result], [1, 2, 3])
+        self.assertEqual(updates, [1, 3, 2])  # each applied once
+        self.assertEqual([method for method, _ in bz.calls], [
+            'User.login', 'system.multicall', 'User.login', 'Bug.update'])
+        self.assertEqual(bz.calls[-1][1]['ids'], [2])
+
+    def test_other_fault(self):
+        # Bugzilla's generic error code is not taken for a bad token
+        updates = []
+
+        def respond(method, ids, **params):
+            if ids == [2]:
+                raise xmlrpclib.Fault(32000, 'Something went wrong.')
+            updates.append(ids[0])
+            return _respond_bugs(method, ids)
+        bz = _TokenBugzilla(respond, chunk_size='1')
+        bz.cache = cache.Cache(self._path)
+        with self.assertRaises(xmlrpclib.Fault):
+            bz.update_bugs([1, 2, 3], comment='hello')
+        self.assertEqual(updates, [1, 3])
+        self.assertEqual(
+            [method for method, _ in bz.calls],
+            ['User.login', 'system.multicall'])
+        self.assertEqual(bz.cache.get('token')['value'], 'token1')
+
+    def test_no_token(self):
+        self.bz.issue = False
+        self.bz.rpc('Bug', 'get', ids=[1])
+        self.bz.rpc('Bug', 'get', ids=[1])
+        self.assertEqual(
+            [method for method, _ in self.bz.calls],
+            ['User.login', 'Bug.get', 'Bug.get']
+        )
+        self.assertEqual(self.bz.credentials[-1], {
+            'Bugzilla_login': 'u', 'Bugzilla_password': 'p'})
+        self.assertIsNone(self.bz.cache.get('token'))
+
+    def test_api_key(self):
+        bz = self._bugzilla(api_key='secret')
+        bz.rpc('Bug', 'get', ids=[1])
+        self.assertEqual(bz.calls, [('Bug.get', {'ids': [1]})])
+        self.assertEqual(bz.credentials, [{'Bugzilla_api_key': 'secret'}])
+
+
+class BatchTestCase(unittest.TestCase):
+    def test_batch(self):
+        bz = _FakeBugzilla(_respond_bugs)
+        with bz.batch():
+            a = bz.rpc('Bug', 'get', ids=[1])
+            b = bz.rpc('Bug', 'bogus', ids=[1])
+            with self.assertRaises(bugzilla.BatchError):
+                a.result()
+        self.assertEqual(bz.calls, [('system.multicall', 2)])
+        self.assertEqual(a.result()['bugs'][0]['id'], 1)
+        with self.assertRaises(xmlrpclib.Fault):
+            b.result()
+
+    def test_batch_fallback(self):
+        bz = _FakeBugzilla(_respond_bugs, multicall=False)
+        for i in range(2):
+            with bz.batch():
+                a = bz.rpc('Bug', 'get', ids=[1])
+                b = bz.rpc('Bug', 'bogus', ids=[1])
+            self.assertEqual(a.result()['bugs'][0]['id'], 1)
+            with self.assertRaises(xmlrpclib.Fault):
+                b.result()
+        # multicall is only attempted once
+        self.assertEqual(
+            [method for method, _ in bz.calls],
+            ['system.multicall'] + ['Bug.get', 'Bug.bogus'] * 2
+        )
+
+    def test_batch_transient_fault(self):
+        bz = _FakeBugzilla(
+            _respond_bugs, multicall=xmlrpclib.Fault(32000, 'busy'))
+        for i in range(2):
+            with bz.batch():
+                a = bz.rpc('Bug', 'get', ids=[1])
+                b = bz.rpc('Bug', 'get', ids=[2])
+            self.assertEqual(b.result()['bugs'][0]['id'], 2)
+        # the fault does not say multicall is missing; try it again
+        self.assertEqual(
+            [method for method, _ in bz.calls],
+            ['system.multicall', 'Bug.get', 'Bug.get'] * 2
+        )
+
+    def test_batch_exception(self):
+        bz = _FakeBugzilla(_respond_bugs)
+        with self.assertRaises(ValueError):
+            with bz.batch():
+                a = bz.rpc('Bug', 'get', ids=[1])
+                raise ValueError
+        self.assertEqual(bz.calls, [])
+        self.assertFalse(a.done())
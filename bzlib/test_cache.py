@@ -0,0 +1,97 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from . import cache
+from . import test_bugzilla
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self.cache = cache.Cache(os.path.join(self._path, 'server'), 'u', 'p')
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+    def test_cache(self):
+        self.assertEqual(self.cache.names(), [])
+        self.assertIsNone(self.cache.get('foo'))
+        self.cache.set('foo', [1, 2], extra='bar')
+        entry = self.cache.get('foo')
+        self.assertEqual(entry['value'], [1, 2])
+        self.assertEqual(entry['extra'], 'bar')
+        self.assertEqual(self.cache.names(), ['foo'])
+        self.cache.clear()
+        self.assertEqual(self.cache.names(), [])
+
+    def test_corrupt(self):
+        self.cache.set('foo', 1)
+        with open(self.cache._file('foo'), 'w') as fh:
+            fh.write('{')
+        self.assertIsNone(self.cache.get('foo'))
+
+    def test_for_server(self):
+        a = cache.Cache.for_server('http://a.example.com/', 'u')
+        b = cache.Cache.for_server('http://a.example.com/', 'v')
+        self.assertNotEqual(a.path, b.path)
+        self.assertEqual(os.path.dirname(a.path), cache.cache_home())
+
+
+class BugzillaCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self.audit_time = '20130101T00:00:00'
+
+        def respond(method, **kwargs):
+            if method == 'Bugzilla.last_audit_time':
+                return {'last_audit_time': self.audit_time}
+            return {'fields': [{'name': 'foo'}]}
+
+        self.bz = test_bugzilla._FakeBugzilla(respond, cache_ttl='3600')
+        self.bz.cache = cache.Cache(self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+    def _methods(self):
+        return [method for method, _ in self.bz.calls]
+
+    def test_fresh(self):
+        self.assertEqual(self.bz.get_fields(), [{'name': 'foo'}])
+        self.bz._fields = None  # simulate a new process
+        self.assertEqual(self.bz.get_fields(), [{'name': 'foo'}])
+        self.assertEqual(
+            self._methods(), ['Bugzilla.last_audit_time', 'Bug.fields'])
+
+    def test_revalidate(self):
+        self.bz.get_fields()
+        self.bz.config['cache_ttl'] = '-1'
+        self.bz._fields = None
+        self.bz.get_fields()
+        self.assertEqual(self._methods(), [
+            'Bugzilla.last_audit_time', 'Bug.fields',
+            'Bugzilla.last_audit_time',
+        ])
+        self.audit_time = '20130102T00:00:00'
+        self.bz._fields = None
+        self.bz.get_fields()
+        self.assertEqual(
+            self._methods()[3:], ['Bugzilla.last_audit_time', 'Bug.fields'])
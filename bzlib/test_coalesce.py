@@ -0,0 +1,166 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import unittest
+import xmlrpclib
+
+from . import coalesce
+from . import parallel
+from . import test_bugzilla
+
+
+def _concurrently(fn, items):
+    """Apply a function to each item, each in its own thread."""
+    results = parallel.pmap(fn, items, jobs=len(items))
+    for _, e in results:
+        if e is not None:
+            raise e
+    return [v for v, _ in results]
+
+
+class CallKeyTestCase(unittest.TestCase):
+    def test_key(self):
+        self.assertEqual(
+            coalesce.call_key('Bug.get', {'ids': [1], 'a': {'b': 'c'}}),
+            coalesce.call_key('Bug.get', {'a': {'b': 'c'}, 'ids': [1]}),
+        )
+        self.assertNotEqual(
+            coalesce.call_key('Bug.get', {'ids': [1]}),
+            coalesce.call_key('Bug.get', {'ids': [2]}),
+        )
+        with self.assertRaises(TypeError):
+            coalesce.call_key('Bug.get', {'ids': set([1])})
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.single_flight = coalesce.SingleFlight()
+
+    def _fn(self):
+        self.calls.append(1)
+        self.started.set()
+        self.release.wait(5)
+        if self.fail:
+            raise ValueError
+        return {'bugs': []}
+
+    def _do(self, _):
+        return self.single_flight.do('key', self._fn)
+
+    def _leader(self):
+        leader = parallel.Executor(1)
+        future = leader.submit(self._do, None)
+        self.started.wait(5)
+        # followers join before the leader is released
+        threading.Timer(0.2, self.release.set).start()
+        return leader, future
+
+    def test_shared(self):
+        self.fail = False
+        leader, future = self._leader()
+        results = _concurrently(self._do, range(3)) + [future.result()]
+        leader.shutdown()
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(results, [{'bugs': []}] * 4)
+        self.assertEqual(len(set(map(id, results))), 4)  # copies
+        self._do(None)
+        self.assertEqual(self.calls, [1, 1])  # none in flight
+
+    def test_exception(self):
+        self.fail = True
+        leader, future = self._leader()
+        with self.assertRaises(ValueError):
+            _concurrently(self._do, range(3))
+        with self.assertRaises(ValueError):
+            future.result()
+        leader.shutdown()
+        self.assertEqual(self.calls, [1])
+
+    def test_snapshot(self):
+        self.fail = False
+        leader = parallel.Executor(1)
+
+        def change(_):
+            value = self._do(_)
+            value['bugs'].append('changed')  # before followers copy it
+            return value
+        future = leader.submit(change, None)
+        self.started.wait(5)
+        threading.Timer(0.2, self.release.set).start()
+        results = _concurrently(self._do, range(3))
+        self.assertEqual(future.result(), {'bugs': ['changed']})
+        leader.shutdown()
+        self.assertEqual(results, [{'bugs': []}] * 3)
+
+    def test_interrupt(self):
+        def interrupt():
+            raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            self.single_flight.do('key', interrupt)
+        self.fail, self.release = False, threading.Event()
+        self.release.set()
+        self.assertEqual(self._do(None), {'bugs': []})  # none in flight
+
+
+class BugGetBatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _call(self, params):
+        self.calls.append(params)
+        if 99 in params['ids']:
+            raise xmlrpclib.Fault(101, 'Bug 99 does not exist.')
+        return {'bugs': [{'id': x} for x in params['ids']]}
+
+    def _get(self, bugno):
+        return self.batcher.get({'ids': [bugno], 'include_fields': ['id']})
+
+    def test_merged(self):
+        self.batcher = coalesce.BugGetBatcher(self._call, 0.05)
+        results = _concurrently(self._get, [3, 1, 2, 1])
+        self.assertEqual(
+            [r['bugs'][0]['id'] for r in results], [3, 1, 2, 1])
+        self.assertEqual(
+            self.calls, [{'ids': [1, 2, 3], 'include_fields': ['id']}])
+        self.assertIsNot(results[1]['bugs'][0], results[3]['bugs'][0])
+
+    def test_fault(self):
+        self.batcher = coalesce.BugGetBatcher(self._call, 0.05)
+        results = parallel.pmap(self._get, [1, 99], jobs=2)
+        self.assertEqual(results[0], ({'bugs': [{'id': 1}]}, None))
+        self.assertEqual(results[1][1].faultCode, 101)
+        self.assertEqual(
+            [x['ids'] for x in self.calls], [[1, 99], [1], [99]])
+
+    def test_accepts(self):
+        accepts = coalesce.BugGetBatcher.accepts
+        self.assertTrue(accepts({'ids': [1]}))
+        self.assertFalse(accepts({'ids': [1, 2]}))
+        self.assertFalse(accepts({'ids': ['alias']}))
+
+
+class BugzillaTestCase(unittest.TestCase):
+    def test_bug_get_window(self):
+        bz = test_bugzilla._FakeBugzilla(
+            test_bugzilla._respond_bugs, bug_get_window='0.05')
+        results = _concurrently(
+            lambda x: bz.rpc('Bug', 'get', ids=[x]), [1, 2, 3])
+        self.assertEqual([r['bugs'][0]['id'] for r in results], [1, 2, 3])
+        self.assertEqual(bz.calls, [('Bug.get', {'ids': [1, 2, 3]})])
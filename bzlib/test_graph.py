@@ -0,0 +1,123 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import unittest
+import xmlrpclib
+
+from . import cache
+from . import graph
+from . import test_bugzilla
+
+
+# bug number -> status, depends_on
+BUGS = {
+    1: ('NEW', [2, 3]),
+    2: ('NEW', [4]),
+    3: ('RESOLVED', [4]),
+    4: ('NEW', [5]),
+    5: ('RESOLVED', []),
+    6: ('NEW', [7]),
+    7: ('NEW', [6, 8]),
+    8: ('NEW', [8]),
+    9: ('NEW', [99]),  # 99 does not exist
+}
+
+
+def _respond(method, ids=None, include_fields=None, permissive=False):
+    if method == 'Bug.get':
+        missing = [x for x in ids if x not in BUGS]
+        if missing and not permissive:
+            raise xmlrpclib.Fault(
+                101, 'Bug #{} does not exist.'.format(missing[0]))
+        return {
+            'bugs': [
+                {
+                    'id': x,
+                    'status': BUGS[x][0],
+                    'depends_on': BUGS[x][1],
+                    'blocks': [y for y in BUGS if x in BUGS[y][1]],
+                }
+                for x in ids if x in BUGS
+            ],
+            'faults': [{'id': x, 'faultCode': 101} for x in missing],
+        }
+    elif method == 'Bugzilla.last_audit_time':
+        return {'last_audit_time': '20130101T00:00:00'}
+    return {'fields': [{'name': 'bug_status', 'values': [
+        {'name': 'NEW', 'is_open': True},
+        {'name': 'RESOLVED', 'is_open': False},
+    ]}]}
+
+
+class DependencyGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self.bz = test_bugzilla._FakeBugzilla(_respond)
+        self.bz.cache = cache.Cache(self._path)
+        self.graph = graph.DependencyGraph(self.bz)
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+    def _gets(self):
+        return [
+            params['ids'] for method, params in self.bz.calls
+            if method == 'Bug.get'
+        ]
+
+    def test_crawl(self):
+        self.assertEqual(self.graph.crawl([1]), set([1, 2, 3, 4, 5]))
+        self.assertEqual(self._gets(), [[1], [2, 3], [4], [5]])
+        self.assertEqual(
+            self.bz.calls[0][1]['include_fields'],
+            ['blocks', 'depends_on', 'id', 'status']
+        )
+        self.assertEqual(self.graph.crawl([4], 'blocks'), set([1, 2, 3, 4]))
+        self.assertEqual(len(self._gets()), 4)  # all known
+
+    def test_missing(self):
+        self.assertEqual(self.graph.crawl([9]), set([9, 99]))
+        self.assertEqual(self.graph.missing, set([99]))
+        self.assertNotIn(99, self.graph.nodes)
+        self.assertTrue(self.bz.calls[0][1]['permissive'])
+        self.graph.crawl([9])
+        self.assertEqual(self._gets(), [[9], [99]])  # not retried
+        self.assertEqual(self.graph.open_leaves(9), set([9]))
+
+    def test_crawl_depth(self):
+        self.assertEqual(self.graph.crawl([1], depth=1), set([1, 2, 3]))
+        self.assertEqual(self._gets(), [[1], [2, 3]])
+
+    def test_cache(self):
+        self.graph.crawl([1])
+        self.graph.save()
+        g = graph.DependencyGraph(self.bz)
+        self.assertEqual(g.crawl([1]), set([1, 2, 3, 4, 5]))
+        self.assertEqual(len(self._gets()), 4)
+        self.bz.config['graph_ttl'] = '-1'
+        g = graph.DependencyGraph(self.bz)
+        g.crawl([1])
+        self.assertEqual(len(self._gets()), 8)
+
+    def test_queries(self):
+        self.graph.crawl([1, 6])
+        self.assertEqual(self.graph.closure(1), set([2, 3, 4, 5]))
+        self.assertEqual(self.graph.closure(5, 'blocks'), set([1, 2, 3, 4]))
+        self.assertEqual(self.graph.open_leaves(1), set([4]))
+        self.assertEqual(self.graph.open_leaves(6), set())
+        self.assertEqual(self.graph.cycles(), [[6, 7], [8]])
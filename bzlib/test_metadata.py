@@ -0,0 +1,90 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from . import metadata
+
+
+FIELDS = [
+    {'name': 'product', 'values': [
+        {'name': 'A', 'sortkey': 0},
+        {'name': 'B', 'sortkey': 0},
+    ]},
+    {'name': 'component', 'value_field': 'product', 'values': [
+        {'name': 'b1', 'sortkey': 2, 'visibility_values': ['B']},
+        {'name': 'a1', 'sortkey': 1, 'visibility_values': ['A']},
+        {'name': 'ab', 'sortkey': 0, 'visibility_values': ['A', 'B']},
+        {'sortkey': 3},
+    ]},
+    {'name': 'summary'},
+]
+
+
+class FieldIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = metadata.FieldIndex(FIELDS)
+
+    def test_field(self):
+        self.assertIs(self.index.field('summary'), FIELDS[2])
+        with self.assertRaises(KeyError):
+            self.index.field('bogus')
+
+    def test_value(self):
+        self.assertEqual(self.index.value('component', 'a1')['sortkey'], 1)
+        with self.assertRaises(KeyError):
+            self.index.value('component', 'bogus')
+        self.assertEqual(
+            set(self.index.value_names('component')),
+            set(['a1', 'b1', 'ab'])
+        )
+
+    def test_values(self):
+        names = lambda values: [x.get('name') for x in values]
+        self.assertEqual(
+            names(self.index.values('component')), ['ab', 'a1', 'b1'])
+        self.assertEqual(
+            names(self.index.values('component', sort=False)),
+            ['b1', 'a1', 'ab']
+        )
+        self.assertEqual(
+            names(self.index.values('component', omit_empty=False)),
+            ['ab', 'a1', 'b1', None]
+        )
+        self.assertEqual(
+            names(self.index.values(
+                'component', visible_for={'product': 'A'})),
+            ['ab', 'a1']
+        )
+        self.assertEqual(
+            names(self.index.values(
+                'component', visible_for={'summary': 'A'})),
+            ['ab', 'a1', 'b1']
+        )
+        self.assertEqual(
+            names(self.index.values(
+                'component', visible_for={'product': ['B']})),
+            ['ab', 'b1']
+        )
+        self.assertEqual(
+            names(self.index.values(
+                'component', visible_for={'product': ['A', 'B']})),
+            ['ab', 'a1', 'b1']
+        )
+
+    def test_dependents(self):
+        self.assertEqual(self.index.dependents('product'), [FIELDS[1]])
+        self.assertEqual(self.index.dependents('summary'), [])
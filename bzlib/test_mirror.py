@@ -0,0 +1,109 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import unittest
+
+from . import mirror
+from . import test_bugzilla
+
+
+def _bug(id, summary, status, day):
+    return {
+        'id': id,
+        'product': 'foo',
+        'summary': summary,
+        'status': status,
+        'last_change_time': datetime.datetime(2013, 1, day),
+    }
+
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bugs = [
+            _bug(1, 'frobnicate the widget', 'NEW', 1),
+            _bug(2, 'widget is 100% broken', 'RESOLVED', 2),
+            _bug(3, 'gadget', 'NEW', 3),
+        ]
+
+        def respond(method, product, last_change_time=None, **kwargs):
+            return {'bugs': [
+                x for x in self.bugs
+                if x['product'] in product and (
+                    last_change_time is None
+                    or x['last_change_time'] >= last_change_time)
+            ]}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+        self.mirror = mirror.Mirror(':memory:')
+
+    def tearDown(self):
+        self.mirror.close()
+
+    def test_sync(self):
+        self.assertEqual(self.mirror.sync(self.bz, ['foo']), 3)
+        self.assertEqual(
+            self.mirror.last_sync('foo'), datetime.datetime(2013, 1, 3))
+        self.bugs[0] = _bug(1, 'frobnicate the gadget', 'NEW', 4)
+        self.assertEqual(self.mirror.sync(self.bz, ['foo']), 2)
+        self.assertEqual(
+            self.bz.calls[-1][1]['last_change_time'],
+            datetime.datetime(2013, 1, 3)
+        )
+        [bug] = self.mirror.bugs(self.bz, [1])
+        self.assertEqual(bug.data['summary'], 'frobnicate the gadget')
+        with self.assertRaises(KeyError):
+            self.mirror.bugs(self.bz, [4])
+
+    def test_dates(self):
+        self.mirror.sync(self.bz, ['foo'])
+        [bug] = self.mirror.bugs(self.bz, [1])
+        self.assertEqual(
+            bug.data['last_change_time'], datetime.datetime(2013, 1, 1))
+
+    def test_reconcile(self):
+        self.mirror.sync(self.bz, ['foo'])
+        self.bugs[1]['product'] = 'bar'  # moved out of the mirror
+        self.mirror.sync(self.bz, ['foo'])
+        self.assertEqual(len(self.mirror.search(self.bz)), 3)  # not due
+        self.assertEqual(len(self.bz.calls), 2)
+        self.mirror.sync(self.bz, ['foo'], reconcile_interval=0)
+        self.assertEqual(self.bz.calls[-1][1]['include_fields'], ['id'])
+        self.assertEqual(
+            [b.bugno for b in self.mirror.search(self.bz)], [1, 3])
+        self.assertEqual(
+            [x[0] for x in self.mirror.grep('widget')], [1])
+        self.mirror.sync(self.bz, ['foo'], full=True)  # removes too
+        self.bugs[2]['product'] = 'bar'
+        self.mirror.sync(self.bz, ['foo'], full=True)
+        self.assertEqual([b.bugno for b in self.mirror.search(self.bz)], [1])
+
+    def test_search(self):
+        self.mirror.sync(self.bz, ['foo'])
+        ids = lambda **kwargs: \
+            [b.bugno for b in self.mirror.search(self.bz, **kwargs)]
+        self.assertEqual(ids(), [1, 2, 3])
+        self.assertEqual(ids(status=['NEW']), [1, 3])
+        self.assertEqual(ids(not_status=['NEW']), [2])
+        self.assertEqual(ids(status='NEW', not_status=['NEW']), [1, 3])
+        self.assertEqual(ids(summary=['WIDGET']), [1, 2])
+        self.assertEqual(ids(summary=['0%']), [2])
+        self.assertEqual(ids(summary=['_']), [])
+        self.assertEqual(
+            ids(last_change_time=datetime.datetime(2013, 1, 2)), [2, 3])
+        self.assertEqual(ids(id=[3, 1]), [1, 3])
+        self.assertEqual(ids(limit=1, offset=1), [2])
+        with self.assertRaises(TypeError):
+            ids(bogus='x')
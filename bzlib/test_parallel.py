@@ -0,0 +1,114 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+
+from . import parallel
+
+
+class PmapTestCase(unittest.TestCase):
+    def _fn(self, x):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01 * (x % 3))
+        with self.lock:
+            self.active -= 1
+        if x % 4 == 0:
+            raise ValueError(x)
+        return x * 2
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+
+    def _check(self, results):
+        self.assertEqual([v for v, e in results], [
+            None if x % 4 == 0 else x * 2 for x in range(1, 11)])
+        self.assertEqual([e and e.args for e in (e for v, e in results)], [
+            (x,) if x % 4 == 0 else None for x in range(1, 11)])
+
+    def test_serial(self):
+        self._check(parallel.pmap(self._fn, range(1, 11)))
+        self.assertEqual(self.peak, 1)
+
+    def test_concurrent(self):
+        self._check(parallel.pmap(self._fn, range(1, 11), jobs=3))
+        self.assertLessEqual(self.peak, 3)
+
+    def test_empty(self):
+        self.assertEqual(parallel.pmap(self._fn, [], jobs=3), [])
+
+
+class ExecutorTestCase(unittest.TestCase):
+    def test_submit(self):
+        with parallel.Executor(3) as executor:
+            futures = [executor.submit(lambda x: 10 / x, x) for x in range(3)]
+            with self.assertRaises(ZeroDivisionError):
+                futures[0].result()
+            self.assertEqual([x.result() for x in futures[1:]], [10, 5])
+            self.assertIsInstance(futures[0].exception(), ZeroDivisionError)
+        with self.assertRaises(RuntimeError):
+            executor.submit(int)
+
+    def test_concurrent(self):
+        barrier = threading.Event()
+        with parallel.Executor(2) as executor:
+            waiting = executor.submit(barrier.wait, 5)
+            executor.submit(barrier.set).result()
+            self.assertTrue(waiting.result())
+
+    def test_timeout(self):
+        event = threading.Event()
+        with parallel.Executor(1) as executor:
+            future = executor.submit(event.wait, 5)
+            with self.assertRaises(parallel.TimeoutError):
+                future.result(timeout=0.05)
+            done = []
+            future.add_done_callback(done.append)
+            event.set()
+            self.assertTrue(future.result())
+        self.assertEqual(done, [future])
+        future.add_done_callback(done.append)
+        self.assertEqual(done, [future, future])
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def test_prefetch(self):
+        produced = []
+
+        def items():
+            for x in range(5):
+                produced.append(x)
+                yield x
+
+        it = parallel.prefetch(items(), ahead=2)
+        self.assertEqual(next(it), 0)
+        time.sleep(0.05)
+        self.assertEqual(produced, [0, 1, 2, 3])  # two ahead, one put
+        self.assertEqual(list(it), [1, 2, 3, 4])
+
+    def test_exception(self):
+        def items():
+            yield 1
+            raise ValueError
+
+        it = parallel.prefetch(items())
+        self.assertEqual(next(it), 1)
+        with self.assertRaises(ValueError):
+            next(it)
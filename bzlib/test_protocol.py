@@ -0,0 +1,201 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import BaseHTTPServer
+import datetime
+import json
+import threading
+import unittest
+import urlparse
+import xmlrpclib
+
+from . import bugzilla
+from . import protocol
+from . import test_bugzilla
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        body = self.rfile.read(length) if length else None
+        url = urlparse.urlparse(self.path)
+        request = (
+            self.command,
+            url.path,
+            urlparse.parse_qs(url.query),
+            json.loads(body) if body else None,
+        )
+        self.server.requests.append(request)
+        status, response = self.server.respond(*request)
+        data = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.server.drop:
+            # close the connection without telling the client
+            self.close_connection = 1
+
+    do_GET = do_POST = do_PUT = _respond
+
+
+class _ProtocolTestCase(unittest.TestCase):
+    protocol = None
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(
+            ('127.0.0.1', 0), _RequestHandler)
+        self.server.requests = []
+        self.server.drop = False
+        self.server.respond = self.respond
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.bz = bugzilla.Bugzilla(
+            'http://127.0.0.1:{}/bz'.format(self.server.server_address[1]),
+            'u', 'p',
+            protocol=self.protocol
+        )
+        self.bz._token = False
+
+    def tearDown(self):
+        self.bz.transport.close()  # the server handles one connection
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JSONRPCTestCase(_ProtocolTestCase):
+    protocol = 'jsonrpc'
+
+    def respond(self, method, path, query, body):
+        if body['method'] == 'Bug.get':
+            return 200, {'error': None, 'id': body['id'], 'result': {'bugs': [
+                {'id': x, 'last_change_time': '2013-12-01T13:05:59Z'}
+                for x in body['params'][0]['ids']
+            ]}}
+        if body['method'] == 'Bug.fields':
+            return 200, {'error': None, 'id': 'other', 'result': {}}
+        return 200, {
+            'error': {'code': 32000, 'message': 'no'}, 'id': body['id']}
+
+    def test_call(self):
+        [b] = self.bz.bugs([1])
+        self.assertEqual(
+            b.data['last_change_time'],
+            datetime.datetime(2013, 12, 1, 13, 5, 59)
+        )
+        method, path, query, body = self.server.requests[0]
+        self.assertEqual((method, path), ('POST', '/bz/jsonrpc.cgi'))
+        self.assertEqual(body['method'], 'Bug.get')
+        self.assertEqual(body['params'][0]['ids'], [1])
+        self.assertEqual(body['params'][0]['Bugzilla_login'], 'u')
+        self.bz.bugs([2])
+        self.assertEqual(
+            [x[3]['id'] for x in self.server.requests], [1, 2])
+
+    def test_id_mismatch(self):
+        with self.assertRaises(xmlrpclib.ResponseError):
+            self.bz.rpc('Bug', 'fields')
+
+    def test_fault(self):
+        with self.assertRaises(xmlrpclib.Fault) as cm:
+            self.bz.rpc('Bug', 'comments', ids=[1])
+        self.assertEqual(cm.exception.faultCode, 32000)
+
+    def test_batch(self):
+        with self.bz.batch():
+            a = self.bz.rpc('Bug', 'get', ids=[1])
+            b = self.bz.rpc('Bug', 'comments', ids=[1])
+        self.assertEqual(a.result()['bugs'][0]['id'], 1)
+        with self.assertRaises(xmlrpclib.Fault):
+            b.result()
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.bz.transport.connections_opened, 1)
+
+    def test_dropped_connection(self):
+        self.server.drop = True
+        self.bz.bugs([1])
+        [b] = self.bz.bugs([2])  # over a connection the server closed
+        self.assertEqual(b.bugno, 2)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.bz.transport.connections_opened, 2)
+
+
+class RESTTestCase(_ProtocolTestCase):
+    protocol = 'rest'
+
+    def respond(self, method, path, query, body):
+        if path == '/bz/rest.cgi/bug':
+            return 200, {'bugs': [{'id': int(x)} for x in query['id']]}
+        if path.endswith('/comment'):
+            bugno = path.split('/')[-2]
+            return 200, {'bugs': {bugno: {'comments': [{'id': bugno}]}}}
+        if method == 'PUT':
+            return 200, {'bugs': [{'id': x} for x in body['ids']]}
+        return 404, {'error': True, 'code': 32614, 'message': 'no'}
+
+    def test_get(self):
+        self.bz.bugs([1, 2], include_fields=['id'])
+        method, path, query, body = self.server.requests[0]
+        self.assertEqual((method, path), ('GET', '/bz/rest.cgi/bug'))
+        self.assertEqual(query['id'], ['1', '2'])
+        self.assertEqual(query['include_fields'], ['id'])
+        self.assertEqual(query['Bugzilla_login'], ['u'])
+
+    def test_per_bug(self):
+        comments = self.bz.comments([1, 2])
+        self.assertEqual(comments, {1: [{'id': '1'}], 2: [{'id': '2'}]})
+        self.assertEqual(
+            [x[1] for x in self.server.requests],
+            ['/bz/rest.cgi/bug/1/comment', '/bz/rest.cgi/bug/2/comment']
+        )
+
+    def test_combined(self):
+        result = self.bz.update_bugs([1, 2], status='RESOLVED')
+        self.assertEqual([x['id'] for x in result], [1, 2])
+        [(method, path, query, body)] = self.server.requests
+        self.assertEqual((method, path), ('PUT', '/bz/rest.cgi/bug/1'))
+        self.assertEqual(body['ids'], [1, 2])
+        self.assertEqual(body['status'], 'RESOLVED')
+
+    def test_fault(self):
+        with self.assertRaises(xmlrpclib.Fault) as cm:
+            self.bz.rpc('Bug', 'fields')
+        self.assertEqual(cm.exception.faultCode, 32614)
+        with self.assertRaises(xmlrpclib.Fault) as cm:
+            self.bz.rpc('Bug', 'bogus')
+        self.assertEqual(cm.exception.faultCode, -32601)
+
+
+class EncodingTestCase(unittest.TestCase):
+    def test_dates(self):
+        when = datetime.datetime(2013, 12, 1, 13, 5, 59)
+        data = protocol.dumps({'new_since': when, 'time': when})
+        self.assertEqual(
+            json.loads(data)['new_since'], '2013-12-01T13:05:59Z')
+        decoded = protocol.loads(data)
+        self.assertEqual(decoded['time'], when)
+        self.assertEqual(decoded['new_since'], '2013-12-01T13:05:59Z')
+
+    def test_unknown_protocol(self):
+        with self.assertRaises(ValueError):
+            test_bugzilla._FakeBugzilla(None, protocol='soap')
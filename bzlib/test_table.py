@@ -0,0 +1,92 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from . import table
+from . import test_bugzilla
+
+
+BUGS = [
+    {'id': 1, 'status': 'NEW', 'component': 'a', 'estimated_time': 2.0},
+    {'id': 2, 'status': 'NEW', 'component': 'b', 'estimated_time': 1.5},
+    {'id': 3, 'status': 'RESOLVED', 'component': 'a'},
+    {'id': 4, 'status': 'ASSIGNED', 'component': 'a',
+        'estimated_time': 4.0},
+]
+
+FIELDS = ['status', 'component', 'estimated_time']
+
+
+class BugTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.table = table.BugTable(FIELDS, BUGS)
+
+    def test_rows(self):
+        self.assertEqual(len(self.table), 4)
+        rows = list(self.table)
+        self.assertEqual(rows[0], (1, 'a', 2.0, 'NEW'))
+        self.assertEqual(rows[0].status, 'NEW')
+        self.assertNotEqual(rows[2].estimated_time, rows[2].estimated_time)
+        self.assertEqual(self.table.column('id'), [1, 2, 3, 4])
+
+    def test_filter(self):
+        new = self.table.filter(status='NEW')
+        self.assertEqual(new.column('id'), [1, 2])
+        self.assertEqual(
+            self.table.filter(status=['NEW', 'ASSIGNED'], component='a')
+            .column('id'),
+            [1, 4]
+        )
+        self.assertEqual(
+            self.table.filter(estimated_time=lambda x: x > 1.8).column('id'),
+            [1, 4]
+        )
+        self.assertEqual(self.table.count(component='a'), 3)
+        self.assertEqual(self.table.count(), 4)
+        self.assertEqual(self.table.filter(status='bogus').count(), 0)
+        self.assertEqual(
+            self.table.filter(estimated_time=table.is_present)
+            .column('id'),
+            [1, 2, 4]
+        )
+        self.assertFalse(table.is_present(None))
+        self.assertTrue(table.is_present(0))
+
+    def test_group_by(self):
+        self.assertEqual(
+            self.table.count_by('status'),
+            {'NEW': 2, 'RESOLVED': 1, 'ASSIGNED': 1}
+        )
+        groups = self.table.group_by('component')
+        self.assertEqual(sorted(groups), ['a', 'b'])
+        self.assertEqual(groups['a'].column('id'), [1, 3, 4])
+        self.assertEqual(groups['a'].sum('estimated_time'), 6.0)
+        self.assertEqual(groups['a'].count_by('id'), {1: 1, 3: 1, 4: 1})
+
+    def test_search(self):
+        def respond(method, limit, offset, include_fields, **kwargs):
+            return {'bugs': [
+                {k: v for k, v in x.viewitems() if k in include_fields}
+                for x in BUGS[offset:offset + limit]
+            ]}
+        bz = test_bugzilla._FakeBugzilla(respond)
+        t = table.BugTable.search(bz, ['status'], page_size=3, product='p')
+        self.assertEqual(len(bz.calls), 2)
+        self.assertEqual(bz.calls[0][1]['include_fields'], ['id', 'status'])
+        self.assertEqual(t.count_by('status'), table.BugTable(
+            ['status'], BUGS).count_by('status'))
+        self.assertEqual(t.fields, ('id', 'status'))
@@ -0,0 +1,133 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import sqlite3
+import unittest
+
+from . import mirror
+from . import test_bugzilla
+from . import textindex
+
+
+class QueryTestCase(unittest.TestCase):
+    def test_words(self):
+        self.assertEqual(
+            textindex.words("Can't frob the Widget_2."),
+            ['can', 't', 'frob', 'the', 'widget_2']
+        )
+        self.assertEqual(textindex.words(None), [])
+
+    def test_parse_query(self):
+        self.assertEqual(
+            textindex.parse_query('crash "Null pointer" on-start'),
+            [['crash'], ['null', 'pointer'], ['on'], ['start']]
+        )
+        self.assertEqual(textindex.parse_query('"" ..'), [])
+
+
+class TextIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = textindex.TextIndex(sqlite3.connect(':memory:'))
+        self.index.index_summary(1, 'Widget crashes on start')
+        self.index.index_comments(1, [
+            {'text': 'It crashes.'},
+            {'text': 'Null pointer in the widget; the pointer is null.'},
+        ])
+        self.index.index_summary(2, 'Gadget is slow')
+        self.index.index_comments(2, [
+            {'text': 'The widget is fine, the gadget is slow.', 'count': 0},
+            {'text': 'The pointer is not null.', 'count': 3},
+        ])
+
+    def docs(self, query):
+        return [x[1:] for x in self.index.search(query)]
+
+    def test_len(self):
+        self.assertEqual(len(self.index), 6)
+
+    def test_search(self):
+        self.assertEqual(self.docs('gadget'), [(2, -1), (2, 0)])
+        self.assertEqual(self.docs('CRASHES widget'), [(1, -1)])
+        self.assertEqual(self.docs('nothing'), [])
+        self.assertEqual(self.docs(''), [])
+
+    def test_ranking(self):
+        # the comment that mentions "pointer" and "null" twice is first
+        self.assertEqual(self.docs('null pointer'), [(1, 1), (2, 3)])
+        scores = [x[0] for x in self.index.search('null pointer')]
+        self.assertGreater(scores[0], scores[1])
+
+    def test_phrase(self):
+        self.assertEqual(self.docs('"null pointer"'), [(1, 1)])
+        self.assertEqual(self.docs('"pointer null"'), [])
+        self.assertEqual(self.docs('"is not null"'), [(2, 3)])
+
+    def test_reindex(self):
+        self.index.index_summary(2, 'Gadget is fast')
+        self.index.index_comments(1, [{'text': 'Fixed.'}])
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.docs('slow'), [(2, 0)])
+        self.assertEqual(self.docs('crashes'), [(1, -1)])
+        self.assertEqual(self.docs('fixed'), [(1, 0)])
+
+
+class MirrorGrepTestCase(unittest.TestCase):
+    def setUp(self):
+        def respond(method, **params):
+            if method == 'Bug.search':
+                return {'bugs': [
+                    {
+                        'id': x,
+                        'product': 'foo',
+                        'summary': 'widget {}'.format(x),
+                        'last_change_time': datetime.datetime(2013, 1, x),
+                    }
+                    for x in (1, 2)
+                ]}
+            elif method == 'Bug.get':
+                return {'bugs': [{'id': x} for x in params['ids']]}
+            return {'bugs': {
+                str(x): {'comments': [
+                    {'text': 'first line\nthe widget is broken'},
+                ]}
+                for x in params['ids']
+            }}
+        self.bz = test_bugzilla._FakeBugzilla(respond)
+        self.mirror = mirror.Mirror(':memory:')
+
+    def tearDown(self):
+        self.mirror.close()
+
+    def test_grep(self):
+        self.mirror.sync(self.bz, ['foo'])
+        self.assertEqual(self.mirror.grep('broken'), [])
+        self.assertEqual(self.mirror.grep('widget 2'), [(2, -1, 'widget 2')])
+        self.mirror.sync(self.bz, ['foo'], comments=True, full=True)
+        self.assertEqual(
+            self.mirror.grep('broken', limit=1),
+            [(1, 0, 'first line\nthe widget is broken')]
+        )
+
+    def test_grep_reindex(self):
+        self.mirror.sync(self.bz, ['foo'], comments=True)
+        self.mirror._db.executescript('DELETE FROM text_doc; '
+                                      'DELETE FROM text_posting;')
+        self.assertEqual(len(self.mirror.text), 0)
+        self.assertEqual(
+            [x[:2] for x in self.mirror.grep('widget')],
+            [(1, -1), (1, 0), (2, -1), (2, 0)]
+        )
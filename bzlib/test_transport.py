@@ -0,0 +1,173 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import SimpleXMLRPCServer
+import SocketServer
+import threading
+import time
+import unittest
+import xmlrpclib
+import zlib
+
+from . import parallel
+from . import transport
+
+
+class _RequestHandler(SimpleXMLRPCServer.SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        SimpleXMLRPCServer.SimpleXMLRPCRequestHandler.do_POST(self)
+        if getattr(self.server, 'drop', False):
+            # close the connection without telling the client
+            self.close_connection = 1
+
+
+class _ThreadingServer(
+    SocketServer.ThreadingMixIn,
+    SimpleXMLRPCServer.SimpleXMLRPCServer
+):
+    daemon_threads = True
+
+
+class _Response(object):
+    def __init__(self, data, encoding):
+        self.data = data
+        self.encoding = encoding
+
+    def read(self):
+        return self.data
+
+    def getheader(self, name, default=None):
+        return self.encoding if name == 'content-encoding' else default
+
+
+class TransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = SimpleXMLRPCServer.SimpleXMLRPCServer(
+            ('127.0.0.1', 0),
+            requestHandler=_RequestHandler,
+            logRequests=False
+        )
+        self.server.register_function(lambda x: x, 'echo')
+        self.server.register_function(lambda: 1 / 0, 'fail')
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuse(self):
+        t = transport.Transport()
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        for i in range(5):
+            self.assertEqual(proxy.echo(i), i)
+        self.assertEqual(t.connections_opened, 1)
+        self.assertEqual(t.connections_reused, 4)
+
+    def test_reuse_after_fault(self):
+        t = transport.Transport()
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        with self.assertRaises(xmlrpclib.Fault):
+            proxy.fail()
+        self.assertEqual(proxy.echo('a'), 'a')
+        self.assertEqual(t.connections_opened, 1)
+        self.assertEqual(t.connections_reused, 1)
+
+    def test_idle_timeout(self):
+        t = transport.Transport(idle_timeout=-1)
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        proxy.echo(1)
+        proxy.echo(2)
+        self.assertEqual(t.connections_opened, 2)
+        self.assertEqual(t.connections_reused, 0)
+
+    def test_pool_size(self):
+        t = transport.Transport(pool_size=0)
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        proxy.echo(1)
+        proxy.echo(2)
+        self.assertEqual(t.connections_opened, 2)
+        self.assertEqual(t.connections_reused, 0)
+
+    def test_compressed_response(self):
+        t = transport.Transport()
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        text = 'spam ' * 2000
+        self.assertEqual(proxy.echo(text), text)
+        self.assertGreater(t.content_received, len(text))
+        self.assertLess(t.bytes_received, t.content_received / 10)
+        self.assertEqual(t.bytes_sent, t.content_sent)
+
+    def test_compressed_request(self):
+        t = transport.Transport(encode_threshold=1000)
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        self.assertEqual(proxy.echo('a'), 'a')
+        self.assertEqual(t.bytes_sent, t.content_sent)
+        text = 'spam ' * 2000
+        self.assertEqual(proxy.echo(text), text)
+        self.assertLess(t.bytes_sent, t.content_sent / 10)
+        self.assertEqual(t.connections_opened, 1)
+
+    def test_deflate(self):
+        t = transport.Transport()
+        text = 'spam ' * 100
+        self.assertEqual(
+            t._read(_Response(zlib.compress(text), 'deflate')), text)
+        raw = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = raw.compress(text) + raw.flush()
+        self.assertEqual(t._read(_Response(data, 'deflate')), text)
+        with self.assertRaises(xmlrpclib.ResponseError):
+            t._read(_Response(data, 'gzip'))
+
+
+class StaleConnectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = _ThreadingServer(
+            ('127.0.0.1', 0),
+            requestHandler=_RequestHandler,
+            logRequests=False
+        )
+        self.server.drop = True
+        self.server.register_function(lambda x: time.sleep(x) or x, 'sleep')
+        self.server.register_function(lambda x: x, 'echo')
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stale_pool(self):
+        t = transport.Transport()
+        # fill the pool with connections the server has since closed
+        results = parallel.pmap(
+            lambda x: xmlrpclib.ServerProxy(self.url, transport=t).sleep(x),
+            [0.2] * 3, jobs=3)
+        self.assertEqual(results, [(0.2, None)] * 3)
+        self.assertEqual(t.connections_opened, 3)
+        proxy = xmlrpclib.ServerProxy(self.url, transport=t)
+        self.assertEqual(proxy.echo(1), 1)
+        self.assertEqual(t.connections_opened, 4)
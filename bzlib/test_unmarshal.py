@@ -0,0 +1,89 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import unittest
+import xmlrpclib
+
+from . import unmarshal
+
+VALUE = {
+    'bugs': [
+        {
+            'id': 1,
+            'summary': 'widget',
+            'unicode': u'caf\xe9',
+            'is_open': True,
+            'estimated_time': 1.5,
+            'deadline': None,
+            'cc': [],
+            'last_change_time': datetime.datetime(2013, 12, 1, 13, 5, 59),
+            'attachment': xmlrpclib.Binary('\0\1'),
+            'empty': '',
+        },
+    ],
+}
+
+
+def _loads(response, decoder, use_datetime=True):
+    parser, unmarshaller = unmarshal.getparser(decoder, use_datetime)
+    parser.feed(response)
+    parser.close()
+    return unmarshaller.close()
+
+
+def _types(value):
+    """Return the types of a value and the values it holds."""
+    if isinstance(value, dict):
+        return {k: _types(v) for k, v in value.viewitems()}
+    if isinstance(value, (list, tuple)):
+        return [_types(x) for x in value]
+    return type(value)
+
+
+class UnmarshalTestCase(unittest.TestCase):
+    def assertDecodes(self, response, use_datetime=True):
+        """Check the fast decoder agrees with xmlrpclib."""
+        expected = _loads(response, 'xmlrpclib', use_datetime)
+        actual = _loads(response, 'fast', use_datetime)
+        self.assertEqual(actual, expected)
+        self.assertEqual(_types(actual), _types(expected))
+
+    def test_values(self):
+        response = xmlrpclib.dumps(
+            (VALUE,), methodresponse=True, allow_none=True)
+        self.assertDecodes(response)
+        self.assertDecodes(response, use_datetime=False)
+
+    def test_params(self):
+        self.assertDecodes(xmlrpclib.dumps((1, 'a', [2])))
+
+    def test_untyped_string(self):
+        self.assertDecodes(
+            '<methodResponse><params><param><value>a b</value>'
+            '</param></params></methodResponse>'
+        )
+
+    def test_fault(self):
+        response = xmlrpclib.dumps(xmlrpclib.Fault(32000, 'no'))
+        with self.assertRaises(xmlrpclib.Fault) as cm:
+            _loads(response, 'fast')
+        self.assertEqual(cm.exception.faultCode, 32000)
+        self.assertEqual(cm.exception.faultString, 'no')
+
+    def test_unknown_decoder(self):
+        with self.assertRaises(ValueError):
+            unmarshal.getparser('bogus')
@@ -0,0 +1,110 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from . import bugzilla
+from . import cache
+from . import test_bugzilla
+from . import usercache
+
+USERS = [
+    {'name': 'fraser@example.com', 'real_name': 'Fraser Tweedale'},
+    {'name': 'frank@example.com', 'real_name': 'Frank Smith'},
+    {'name': 'jane@example.com', 'real_name': 'Jane Doe'},
+]
+
+
+def _match(fragment):
+    fragment = fragment.lower()
+    return [
+        x for x in USERS
+        if fragment in x['name'] or fragment in x['real_name'].lower()
+    ]
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def test_get_put(self):
+        users = usercache.UserCache()
+        self.assertIsNone(users.get('fr'))
+        users.put('fr', USERS[:2])
+        self.assertEqual(users.get('fr'), USERS[:2])
+
+    def test_lru(self):
+        users = usercache.UserCache(size=2)
+        users.put('a', [])
+        users.put('b', [])
+        users.get('a')
+        users.put('c', [])
+        self.assertEqual([x[0] for x in users.entries()], ['a', 'c'])
+        self.assertIsNone(users.get('b'))
+
+    def test_ttl(self):
+        users = usercache.UserCache(ttl=60, entries=[
+            ('old', time.time() - 120, USERS),
+            ('new', time.time(), USERS[2:]),
+        ])
+        self.assertEqual([x[0] for x in users.entries()], ['new'])
+        users.ttl = -1
+        self.assertIsNone(users.get('new'))
+
+    def test_match_prefix(self):
+        users = usercache.UserCache()
+        users.put('e', USERS)
+        names = lambda x: [u['name'] for u in users.match_prefix(x)]
+        self.assertEqual(
+            names('FR'), ['frank@example.com', 'fraser@example.com'])
+        self.assertEqual(names('fras'), ['fraser@example.com'])
+        self.assertEqual(names('tweed'), ['fraser@example.com'])
+        self.assertEqual(names('jane doe'), ['jane@example.com'])
+        self.assertEqual(names('example'), sorted(x['name'] for x in USERS))
+        self.assertEqual(names('zz'), [])
+
+
+class BugzillaUsersTestCase(unittest.TestCase):
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self.bz = test_bugzilla._FakeBugzilla(
+            lambda method, match: {'users': _match(match[0])})
+        self.bz.cache = cache.Cache(self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+    def test_match_many_users(self):
+        matches = self.bz.match_many_users(['fra', 'jane', 'fra'])
+        self.assertEqual(matches, {'fra': USERS[:2], 'jane': USERS[2:]})
+        self.assertEqual(self.bz.calls, [('system.multicall', 2)])
+        self.bz.match_many_users(['jane'])
+        self.assertEqual(len(self.bz.calls), 1)
+
+    def test_persistent(self):
+        self.bz.match_users('e')
+        self.bz._user_cache = None  # simulate a new process
+        self.assertEqual(self.bz.match_users('e'), USERS)
+        self.assertEqual(len(self.bz.calls), 1)
+
+    def test_match_one_user_prefix(self):
+        self.bz.match_users('e')
+        self.assertEqual(self.bz.match_one_user('fras'), USERS[0])
+        self.assertEqual(len(self.bz.calls), 1)
+        # ambiguous among the known users; the server is asked
+        with self.assertRaises(bugzilla.UserError):
+            self.bz.match_one_user('fr')
+        self.assertEqual(self.bz.calls[-1], ('User.get', {'match': ['fr']}))
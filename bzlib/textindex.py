@@ -0,0 +1,180 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Inverted index over the text of bug summaries and comments.
+
+The index maps each word to the documents (a summary or a comment) in
+which it appears, with the positions at which it appears, so that
+queries look up the documents of each query word rather than scanning
+all text.  The index is kept in SQLite tables alongside the mirror
+(see ``bzlib.mirror``) and updated a bug at a time.
+"""
+
+import collections
+import math
+import re
+
+from . import bug
+
+
+# the comment number of a summary
+SUMMARY = -1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS text_doc (
+    bug_id INTEGER NOT NULL,
+    comment INTEGER NOT NULL,
+    PRIMARY KEY (bug_id, comment)
+);
+CREATE TABLE IF NOT EXISTS text_posting (
+    term TEXT NOT NULL,
+    bug_id INTEGER NOT NULL,
+    comment INTEGER NOT NULL,
+    positions TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS text_posting_term ON text_posting (term);
+CREATE INDEX IF NOT EXISTS text_posting_bug ON text_posting (bug_id);
+"""
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_QUERY = re.compile(r'"([^"]*)"|(\S+)', re.UNICODE)
+
+
+def words(text):
+    """Return the lower-cased words of a text."""
+    return [x.lower() for x in _WORD.findall(text or '')]
+
+
+def parse_query(query):
+    """Return the phrases of a query, each a list of words.
+
+    Words in double quotes form a phrase; other words are phrases of
+    one word.
+    """
+    phrases = []
+    for quoted, word in _QUERY.findall(query):
+        phrase = words(quoted if quoted else word)
+        if quoted:
+            phrases.append(phrase)
+        else:
+            phrases.extend([x] for x in phrase)
+    return [x for x in phrases if x]
+
+
+class TextIndex(object):
+    """An inverted index of bug text, stored in a SQLite database."""
+
+    __slots__ = ['_db']
+
+    def __init__(self, db):
+        """Use (and if need be, create) the index in a SQLite connection."""
+        self._db = db
+        self._db.executescript(SCHEMA)
+
+    def __len__(self):
+        """Return the number of documents indexed."""
+        return self._db.execute('SELECT COUNT(*) FROM text_doc').fetchone()[0]
+
+    def index_summary(self, bugno, summary):
+        """Index (or re-index) the summary of a bug."""
+        self._remove(bugno, 'comment = ?', [SUMMARY])
+        self._add(bugno, SUMMARY, summary)
+
+    def index_comments(self, bugno, comments):
+        """Index (or re-index) the comments of a bug."""
+        self._remove(bugno, 'comment != ?', [SUMMARY])
+        for n, comment in bug.number_comments(comments):
+            self._add(bugno, n, comment['text'])
+
+    def remove(self, bugno):
+        """Remove the summary and comments of a bug from the index."""
+        self._remove(bugno, '1', [])
+
+    def _remove(self, bugno, where, params):
+        for table in 'text_doc', 'text_posting':
+            self._db.execute(
+                'DELETE FROM {} WHERE bug_id = ? AND {}'.format(table, where),
+                [bugno] + params
+            )
+
+    def _add(self, bugno, comment, text):
+        positions = collections.defaultdict(list)
+        for i, word in enumerate(words(text)):
+            positions[word].append(i)
+        self._db.execute(
+            'INSERT INTO text_doc VALUES (?, ?)', (bugno, comment))
+        self._db.executemany(
+            'INSERT INTO text_posting VALUES (?, ?, ?, ?)',
+            (
+                (term, bugno, comment, ' '.join(map(str, xs)))
+                for term, xs in positions.viewitems()
+            )
+        )
+
+    def _postings(self, term):
+        """Return a dict mapping (bug, comment) to positions of a term."""
+        return {
+            (bugno, comment): map(int, positions.split())
+            for bugno, comment, positions in self._db.execute(
+                'SELECT bug_id, comment, positions FROM text_posting '
+                'WHERE term = ?',
+                (term,)
+            )
+        }
+
+    def search(self, query):
+        """Return the documents matching a query, best first.
+
+        All the phrases of the query (see ``parse_query``) must appear
+        in a document.  Documents are ranked by the frequency of the
+        query words in the document, weighted by the rarity of each
+        word (tf-idf).
+
+        Return a list of (score, bug number, comment number) triples.
+        The comment number of a summary is ``SUMMARY``.
+        """
+        phrases = parse_query(query)
+        if not phrases:
+            return []
+        postings = {}
+        for term in set(x for phrase in phrases for x in phrase):
+            postings[term] = self._postings(term)
+        # candidates contain all the words, rarest first
+        terms = sorted(postings, key=lambda x: len(postings[x]))
+        docs = set(postings[terms[0]])
+        for term in terms[1:]:
+            docs.intersection_update(postings[term])
+        n = len(self)
+        results = []
+        for doc in docs:
+            if all(self._has_phrase(postings, doc, x) for x in phrases):
+                score = sum(
+                    len(postings[term][doc])
+                    * math.log(1.0 + float(n) / len(postings[term]))
+                    for term in terms
+                )
+                results.append((score, doc[0], doc[1]))
+        results.sort(key=lambda x: (-x[0], x[1], x[2]))
+        return results
+
+    @staticmethod
+    def _has_phrase(postings, doc, phrase):
+        first = postings[phrase[0]][doc]
+        rest = [set(postings[term][doc]) for term in phrase[1:]]
+        return any(
+            all(i + 1 + j in positions for j, positions in enumerate(rest))
+            for i in first
+        )
@@ -0,0 +1,309 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Keep-alive XML-RPC transports.
+
+The stock ``xmlrpclib`` transports hold at most one connection, and
+drop it whenever anything goes wrong, so scripts that make many calls
+(or make calls from several threads) end up paying for a TCP (and TLS)
+handshake on most requests.  The transports in this module keep a pool
+of idle HTTP/1.1 connections per host and hand them out one request at
+a time.  Responses are decoded by ``bzlib.unmarshal``.
+"""
+
+import errno
+import httplib
+import socket
+import threading
+import time
+import xmlrpclib
+import zlib
+
+from . import unmarshal
+
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 60.0
+
+# the content codings of responses the transport can decode
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# errors of a request over a connection the server has closed
+DROPPED_ERRNOS = frozenset([errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE])
+
+
+def _dropped(e):
+    """Return True if an error means the server closed the connection."""
+    if isinstance(e, httplib.BadStatusLine):
+        return True
+    return isinstance(e, socket.error) and e.errno in DROPPED_ERRNOS
+
+
+class Transport(xmlrpclib.Transport):
+    """XML-RPC transport that reuses HTTP connections.
+
+    pool_size
+      The maximum number of idle connections kept per host.
+    idle_timeout
+      Idle connections older than this many seconds are discarded
+      rather than reused (servers close idle connections themselves,
+      and a request on a dead socket costs a retry).
+    decoder
+      The decoder of responses; see ``unmarshal.getparser``.
+    encode_threshold
+      Request bodies longer than this many bytes are sent gzipped
+      (e.g. a bulk update); ``None`` (the default) never compresses
+      them, since not every server accepts compressed requests.
+
+    The ``connections_opened`` and ``connections_reused`` attributes
+    count the requests that required a new socket and the requests
+    that were sent over an existing one.
+
+    Responses are requested gzipped or deflated.  The ``bytes_sent``
+    and ``bytes_received`` attributes count the bytes of request and
+    response bodies on the wire; ``content_sent`` and
+    ``content_received`` count them uncompressed.
+    """
+
+    def __init__(
+        self,
+        use_datetime=0,
+        pool_size=DEFAULT_POOL_SIZE,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        decoder=unmarshal.DEFAULT_DECODER,
+        encode_threshold=None
+    ):
+        xmlrpclib.Transport.__init__(self, use_datetime=use_datetime)
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.decoder = decoder
+        self.encode_threshold = encode_threshold
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.bytes_sent = self.content_sent = 0
+        self.bytes_received = self.content_received = 0
+        self._idle = {}  # host -> [(connection, time returned to pool)]
+        self._lock = threading.Lock()
+
+    def _new_connection(self, host):
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        return httplib.HTTPConnection(chost)
+
+    def _checkout(self, host, fresh=False):
+        """Take an idle connection to the host, or create a new one.
+
+        fresh: if true, always create a new connection
+        """
+        with self._lock:
+            idle = [] if fresh else self._idle.get(host, [])
+            now = time.time()
+            connection = None
+            while idle and connection is None:
+                connection, returned = idle.pop()
+                if now - returned > self.idle_timeout:
+                    connection.close()
+                    connection = None
+            if connection is None:
+                connection = self._new_connection(host)
+            # httplib connects lazily (and reconnects after the server
+            # says it will close), so a connection without a socket
+            # will open a new one.
+            if connection.sock is None:
+                self.connections_opened += 1
+            else:
+                self.connections_reused += 1
+            return connection
+
+    def _checkin(self, host, connection):
+        """Return a connection to the pool, or close it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if connection.sock is not None and len(idle) < self.pool_size:
+                idle.append((connection, time.time()))
+            else:
+                connection.close()
+
+    def _encode(self, body):
+        """Compress a request body if it is long; count its bytes.
+
+        Return the body and its content coding (or ``None``).
+        """
+        encoding = None
+        data = body
+        if self.encode_threshold is not None \
+                and len(body) > self.encode_threshold:
+            compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            data = compressor.compress(body) + compressor.flush()
+            encoding = 'gzip'
+        with self._lock:
+            self.content_sent += len(body)
+            self.bytes_sent += len(data)
+        return data, encoding
+
+    def _read(self, response):
+        """Read and decompress a response body; count its bytes."""
+        data = response.read()
+        encoding = response.getheader('content-encoding', '').lower()
+        body = data
+        try:
+            if encoding == 'gzip':
+                body = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            elif encoding == 'deflate':
+                try:
+                    body = zlib.decompress(data)
+                except zlib.error:
+                    # some servers send deflate data without the header
+                    body = zlib.decompress(data, -zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise xmlrpclib.ResponseError(
+                'bad {} response body: {}'.format(encoding, e))
+        with self._lock:
+            self.bytes_received += len(data)
+            self.content_received += len(body)
+        return body
+
+    def getparser(self):
+        return unmarshal.getparser(self.decoder, self._use_datetime)
+
+    def send_request(self, connection, handler, request_body):
+        connection.putrequest('POST', handler, skip_accept_encoding=True)
+        connection.putheader('Accept-Encoding', ACCEPT_ENCODING)
+
+    def send_content(self, connection, request_body):
+        data, encoding = self._encode(request_body)
+        connection.putheader('Content-Type', 'text/xml')
+        if encoding:
+            connection.putheader('Content-Encoding', encoding)
+        connection.putheader('Content-Length', str(len(data)))
+        connection.endheaders(data)
+
+    def parse_response(self, response):
+        parser, unmarshaller = self.getparser()
+        parser.feed(self._read(response))
+        parser.close()
+        return unmarshaller.close()
+
+    def make_connection(self, host):
+        return self._checkout(host)
+
+    def request(self, host, handler, request_body, verbose=0):
+        # as xmlrpclib does, retry once if the server closed a reused
+        # connection; the other idle connections may be as stale, so
+        # the retry is made over a fresh one
+        for retry in (False, True):
+            try:
+                return self.single_request(
+                    host, handler, request_body, verbose, fresh=retry)
+            except Exception as e:
+                if retry or not _dropped(e):
+                    raise
+
+    def single_request(
+        self, host, handler, request_body, verbose=0, fresh=False
+    ):
+        h = self._checkout(host, fresh)
+        if verbose:
+            h.set_debuglevel(1)
+
+        try:
+            self.send_request(h, handler, request_body)
+            self.send_host(h, host)
+            self.send_user_agent(h)
+            self.send_content(h, request_body)
+
+            response = h.getresponse(buffering=True)
+            if response.status == 200:
+                self.verbose = verbose
+                try:
+                    result = self.parse_response(response)
+                except xmlrpclib.Fault:
+                    # a Fault is a complete response too
+                    self._checkin(host, h)
+                    raise
+                self._checkin(host, h)
+                return result
+        except xmlrpclib.Fault:
+            raise
+        except Exception:
+            # unexpected errors leave the connection in an unknown state
+            h.close()
+            raise
+
+        # discard any response data and raise exception
+        if response.getheader('content-length', 0):
+            response.read()
+        self._checkin(host, h)
+        raise xmlrpclib.ProtocolError(
+            host + handler,
+            response.status, response.reason,
+            response.msg,
+        )
+
+    def http_request(self, host, method, handler, body=None, headers=()):
+        """Make an HTTP request over a pooled connection.
+
+        Used by the protocols that are not XML-RPC (see
+        ``bzlib.protocol``).  Return the response status, reason and
+        body.
+        """
+        headers = dict(headers, **{
+            'User-Agent': self.user_agent,
+            'Accept-Encoding': ACCEPT_ENCODING,
+        })
+        if body is not None:
+            body, encoding = self._encode(body)
+            if encoding:
+                headers['Content-Encoding'] = encoding
+        # as xmlrpclib does, retry once if the server closed a reused
+        # connection (e.g. after its keep-alive timeout)
+        for retry in (False, True):
+            h = self._checkout(host, fresh=retry)
+            reused = h.sock is not None
+            headers.update(self._extra_headers or [])
+            try:
+                h.request(method, handler, body, headers)
+                response = h.getresponse(buffering=True)
+                data = self._read(response)
+            except Exception as e:
+                # unexpected errors leave the connection in an unknown state
+                h.close()
+                if retry or not reused or not _dropped(e):
+                    raise
+                continue
+            self._checkin(host, h)
+            return response.status, response.reason, data
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            for idle in self._idle.viewvalues():
+                for connection, _ in idle:
+                    connection.close()
+            self._idle.clear()
+
+
+class SafeTransport(Transport):
+    """XML-RPC transport that reuses HTTPS connections."""
+
+    def __init__(self, use_datetime=0, context=None, **kwargs):
+        Transport.__init__(self, use_datetime=use_datetime, **kwargs)
+        self.context = context
+
+    def _new_connection(self, host):
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        return httplib.HTTPSConnection(
+            chost, None, context=self.context, **(x509 or {}))
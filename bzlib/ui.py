@@ -75,6 +75,13 @@ def filter_int(string, default=None, start=None, stop=None):
             raise InvalidInputError('not an int: {!r}'.format(string))
 
 
+def split_list(string):
+    """Split a string of values delimited as for ``filter_list``."""
+    strs = re.split(r'[\s:;,]+', string)
+    strs = strs[1:] if strs and not strs[0] else strs
+    return strs[:-1] if strs and not strs[-1] else strs
+
+
 def filter_list(
     string,
     default=None,
@@ -109,10 +116,7 @@ def filter_list(
         raise TypeError("argument 'filter' not given")
     if not string and default is not None:
         return default
-    strs = re.split(r'[\s:;,]+', string)
-    strs = strs[1:] if strs and not strs[0] else strs
-    strs = strs[:-1] if strs and not strs[-1] else strs
-    values = [filter(s) for s in strs]
+    values = [filter(s) for s in split_list(string)]
     valueset = set(values)
     if len(valueset) != len(values):
         if not allow_duplicates:
@@ -166,6 +170,21 @@ def filter_user(string, bugzilla=None, default=None):
         raise InvalidInputError(e.message)
 
 
+def filter_user_list(string, bugzilla=None, default=None):
+    """Match a list of users and return the user names.
+
+    Users not yet matched are matched in a single batch.  See
+    ``filter_list`` and ``filter_user``.
+    """
+    if string:
+        bugzilla.match_many_users(split_list(string))
+    return filter_list(
+        string,
+        default=default,
+        filter=curry(filter_user, bugzilla=bugzilla)
+    )
+
+
 class UI(object):
     def show(self, msg):
         print msg
@@ -210,11 +229,7 @@ class UI(object):
         prompt = prompt if prompt is not None else 'Enter a user name'
         prompt += " [{}]: ".format(default) if default is not None else ': '
         return self.input(
-            curry(
-                filter_list,
-                default=default,
-                filter=curry(filter_user, bugzilla=bugzilla)
-            ),
+            curry(filter_user_list, bugzilla=bugzilla, default=default),
             prompt
         )
 
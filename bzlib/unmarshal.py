@@ -0,0 +1,146 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fast decoding of XML-RPC responses.
+
+``xmlrpclib`` decodes a response with a Python callback for every
+element, and converts dates with ``strptime``.  ``Unmarshaller`` parses
+the response into a tree with the C ``cElementTree`` parser instead,
+then converts the tree to values with a function per type, and converts
+dates by slicing.  The values are the same as those ``xmlrpclib``
+returns.
+"""
+
+import datetime
+import xml.etree.cElementTree as ElementTree
+import xmlrpclib
+
+
+# the decoder used unless another is configured (see ``getparser``)
+DEFAULT_DECODER = 'fast'
+
+
+def _datetime(text):
+    # xmlrpclib's format is YYYYMMDDTHH:MM:SS
+    if len(text) == 17 and text[8] == 'T':
+        try:
+            return datetime.datetime(
+                int(text[:4]), int(text[4:6]), int(text[6:8]),
+                int(text[9:11]), int(text[12:14]), int(text[15:17])
+            )
+        except ValueError:
+            pass
+    return xmlrpclib._datetime_type(text)
+
+
+def _boolean(elem):
+    if elem.text not in ('0', '1'):
+        raise TypeError('bad boolean value')
+    return elem.text == '1'
+
+
+class _Parser(object):
+    """Parser of the ``xmlrpclib.getparser()`` protocol.
+
+    The response is parsed into a tree, handed to the unmarshaller.
+    """
+
+    __slots__ = ['_parser', '_unmarshaller']
+
+    def __init__(self, unmarshaller):
+        self._parser = ElementTree.XMLParser()
+        self._unmarshaller = unmarshaller
+
+    def feed(self, data):
+        self._parser.feed(data)
+
+    def close(self):
+        self._unmarshaller.root = self._parser.close()
+
+
+class Unmarshaller(object):
+    """Unmarshaller of XML-RPC responses parsed by ``_Parser``.
+
+    ``close()`` returns the params of the response, or raises the
+    ``xmlrpclib.Fault`` it holds.
+
+    use_datetime: if true, dates are ``datetime.datetime`` objects,
+                  otherwise ``xmlrpclib.DateTime`` objects
+    """
+
+    __slots__ = ['root', '_types']
+
+    def __init__(self, use_datetime=False):
+        self.root = None
+        self._types = {
+            'string': lambda x: x.text or '',
+            'int': lambda x: int(x.text),
+            'i4': lambda x: int(x.text),
+            'i8': lambda x: int(x.text),
+            'boolean': _boolean,
+            'double': lambda x: float(x.text),
+            'nil': lambda x: None,
+            'array': self._array,
+            'struct': self._struct,
+            'base64': lambda x: xmlrpclib.Binary(
+                xmlrpclib.base64.decodestring(x.text or '')),
+            'dateTime.iso8601': (lambda x: _datetime(x.text))
+            if use_datetime else (lambda x: xmlrpclib.DateTime(x.text)),
+        }
+
+    def _value(self, elem):
+        """Return the value of a ``<value>`` element."""
+        if not len(elem):
+            return elem.text or ''  # a string without a type
+        typed = elem[0]
+        try:
+            decode = self._types[typed.tag]
+        except KeyError:
+            raise TypeError('unknown tag: {!r}'.format(typed.tag))
+        return decode(typed)
+
+    def _array(self, elem):
+        data = elem.find('data')
+        return [self._value(x) for x in data] if data is not None else []
+
+    def _struct(self, elem):
+        return {
+            member.findtext('name'): self._value(member.find('value'))
+            for member in elem
+        }
+
+    def close(self):
+        fault = self.root.find('fault')
+        if fault is not None:
+            raise xmlrpclib.Fault(**self._value(fault.find('value')))
+        return tuple(
+            self._value(x.find('value')) for x in self.root.iter('param'))
+
+    def getmethodname(self):
+        return None
+
+
+def getparser(decoder=DEFAULT_DECODER, use_datetime=False):
+    """Return a (parser, unmarshaller) pair, as ``xmlrpclib.getparser``.
+
+    decoder: ``fast`` for ``Unmarshaller``, or ``xmlrpclib``
+    """
+    if decoder == 'xmlrpclib':
+        return xmlrpclib.getparser(use_datetime=use_datetime)
+    if decoder != 'fast':
+        raise ValueError('Unknown decoder: {}.'.format(decoder))
+    unmarshaller = Unmarshaller(use_datetime)
+    return _Parser(unmarshaller), unmarshaller
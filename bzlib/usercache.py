@@ -0,0 +1,150 @@
+# This file is part of bugzillatools
+# Copyright (C) 2013 Fraser Tweedale
+#
+# bugzillatools is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bounded cache of user matches.
+
+The cache keeps the users that ``User.get`` matched for recently used
+strings.  Beyond a maximum number of strings the least recently used are
+evicted, and matches older than a time to live are ignored.  A prefix
+index over the users seen answers strings not matched before, when they
+are the prefix of exactly one known user.
+"""
+
+import bisect
+import collections
+import re
+import threading
+import time
+
+
+# maximum number of matches cached
+DEFAULT_USER_CACHE_SIZE = 500
+
+# seconds before cached matches expire
+DEFAULT_USER_CACHE_TTL = 24 * 60 * 60
+
+
+def _keys(user):
+    """Return the lower-cased strings under which a user is indexed."""
+    keys = set()
+    for field in 'name', 'email', 'real_name':
+        value = (user.get(field) or '').lower()
+        if value:
+            keys.add(value)
+            keys.update(re.split(r'[\s@.]+', value))
+    keys.discard('')
+    return keys
+
+
+class UserCache(object):
+    """Users matched for strings, least recently used first.
+
+    A cache may be used by several threads at once.
+    """
+
+    __slots__ = ['size', 'ttl', '_matches', '_index', '_lock']
+
+    def __init__(
+        self,
+        size=DEFAULT_USER_CACHE_SIZE,
+        ttl=DEFAULT_USER_CACHE_TTL,
+        entries=()
+    ):
+        """Create a cache.
+
+        entries: (string, time, users) triples, as returned by
+                 ``entries()``
+        """
+        self.size = size
+        self.ttl = ttl
+        self._matches = collections.OrderedDict()  # str -> (time, users)
+        for string, when, users in entries:
+            self._matches[string] = (when, users)
+        self._index = None
+        self._lock = threading.Lock()
+        self._evict()
+
+    def entries(self):
+        """Return the cached matches, least recently used first.
+
+        Return a list of (string, time, users) triples.
+        """
+        with self._lock:
+            return [
+                (string, when, users)
+                for string, (when, users) in self._matches.viewitems()
+            ]
+
+    def get(self, string):
+        """Return the users matching a string, or None if not cached."""
+        with self._lock:
+            entry = self._matches.pop(string, None)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                self._index = None
+                return None
+            self._matches[string] = entry  # now most recently used
+            return entry[1]
+
+    def put(self, string, users):
+        """Cache the users matching a string."""
+        with self._lock:
+            self._matches.pop(string, None)
+            self._matches[string] = (time.time(), users)
+            self._index = None
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        for string, (when, _) in self._matches.items():
+            if now - when >= self.ttl:
+                del self._matches[string]
+        while len(self._matches) > self.size:
+            self._matches.popitem(last=False)
+
+    def match_prefix(self, prefix):
+        """Return the known users with a name that starts with a prefix.
+
+        User names, email addresses and real names, and their words,
+        are matched regardless of case.  Return a list of users sorted
+        by name.
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+            keys, users = self._index
+        prefix = prefix.lower()
+        names = set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            names.add(keys[i][1])
+            i += 1
+        return [users[x] for x in sorted(names)]
+
+    def _build_index(self):
+        """Return the sorted (key, name) pairs and the users by name."""
+        users = {
+            user['name']: user
+            for _, matched in self._matches.viewvalues()
+            for user in matched
+        }
+        keys = sorted(
+            (key, name)
+            for name, user in users.viewitems()
+            for key in _keys(user)
+        )
+        return keys, users